@@ -0,0 +1,290 @@
+"""
+Background batch analysis of many symbols (e.g. a whole watchlist).
+
+A job analyzes each distinct symbol with the advisor at BATCH priority on the
+agent scheduler, at most ``parallelism`` at a time, and records each result as
+it completes. Jobs are persisted as JSON under ``JOBS_DIR`` after every result
+so clients can poll, stream or resume them, and unfinished jobs continue
+after a restart. ``stop()`` interrupts running jobs without recording the
+interrupted analyses, leaving the jobs to resume on the next start.
+
+Jobs run on one shared pool, ``BATCH_MAX_JOBS`` at a time; further jobs wait
+their turn. Each user may have ``BATCH_USER_JOBS`` unfinished jobs, and more
+are refused with ``Overloaded``. Finished jobs are deleted after
+``BATCH_RETENTION_SECONDS``.
+
+Analyses are single-flighted and cached by prompt for
+``BATCH_RESULT_TTL_SECONDS``, so symbols shared by several users' overnight
+watchlists are analyzed once; the MCP server's market-data caches dedupe the
+underlying fetches between analyses.
+
+Configuration (environment):
+    JOBS_DIR: Where jobs are persisted (default data/jobs).
+    BATCH_PARALLELISM: Symbols analyzed concurrently per job (default 4).
+    BATCH_RESULT_TTL_SECONDS: How long an analysis is reused (default 3600).
+    BATCH_ANALYSIS_TIMEOUT_SECONDS: Deadline per symbol (default 600).
+    BATCH_MAX_JOBS: Jobs running at once across all users (default 4).
+    BATCH_USER_JOBS: Unfinished jobs allowed per user (default 2).
+    BATCH_RETENTION_SECONDS: How long finished jobs are kept (default 604800, a week).
+"""
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+
+from agent.scheduler import JobCancelled, Overloaded, Priority, get_scheduler
+from core import tracing
+from core.cache import TTLCache
+
+JOBS_DIR = os.environ.get("JOBS_DIR", os.path.join("data", "jobs"))
+BATCH_PARALLELISM = int(os.environ.get("BATCH_PARALLELISM", "4"))
+RESULT_TTL = float(os.environ.get("BATCH_RESULT_TTL_SECONDS", "3600"))
+ANALYSIS_TIMEOUT = float(os.environ.get("BATCH_ANALYSIS_TIMEOUT_SECONDS", "600"))
+BATCH_MAX_JOBS = int(os.environ.get("BATCH_MAX_JOBS", "4"))
+BATCH_USER_JOBS = int(os.environ.get("BATCH_USER_JOBS", "2"))
+RETENTION = float(os.environ.get("BATCH_RETENTION_SECONDS", str(7 * 86400)))
+# Retry-After for a job refused because its owner has too many unfinished
+USER_JOBS_RETRY_AFTER = 60.0
+# Longest pause before resubmitting work the scheduler shed
+MAX_BACKOFF = 30.0
+
+DEFAULT_PROMPT = "Analyze {symbol}"
+FINISHED = ("completed", "failed")
+
+analysis_cache = TTLCache("analysis", max_entries=1024)
+
+
+def _failed(response: str) -> bool:
+    return response.startswith(("Advisor failed:", "Error"))
+
+
+class _Interrupted(Exception):
+    """An analysis abandoned because the jobs are stopping; not recorded as a result."""
+
+
+class BatchJobs:
+    """Creates, runs and persists batch analysis jobs."""
+
+    def __init__(self, agent_factory, directory: str = JOBS_DIR, parallelism: int = BATCH_PARALLELISM,
+                 max_jobs: int = BATCH_MAX_JOBS, user_jobs: int = BATCH_USER_JOBS, retention: float = RETENTION):
+        self.agent_factory = agent_factory
+        self.directory = directory
+        self.parallelism = parallelism
+        self.user_jobs = user_jobs
+        self.retention = retention
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._pool = ThreadPoolExecutor(max_workers=max_jobs, thread_name_prefix="batch")
+        self._running = set()  # pool futures of started jobs
+        self._scheduled = set()  # scheduler jobs in flight, cancelled by stop()
+        self._load()
+
+    def create(self, owner: str, symbols, prompt: str = None) -> dict:
+        """Queues a job over the distinct ``symbols`` and starts it; returns its state.
+
+        Raises Overloaded when ``owner`` already has ``user_jobs`` unfinished jobs.
+        """
+        symbols = list(dict.fromkeys(s.strip().upper() for s in symbols if s.strip()))
+        if not symbols:
+            raise ValueError("No symbols to analyze")
+        prompt = prompt or DEFAULT_PROMPT
+        if "{symbol}" not in prompt:
+            raise ValueError("prompt must contain {symbol}")
+        now = time.time()
+        job = {
+            "id": uuid.uuid4().hex,
+            "owner": owner,
+            "status": "queued",
+            "created": now,
+            "updated": now,
+            "prompt": prompt,
+            "symbols": symbols,
+            "results": [],
+        }
+        with self._lock:
+            self._expire()
+            unfinished = sum(1 for j in self._jobs.values() if j["owner"] == owner and j["status"] not in FINISHED)
+            if unfinished >= self.user_jobs:
+                raise Overloaded(f"At most {self.user_jobs} unfinished batch jobs per user", USER_JOBS_RETRY_AFTER)
+            self._jobs[job["id"]] = job
+            self._save(job)
+        self._start(job["id"])
+        return self.get(job["id"])
+
+    def get(self, job_id: str):
+        """A snapshot of the job's state, or None."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return None if job is None else {**job, "results": list(job["results"])}
+
+    def list(self, owner: str) -> list:
+        with self._lock:
+            self._expire()
+            jobs = [j for j in self._jobs.values() if j["owner"] == owner]
+        return sorted(
+            ({k: v for k, v in j.items() if k != "results"} | {"completed": len(j["results"])} for j in jobs),
+            key=lambda j: j["created"], reverse=True,
+        )
+
+    def resume_pending(self):
+        """Restarts jobs that were queued or running when the process stopped."""
+        with self._lock:
+            pending = [j["id"] for j in self._jobs.values() if j["status"] not in FINISHED]
+        for job_id in pending:
+            self._start(job_id)
+
+    def stop(self, timeout: float = 30):
+        """Stops dispatching and interrupts running analyses, leaving unfinished jobs to resume."""
+        self._stopping.set()
+        with self._lock:
+            scheduled, running = list(self._scheduled), list(self._running)
+        for job in scheduled:
+            job.cancel()
+        # Jobs still waiting for the pool are dropped; they resume after the restart
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        wait(running, timeout)
+
+    def _start(self, job_id: str):
+        with self._lock:
+            if self._stopping.is_set():
+                return
+            future = self._pool.submit(self._run, job_id)
+            self._running.add(future)
+        future.add_done_callback(self._finished)
+
+    def _finished(self, future):
+        with self._lock:
+            self._running.discard(future)
+        if not future.cancelled() and future.exception() is not None:
+            print(f"Error running batch job: {future.exception()}", file=sys.stderr)
+
+    def _expire(self):
+        """Deletes finished jobs last updated more than ``retention`` seconds ago (lock held)."""
+        cutoff = time.time() - self.retention
+        expired = [i for i, j in self._jobs.items() if j["status"] in FINISHED and j["updated"] < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+            try:
+                os.remove(self._path(job_id))
+            except OSError as e:
+                print(f"Error deleting job {job_id}: {e}", file=sys.stderr)
+
+    def _run(self, job_id: str):
+        with self._lock:
+            job = self._jobs[job_id]
+            done = {r["symbol"] for r in job["results"]}
+            remaining = [s for s in job["symbols"] if s not in done]
+            job["status"] = "running"
+            self._save(job)
+
+        with tracing.span("batch.job", job=job_id, symbols=len(remaining)) as span:
+            # Threads here only wait on scheduler futures; the scheduler bounds real work
+            with ThreadPoolExecutor(max_workers=self.parallelism) as pool:
+                futures = {pool.submit(self._analyze, job, symbol): symbol for symbol in remaining}
+                for future in as_completed(futures):
+                    try:
+                        self._record(job, futures[future], *future.result())
+                    except _Interrupted:
+                        continue
+
+            if self._stopping.is_set():
+                # Still "running" on disk, so resume_pending() picks it up after the restart
+                span.set_attribute("batch.interrupted", True)
+                return
+            with self._lock:
+                failed = sum(1 for r in job["results"] if r["status"] == "failed")
+                job["status"] = "failed" if failed == len(job["results"]) else "completed"
+                job["updated"] = time.time()
+                self._save(job)
+            span.set_attribute("batch.failed", failed)
+
+    def _analyze(self, job: dict, symbol: str):
+        """Returns ``(status, response_or_error, cached)`` for one symbol."""
+        if self._stopping.is_set():
+            raise _Interrupted()
+        prompt = job["prompt"].replace("{symbol}", symbol)
+        cached = analysis_cache.get(prompt) is not None
+        try:
+            response = analysis_cache.get_or_load(
+                prompt,
+                lambda: self._run_agent(job["owner"], prompt),
+                lambda r: 0 if _failed(r) else RESULT_TTL,
+                stale_on_error=False,
+            )
+        except _Interrupted:
+            raise
+        except Exception as e:
+            if self._stopping.is_set():
+                # Most likely caused by the shutdown itself; retry after the restart
+                raise _Interrupted()
+            return "failed", str(e), False
+        return ("failed" if _failed(response) else "completed"), response, cached
+
+    def _run_agent(self, owner: str, prompt: str) -> str:
+        if self._stopping.is_set():
+            raise _Interrupted()
+        agent = self.agent_factory()
+        while True:
+            try:
+                # Keyed apart from the owner's chats so a batch never blocks them
+                scheduled = get_scheduler().submit(
+                    agent.run, prompt, user=f"{owner}/batch", priority=Priority.BATCH, timeout=ANALYSIS_TIMEOUT
+                )
+            except Overloaded as e:
+                if self._stopping.wait(min(e.retry_after, MAX_BACKOFF)):
+                    raise _Interrupted()
+                continue
+            with self._lock:
+                self._scheduled.add(scheduled)
+            if self._stopping.is_set():
+                # stop() may have taken its snapshot before this job was added
+                scheduled.cancel()
+            try:
+                return scheduled.future.result()
+            except JobCancelled:
+                if self._stopping.is_set():
+                    raise _Interrupted()
+                raise
+            finally:
+                with self._lock:
+                    self._scheduled.discard(scheduled)
+
+    def _record(self, job: dict, symbol: str, status: str, text: str, cached: bool):
+        result = {"symbol": symbol, "status": status, "finished": time.time(), "cached": cached}
+        result["response" if status == "completed" else "error"] = text
+        with self._lock:
+            job["results"].append(result)
+            job["updated"] = result["finished"]
+            self._save(job)
+
+    def _path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def _save(self, job: dict):
+        """Writes ``job`` atomically (lock held)."""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp = self._path(job["id"]) + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(job, f, indent=2)
+            os.replace(tmp, self._path(job["id"]))
+        except Exception as e:
+            print(f"Error saving job {job['id']}: {e}", file=sys.stderr)
+
+    def _load(self):
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    job = json.load(f)
+                self._jobs[job["id"]] = job
+            except Exception as e:
+                print(f"Error loading job {name}: {e}", file=sys.stderr)
+        self._expire()
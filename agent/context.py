@@ -0,0 +1,104 @@
+"""
+Keeps the conversation sent to the LLM under a token budget.
+
+Sessions keep every event, including full tool results. ``ContextBudget``
+rewrites only the request about to be sent: tool results from earlier turns
+are cut down to their first lines, oldest first, and if that is not enough the
+oldest turns are dropped. The current turn is always sent in full.
+
+Configuration (environment):
+    CONTEXT_TOKEN_BUDGET: Estimated tokens allowed per LLM request (default 8000).
+    CONTEXT_KEEP_TURNS: Most recent turns never compacted (default 1).
+    CONTEXT_TOOL_RESULT_CHARS: Characters kept of a compacted tool result (default 600).
+"""
+import json
+import os
+
+# Rough average for English text and tables; only used for budgeting
+CHARS_PER_TOKEN = 4
+
+
+def _part_chars(part) -> int:
+    if getattr(part, "text", None):
+        return len(part.text)
+    call = getattr(part, "function_call", None)
+    if call is not None:
+        return len(call.name or "") + len(json.dumps(call.args or {}, default=str))
+    response = getattr(part, "function_response", None)
+    if response is not None:
+        return len(response.name or "") + len(json.dumps(response.response or {}, default=str))
+    return 0
+
+
+def estimate_tokens(contents) -> int:
+    """Estimated token count of a list of ``Content``."""
+    chars = sum(_part_chars(p) for c in contents or [] for p in (c.parts or []))
+    return chars // CHARS_PER_TOKEN
+
+
+def _is_user_message(content) -> bool:
+    return content.role == "user" and any(getattr(p, "text", None) for p in (content.parts or []))
+
+
+def _shorten(text: str, limit: int, name: str) -> str:
+    cut = text[:limit]
+    if "\n" in cut:
+        cut = cut[: cut.rfind("\n")]
+    return f"{cut}\n[... {len(text) - len(cut)} more characters of this earlier {name} result omitted]"
+
+
+class ContextBudget:
+    """A ``before_model_callback`` step that compacts ``llm_request.contents`` in place."""
+
+    def __init__(self, max_tokens: int = None, keep_turns: int = None, result_chars: int = None):
+        self.max_tokens = max_tokens or int(os.environ.get("CONTEXT_TOKEN_BUDGET", "8000"))
+        self.keep_turns = max(1, keep_turns or int(os.environ.get("CONTEXT_KEEP_TURNS", "1")))
+        self.result_chars = result_chars or int(os.environ.get("CONTEXT_TOOL_RESULT_CHARS", "600"))
+
+    def compact(self, llm_request):
+        """Compacts the request; returns the estimated tokens ``(before, after)``."""
+        contents = llm_request.contents or []
+        before = estimate_tokens(contents)
+        if before <= self.max_tokens:
+            return before, before
+
+        turn_starts = [i for i, c in enumerate(contents) if _is_user_message(c)]
+        if len(turn_starts) <= self.keep_turns:
+            return before, before
+        protected_from = turn_starts[-self.keep_turns]
+
+        # 1. Shorten tool results of earlier turns, oldest first
+        tokens = before
+        for i in range(protected_from):
+            if tokens <= self.max_tokens:
+                break
+            content = contents[i]
+            if not any(getattr(p, "function_response", None) for p in (content.parts or [])):
+                continue
+            # Copy before editing so the stored session event keeps the full result
+            content = contents[i] = content.model_copy(deep=True)
+            for part in content.parts:
+                response = getattr(part, "function_response", None)
+                if response is None:
+                    continue
+                text = response.response.get("result") if isinstance(response.response, dict) else None
+                if not isinstance(text, str):
+                    text = json.dumps(response.response, default=str)
+                if len(text) <= self.result_chars:
+                    continue
+                old = _part_chars(part)
+                response.response = {"result": _shorten(text, self.result_chars, response.name or "tool")}
+                tokens -= (old - _part_chars(part)) // CHARS_PER_TOKEN
+
+        # 2. Still over: drop whole turns, oldest first, keeping the protected ones
+        dropped = 0
+        starts = [s for s in turn_starts if s < protected_from] + [protected_from]
+        while tokens > self.max_tokens and dropped < len(starts) - 1:
+            end = starts[dropped + 1]
+            tokens -= estimate_tokens(contents[starts[dropped]:end])
+            dropped += 1
+        if dropped:
+            del contents[: starts[dropped]]
+
+        llm_request.contents = contents
+        return before, estimate_tokens(contents)
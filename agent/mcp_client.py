@@ -1,104 +1,191 @@
+"""
+Client side of the stock_data MCP server.
+
+The transport is chosen with ``MCP_TRANSPORT``:
+    stdio:     launch ``server_script_path`` as a subprocess per adapter (default).
+    inprocess: import the server module and call its tool functions directly,
+               sync tools on a thread pool; no subprocess or JSON-RPC.
+    http:      connect to a long-lived server shared by several API processes,
+               started with ``mcp_server.py --transport http`` (or ``sse``), at
+               ``MCP_SERVER_URL`` (default http://127.0.0.1:8765/mcp; a URL
+               ending in /sse uses the SSE transport).
+"""
 import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import AsyncExitStack
-from mcp import ClientSession, StdioServerParameters
+from mcp import ClientSession, StdioServerParameters, types
 from mcp.client.stdio import stdio_client
+import inspect
 import sys
 import os
 
+from agent.tool_registry import ToolRegistry
+from core import tracing
+
+TRANSPORTS = ("stdio", "inprocess", "http")
+MCP_TRANSPORT = os.environ.get("MCP_TRANSPORT", "stdio")
+MCP_SERVER_URL = os.environ.get("MCP_SERVER_URL", "http://127.0.0.1:8765/mcp")
+INPROCESS_WORKERS = int(os.environ.get("MCP_INPROCESS_WORKERS", "8"))
+
 class MCPToolAdapter:
-    def __init__(self, server_script_path: str):
+    def __init__(self, server_script_path: str, transport: str = None, url: str = None):
         self.server_script_path = server_script_path
+        self.transport = transport or MCP_TRANSPORT
+        if self.transport not in TRANSPORTS:
+            raise ValueError(f"Unknown MCP transport {self.transport!r}; expected one of {', '.join(TRANSPORTS)}")
+        self.url = url or MCP_SERVER_URL
         self.session = None
         self.exit_stack = AsyncExitStack()
-        self._tools = {}
+        self._loop = None
+        self._server = None  # FastMCP server object, in-process only
+        self._local_tools = None  # name -> tool function, in-process only
+        self._pool = None
+        self._refresh_task = None
+        self._lifetime = None  # task holding the connection open
+        self._closing = None
+        self.registry = ToolRegistry(self.call_tool, lambda: self._loop)
 
     async def start(self):
-        """Starts the MCP server and client session."""
-        print(f"DEBUG: MCPToolAdapter.start() called on loop {asyncio.get_running_loop()}")
+        """Connects to the MCP server (starting it for stdio) and discovers its tools."""
         self._loop = asyncio.get_running_loop() # Capture the loop we are started on
-        
-        server_params = StdioServerParameters(
-            command=sys.executable,
-            args=[self.server_script_path],
-            env=os.environ.copy()
+        self._closing = asyncio.Event()
+        ready = self._loop.create_future()
+        # The transports' anyio task groups must be entered and exited by the same task,
+        # so one task holds the connection open until close()
+        self._lifetime = self._loop.create_task(self._hold(ready))
+        await ready
+
+    async def _hold(self, ready):
+        try:
+            async with self.exit_stack:
+                await self._connect()
+                ready.set_result(None)
+                await self._closing.wait()
+        except asyncio.CancelledError:
+            ready.cancel()
+            raise
+        except Exception as e:
+            if not ready.done():
+                ready.set_exception(e)
+            else:
+                print(f"MCP connection closed with an error: {e}", file=sys.stderr)
+
+    async def _connect(self):
+        if self.transport == "inprocess":
+            await self._start_inprocess()
+            return
+
+        if self.transport == "http":
+            transport = await self.exit_stack.enter_async_context(self._http_client())
+        else:
+            server_params = StdioServerParameters(
+                command=sys.executable,
+                args=[self.server_script_path],
+                env=os.environ.copy()
+            )
+            transport = await self.exit_stack.enter_async_context(stdio_client(server_params))
+        # Rediscover when the server reports its tool list changed (newer mcp clients only)
+        session_kwargs = {}
+        if "message_handler" in inspect.signature(ClientSession).parameters:
+            session_kwargs["message_handler"] = self._on_message
+        self.session = await self.exit_stack.enter_async_context(
+            ClientSession(transport[0], transport[1], **session_kwargs)
         )
-        
-        transport = await self.exit_stack.enter_async_context(stdio_client(server_params))
-        self.session = await self.exit_stack.enter_async_context(ClientSession(transport[0], transport[1]))
         await self.session.initialize()
         
-        # Discover tools
+        # Older mcp clients cannot attach request metadata, so trace context
+        # is only forwarded when call_tool accepts `meta`.
+        self._supports_meta = "meta" in inspect.signature(self.session.call_tool).parameters
+
+        await self.refresh()
+
+    def _http_client(self):
+        if self.url.rstrip("/").endswith("/sse"):
+            from mcp.client.sse import sse_client
+            return sse_client(self.url)
+        from mcp.client.streamable_http import streamablehttp_client
+        return streamablehttp_client(self.url)
+
+    async def _start_inprocess(self):
+        # The package module, not server_script_path: launcher scripts only differ in how they start it
+        from servers.stock_data import mcp_server
+
+        self._server = mcp_server.mcp
+        self._pool = ThreadPoolExecutor(max_workers=INPROCESS_WORKERS, thread_name_prefix="mcp-tool")
+        self.exit_stack.callback(self._pool.shutdown, wait=False, cancel_futures=True)
+        await self._discover_local()
+
+    async def _discover_local(self):
+        tools = await self._server.get_tools()
+        self._local_tools = {name: tool.fn for name, tool in tools.items()}
+        self.registry.discover(
+            types.Tool(name=tool.name, description=tool.description, inputSchema=tool.parameters)
+            for tool in tools.values()
+        )
+
+    async def refresh(self):
+        """Re-lists the server's tools and rebuilds the wrapper registry."""
+        if self.transport == "inprocess":
+            await self._discover_local()
+            return
         result = await self.session.list_tools()
-        for tool in result.tools:
-            self._tools[tool.name] = tool
-        print("DEBUG: MCPToolAdapter.start() finished")
+        self.registry.discover(result.tools)
+
+    async def _on_message(self, message):
+        root = getattr(message, "root", None)
+        if isinstance(root, types.ToolListChangedNotification):
+            # Handlers run on the session's receive loop; a request awaited here would deadlock
+            self._refresh_task = asyncio.get_running_loop().create_task(self.refresh())
 
-    async def call_tool(self, name: str, arguments: dict):
+    async def call_tool(self, name: str, arguments: dict, traceparent: str = None):
+        if self._local_tools is not None:
+            return await self._call_local(name, arguments, traceparent)
         if not self.session:
             raise RuntimeError("MCP Client not started")
-        result = await self.session.call_tool(name, arguments)
+        if traceparent and getattr(self, "_supports_meta", False):
+            result = await self.session.call_tool(name, arguments, meta={"traceparent": traceparent})
+        else:
+            result = await self.session.call_tool(name, arguments)
         return result.content[0].text
 
+    async def _call_local(self, name: str, arguments: dict, traceparent: str = None) -> str:
+        fn = self._local_tools.get(name)
+        if fn is None:
+            raise ValueError(f"Unknown tool: {name}")
+        # The tool's span continues the caller's trace, as it would across the wire
+        with tracing.continue_trace(traceparent):
+            if inspect.iscoroutinefunction(fn):
+                result = await fn(**arguments)
+            else:
+                call = functools.partial(fn, **arguments)
+                result = await asyncio.get_running_loop().run_in_executor(
+                    self._pool, contextvars.copy_context().run, call
+                )
+        return result if isinstance(result, str) else str(result)
+
     async def close(self):
-        print(f"DEBUG: MCPToolAdapter.close() called. Stack: {len(str(self.exit_stack))}")
-        import traceback
-        traceback.print_stack()
-        await self.exit_stack.aclose()
+        """Disconnects (stopping a stdio server subprocess) and releases the tool pool; idempotent.
 
-    def get_tool_function(self, tool_name: str):
-        """Returns a synchronous callable wrapper for the tool with proper signature."""
-        
-        # Get tool schema from MCP server
-        tool_schema = None
-        if hasattr(self, '_tools') and tool_name in self._tools:
-            tool_schema = self._tools[tool_name]
-        
-        # Build parameter list from schema
-        params = []
-        param_types = {}
-        if tool_schema and hasattr(tool_schema, 'inputSchema') and tool_schema.inputSchema:
-            schema = tool_schema.inputSchema
-            if isinstance(schema, dict) and 'properties' in schema:
-                for param_name, param_info in schema['properties'].items():
-                    # Map JSON schema types to Python types
-                    param_type = param_info.get('type', 'string')
-                    if param_type == 'string':
-                        param_types[param_name] = 'str'
-                    elif param_type == 'integer':
-                        param_types[param_name] = 'int'
-                    elif param_type == 'number':
-                        param_types[param_name] = 'float'
-                    elif param_type == 'boolean':
-                        param_types[param_name] = 'bool'
-                    else:
-                        param_types[param_name] = 'str'
-                    
-                    params.append(f"{param_name}: {param_types[param_name]}")
-        
-        # Create function signature
-        params_str = ", ".join(params) if params else ""
-        
-        # Build the function dynamically
-        func_code = f"""
-def {tool_name}({params_str}):
-    \"\"\"{ tool_schema.description if tool_schema else f'Call {tool_name} tool'}\"\"\"
-    if not hasattr(adapter, '_loop') or not adapter._loop:
-        raise RuntimeError("MCP Adapter not started")
-    
-    # Build kwargs from parameters
-    kwargs = {{{", ".join([f"'{p.split(':')[0].strip()}': {p.split(':')[0].strip()}" for p in params])}}}
-    
-    # Execute on the specific loop where MCP is running
-    import asyncio
-    future = asyncio.run_coroutine_threadsafe(
-        adapter.call_tool('{tool_name}', kwargs), 
-        adapter._loop
-    )
-    return future.result()
-"""
-        
-        # Execute the function definition
-        namespace = {'adapter': self}
-        exec(func_code, namespace)
-        
-        return namespace[tool_name]
+        Must run on the loop the adapter was started on.
+        """
+        if self._lifetime is None:
+            return
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            self._refresh_task = None
+        self._closing.set()
+        try:
+            await self._lifetime
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._lifetime = None
+            self.session = None
+            self._local_tools = None
+            self._pool = None
+
+    def get_tool_function(self, tool_name: str, is_async: bool = False):
+        """Returns the registry's sync (or async) wrapper for the tool."""
+        return self.registry.get(tool_name, is_async=is_async)
@@ -2,8 +2,14 @@ import os
 from google.adk.models.base_llm import BaseLlm
 from google.adk.models import Gemini
 
-def get_model() -> BaseLlm:
-    # Default to Gemini 2.0 Flash
-    model_name = os.environ.get("LLM_MODEL", "gemini-2.0-flash")
-    print(f"Using Google model: {model_name}")
-    return Gemini(model=model_name)
+def model_name(tier: str = "full") -> str:
+    """The model serving ``tier``: LLM_FAST_MODEL for "fast", LLM_MODEL otherwise."""
+    if tier == "fast":
+        return os.environ.get("LLM_FAST_MODEL", "gemini-2.0-flash-lite")
+    return os.environ.get("LLM_MODEL", "gemini-2.0-flash")
+
+def get_model(tier: str = "full") -> BaseLlm:
+    # Default to Gemini 2.0 Flash (Flash-Lite for the fast tier)
+    name = model_name(tier)
+    print(f"Using Google model: {name}")
+    return Gemini(model=name)
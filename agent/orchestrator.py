@@ -1,16 +1,66 @@
-from google.adk.runners import InMemoryRunner
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
 from google.genai.types import Content, Part
 import os
+import threading
+import time
+from contextlib import aclosing, nullcontext
 from google.adk import Agent
 
+from agent import router
+from agent.context import ContextBudget
 from agent.models.factory import get_model
+from agent.scheduler import JobCancelled, check_cancelled
+from core import metrics, tracing
+
+APP_NAME = "agents"
+# Idle in-memory conversations are discarded after this long
+SESSION_IDLE_SECONDS = float(os.environ.get("SESSION_IDLE_SECONDS", "3600"))
+
+LLM_TOKENS = metrics.counter("llm_tokens_total", "Tokens reported by the LLM", ["kind", "tier"])
+ROUTES = metrics.counter("agent_routes_total", "Agent runs by routing tier", ["tier"])
+RUN_SECONDS = metrics.histogram(
+    "agent_run_seconds", "Agent run latency by routing tier", ["tier"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80, 160),
+)
+CONTEXT_TOKENS = metrics.histogram(
+    "agent_context_tokens", "Estimated tokens sent per LLM request after compaction",
+    buckets=(250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000, 128000),
+)
+COMPACTED_TOKENS = metrics.counter(
+    "agent_context_compacted_tokens_total", "Estimated tokens removed from LLM requests by compaction"
+)
+ACTIVE_SESSIONS = metrics.gauge("agent_sessions_active", "Chat sessions with recent activity")
+
+# MCP tools the advisor may call, by specialty
+ADVISOR_TOOLS = (
+    # Technical
+    "get_stock_history", "get_technical_summary",
+    # News
+    "get_stock_news",
+    # Fundamental
+    "get_stock_profile", "get_detailed_stock_info",
+    # Portfolio
+    "search_web", "get_etf_info", "get_portfolio_risk",
+)
+
+
+def _session_service():
+    """In-memory sessions, or a database (SESSION_DB_URL, e.g. sqlite+aiosqlite:///sessions.db)."""
+    url = os.environ.get("SESSION_DB_URL")
+    if not url:
+        return InMemorySessionService()
+    from google.adk.sessions import DatabaseSessionService
+    from sqlalchemy.pool import NullPool
+    # Every run drives its own event loop, so connections must not be pooled across runs
+    return DatabaseSessionService(db_url=url, poolclass=NullPool)
 
 
 # Initialize Model from Factory
 # model = get_model()  <-- MOVED INSIDE CLASS
 
 class AdvisorAgent:
-    def __init__(self, model_instance=None):
+    def __init__(self, model_instance=None, server_path=None):
         if "GOOGLE_API_KEY" not in os.environ:
              # Just a warning
             print("Warning: GOOGLE_API_KEY not found in environment variables.")
@@ -21,8 +71,17 @@ class AdvisorAgent:
         import threading
         
         # Path to the MCP server
-        server_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "servers", "stock_data", "mcp_server.py")
+        server_path = server_path or os.path.join(os.path.dirname(os.path.dirname(__file__)), "servers", "stock_data", "mcp_server.py")
+        self._model_instance = model_instance
         self.mcp_adapter = MCPToolAdapter(server_path)
+
+        # Conversations persist across runs; token use is tracked per session
+        self.session_service = _session_service()
+        self.context_budget = ContextBudget()
+        self._sessions = {}  # session_id -> usage stats
+        self._sessions_lock = threading.Lock()
+        self._toolset = (None, [])  # (registry version, async tool wrappers)
+        ACTIVE_SESSIONS.set_function(lambda: len(self._sessions))
         
         # Start MCP Client on a dedicated background thread/loop
         # This ensures the loop stays alive for the duration of the agent
@@ -42,46 +101,197 @@ class AdvisorAgent:
             print(f"Failed to start MCP Client: {e}")
             # Fallback or error out? For now, we proceed but tools might be empty/broken.
 
-    def run(self, user_input):
+    def run(self, user_input, user_id=None):
+        """Answers ``user_input``. With a ``user_id`` the reply continues that user's
+        conversation; without one every call is a fresh, throwaway session."""
+        session_id = f"chat-{user_id}" if user_id else None
+        route = router.classify(user_input)
+        started = time.perf_counter()
+        with tracing.span("agent.run", **{"session.persistent": bool(user_id)}) as run_span:
+            # One turn at a time per conversation
+            with self._session_stats(session_id)["lock"] if session_id else nullcontext():
+                response_text = None
+                if route.tier == router.DIRECT:
+                    response_text = self._answer_direct(route, user_input, user_id or "user", session_id)
+                    if response_text is None:
+                        route = route._replace(tier=router.FAST)
+                if response_text is None:
+                    response_text = self._run(user_input, user_id or "user", session_id, route.tier)
+            run_span.set_attribute("agent.tier", route.tier)
+            if response_text.startswith("Advisor failed:"):
+                run_span.set_error(response_text)
+            ROUTES.inc(tier=route.tier)
+            RUN_SECONDS.observe(time.perf_counter() - started, tier=route.tier)
+            return response_text
+
+    def _answer_direct(self, route, user_input, user_id, session_id):
+        """Answers a single data lookup from its tool without the LLM; None to fall back to the agent."""
         try:
-            # Create a fresh model instance for this run
+            result = self.mcp_adapter.get_tool_function(route.tool)(symbol=route.symbol)
+        except Exception:
+            return None
+        if result.startswith("Error"):
+            return None
+        reply = router.render(route, result)
+        if session_id:
+            # Keep the exchange in the conversation so follow-up questions have it
+            import asyncio
+            asyncio.run(self._append_exchange(user_id, session_id, user_input, reply))
+            stats = self._session_stats(session_id)
+            stats["turns"] += 1
+            stats["last_active"] = time.time()
+        return reply
+
+    async def _append_exchange(self, user_id, session_id, user_input, reply):
+        import uuid
+        from google.adk.events import Event
+
+        session = await self.session_service.get_session(app_name=APP_NAME, user_id=user_id, session_id=session_id)
+        if session is None:
+            session = await self.session_service.create_session(
+                app_name=APP_NAME, user_id=user_id, session_id=session_id
+            )
+        invocation_id = f"e-{uuid.uuid4()}"
+        for author, role, text in (("user", "user", user_input), ("advisor_agent", "model", reply)):
+            await self.session_service.append_event(session, Event(
+                invocation_id=invocation_id, author=author, content=Content(parts=[Part(text=text)], role=role)
+            ))
+
+    def _tools(self):
+        """Async wrappers for ADVISOR_TOOLS, rebuilt only when the MCP tools are rediscovered."""
+        registry = self.mcp_adapter.registry
+        version, tools = self._toolset
+        if version != registry.version:
+            tools = [registry.get(name, is_async=True) for name in ADVISOR_TOOLS]
+            self._toolset = (registry.version, tools)
+        return tools
+
+    def close(self, timeout: float = 10):
+        """Closes the MCP connection (stopping a stdio server subprocess) and its loop thread; idempotent."""
+        import asyncio
+        with self._sessions_lock:
+            if self._mcp_loop.is_closed() or not self._mcp_thread.is_alive():
+                return
+            future = asyncio.run_coroutine_threadsafe(self.mcp_adapter.close(), self._mcp_loop)
+            try:
+                future.result(timeout=timeout)
+            except Exception as e:
+                print(f"Error closing MCP Client: {e}")
+            self._mcp_loop.call_soon_threadsafe(self._mcp_loop.stop)
+            self._mcp_thread.join(timeout)
+            if not self._mcp_thread.is_alive():
+                self._mcp_loop.close()
+
+    def session_info(self, user_id):
+        """Turn count and token usage of ``user_id``'s conversation, or None."""
+        stats = self._sessions.get(f"chat-{user_id}")
+        if stats is None:
+            return None
+        return {k: v for k, v in stats.items() if k != "lock"}
+
+    def reset_session(self, user_id):
+        """Forgets ``user_id``'s conversation."""
+        import asyncio
+        session_id = f"chat-{user_id}"
+        with self._sessions_lock:
+            self._sessions.pop(session_id, None)
+        asyncio.run(self.session_service.delete_session(app_name=APP_NAME, user_id=user_id, session_id=session_id))
+
+    def _session_stats(self, session_id):
+        with self._sessions_lock:
+            stats = self._sessions.get(session_id)
+            if stats is None:
+                stats = self._sessions[session_id] = {
+                    "lock": threading.Lock(), "turns": 0, "llm_calls": 0,
+                    "prompt_tokens": 0, "output_tokens": 0, "context_tokens": 0,
+                    "compacted_tokens": 0, "last_active": time.time(),
+                }
+            return stats
+
+    def _evict_idle_sessions(self):
+        """Drops stats (and in-memory history) of conversations idle past SESSION_IDLE_SECONDS."""
+        cutoff = time.time() - SESSION_IDLE_SECONDS
+        with self._sessions_lock:
+            idle = [sid for sid, stats in self._sessions.items()
+                    if stats["last_active"] < cutoff and not stats["lock"].locked()]
+            for session_id in idle:
+                del self._sessions[session_id]
+        if idle and isinstance(self.session_service, InMemorySessionService):
+            import asyncio
+
+            async def delete_idle():
+                for session_id in idle:
+                    await self.session_service.delete_session(
+                        app_name=APP_NAME, user_id=session_id[len("chat-"):], session_id=session_id
+                    )
+            asyncio.run(delete_idle())
+
+    def _llm_span_callbacks(self, stats=None, tier=router.FULL):
+        """Model callbacks that compact the context to the token budget and wrap each
+        LLM turn in an `llm.generate` span, accounting tokens to ``stats`` and ``tier``."""
+        pending = {}
+
+        def before_model(callback_context, llm_request):
+            before, after = self.context_budget.compact(llm_request)
+            CONTEXT_TOKENS.observe(after)
+            if before > after:
+                COMPACTED_TOKENS.inc(before - after)
+            if stats is not None:
+                stats["llm_calls"] += 1
+                stats["context_tokens"] = after
+                stats["compacted_tokens"] += before - after
+            pending[callback_context.invocation_id] = tracing.start_span(
+                "llm.generate", model=getattr(llm_request, "model", None) or "", **{"llm.tier": tier},
+                **{"llm.context_tokens": after, "llm.compacted_tokens": before - after}
+            )
+            return None
+
+        def after_model(callback_context, llm_response):
+            span = pending.pop(callback_context.invocation_id, None)
+            if span is not None:
+                usage = getattr(llm_response, "usage_metadata", None)
+                if usage is not None:
+                    prompt_tokens = getattr(usage, "prompt_token_count", None) or 0
+                    output_tokens = getattr(usage, "candidates_token_count", None) or 0
+                    span.set_attribute("llm.prompt_tokens", prompt_tokens)
+                    span.set_attribute("llm.output_tokens", output_tokens)
+                    LLM_TOKENS.inc(prompt_tokens, kind="prompt", tier=tier)
+                    LLM_TOKENS.inc(output_tokens, kind="output", tier=tier)
+                    if stats is not None:
+                        stats["prompt_tokens"] += prompt_tokens
+                        stats["output_tokens"] += output_tokens
+                if getattr(llm_response, "error_code", None):
+                    span.set_error(str(llm_response.error_code))
+                span.end()
+            return None
+
+        def close_pending():
+            for span in pending.values():
+                span.set_error("turn did not complete")
+                span.end()
+            pending.clear()
+
+        return before_model, after_model, close_pending
+
+    def _run(self, user_input, user_id, session_id, tier=router.FULL):
+        self._evict_idle_sessions()
+        stats = self._session_stats(session_id) if session_id else None
+        before_model, after_model, close_pending = self._llm_span_callbacks(stats, tier)
+        try:
+            # Create a fresh model instance for this run unless one was injected
             # This ensures it binds to the correct event loop if needed
-            model_instance = get_model()
+            model_instance = self._model_instance or get_model(tier)
             # Use the same model for specialists to ensure consistency
             model_name = os.environ.get("LLM_MODEL", "gemini-2.0-flash")
 
-            # Get Tool Wrappers
-            # Technical Tools
-            tech_tools = [
-                self.mcp_adapter.get_tool_function("get_stock_history"),
-                self.mcp_adapter.get_tool_function("get_technical_summary")
-            ]
-            
-            # News Tools
-            news_tools = [
-                self.mcp_adapter.get_tool_function("get_stock_news")
-            ]
-            
-            # Fundamental Tools
-            fund_tools = [
-                self.mcp_adapter.get_tool_function("get_stock_profile"),
-                self.mcp_adapter.get_tool_function("get_detailed_stock_info")
-            ]
-            
-            # Portfolio Tools
-            portfolio_tools = [
-                self.mcp_adapter.get_tool_function("search_web"),
-                self.mcp_adapter.get_tool_function("get_etf_info"),
-                self.mcp_adapter.get_tool_function("get_stock_history")
-            ]
-            
-            # Get all tools directly for the main agent
-            all_tools = tech_tools + news_tools + fund_tools + portfolio_tools
+            all_tools = self._tools()
 
             agent = Agent(
                 name="advisor_agent",
                 model=model_instance,
                 tools=all_tools,
+                before_model_callback=before_model,
+                after_model_callback=after_model,
                 instruction="""You are a Senior Investment Advisor.
                 Your goal is to provide comprehensive Buy, Sell, or Hold recommendations, OR Portfolio Advice.
                 
@@ -92,6 +302,7 @@ class AdvisorAgent:
                 - get_stock_profile: Get company profile and fundamental data
                 - search_web: Search the web for information
                 - get_etf_info: Get information about ETFs
+                - get_portfolio_risk: Get volatility, beta, drawdown, VaR and correlations for a set of holdings
                 
                 STRICT PROCESS:
                 
@@ -106,7 +317,9 @@ class AdvisorAgent:
                     1. Use search_web to find relevant information
                     2. Use get_etf_info for specific ETF details if needed
                     3. Use get_stock_history to check performance if needed
-                    4. Provide clear, actionable advice
+                    4. If the user gives holdings (or you propose an allocation), use get_portfolio_risk to
+                       check diversification and risk instead of judging it from price histories
+                    5. Provide clear, actionable advice
                 
                 IMPORTANT:
                 - If a tool returns an error or "Data Unavailable", state that clearly
@@ -115,52 +328,74 @@ class AdvisorAgent:
                 - Always pass the stock symbol to tools that require it"""
             )
 
-            # Initialize Runner
-            enhanced_runner = InMemoryRunner(agent=agent, app_name="agents")
+            # Initialize Runner on the shared session service
+            enhanced_runner = Runner(agent=agent, app_name=APP_NAME, session_service=self.session_service)
             
-            # Create session (requires async execution)
+            # Resume or create the session and run the agent on an event loop owned
+            # by this thread, so the caller's trace context flows into model and tool calls.
             import uuid
-            session_id = str(uuid.uuid4())
-            async def setup_session():
-                return await enhanced_runner.session_service.create_session(
-                    user_id="user", 
-                    session_id=session_id, 
-                    app_name="agents"
-                )
-            
             import asyncio
-            asyncio.run(setup_session())
-            
-            # Prepare message
             message = Content(parts=[Part(text=user_input)], role="user")
-            
-            # Run agent
-            response_text = ""
-            for event in enhanced_runner.run(user_id="user", session_id=session_id, new_message=message):
-                # Check for ModelResponseEvent which contains the text
-                
-                # Check for ModelResponseEvent which contains the text
-                # Try event.response first (standard ModelResponseEvent)
-                if hasattr(event, 'response') and event.response:
-                    try:
-                        text = event.response.text
-                        if text:
-                            response_text = text
-                    except Exception:
-                        pass
-                
-                # Fallback: Content attribute directly (some event types)
-                elif hasattr(event, 'content') and event.content:
-                     try:
-                        # content is likely a Content object with parts
-                        if hasattr(event.content, 'parts'):
-                            parts = event.content.parts
-                            text_parts = [p.text for p in parts if hasattr(p, 'text') and p.text]
-                            if text_parts:
-                                response_text = "\n".join(text_parts)
-                     except Exception:
-                        pass
+
+            async def run_conversation():
+                session = None
+                if session_id:
+                    session = await self.session_service.get_session(
+                        app_name=APP_NAME, user_id=user_id, session_id=session_id
+                    )
+                if session is None:
+                    session = await self.session_service.create_session(
+                        user_id=user_id, 
+                        session_id=session_id or str(uuid.uuid4()), 
+                        app_name=APP_NAME
+                    )
+                try:
+                    return await collect_response(session.id)
+                finally:
+                    if not session_id:
+                        # Throwaway session: don't let it accumulate in the service
+                        await self.session_service.delete_session(
+                            app_name=APP_NAME, user_id=user_id, session_id=session.id
+                        )
+
+            async def collect_response(run_session_id):
+                response_text = ""
+                events = enhanced_runner.run_async(user_id=user_id, session_id=run_session_id, new_message=message)
+                async with aclosing(events):
+                    async for event in events:
+                        # Stop between steps if the scheduler cancelled this run
+                        check_cancelled()
+                        # Try event.response first (standard ModelResponseEvent)
+                        if hasattr(event, 'response') and event.response:
+                            try:
+                                text = event.response.text
+                                if text:
+                                    response_text = text
+                            except Exception:
+                                pass
+                    
+                        # Fallback: Content attribute directly (some event types)
+                        elif hasattr(event, 'content') and event.content:
+                             try:
+                                # content is likely a Content object with parts
+                                if hasattr(event.content, 'parts'):
+                                    parts = event.content.parts
+                                    text_parts = [p.text for p in parts if hasattr(p, 'text') and p.text]
+                                    if text_parts:
+                                        response_text = "\n".join(text_parts)
+                             except Exception:
+                                pass
+                return response_text
+
+            response_text = asyncio.run(run_conversation())
+            if stats is not None:
+                stats["turns"] += 1
+                stats["last_active"] = time.time()
                     
             return response_text
+        except JobCancelled:
+            raise
         except Exception as e:
             return f"Advisor failed: {e}"
+        finally:
+            close_pending()
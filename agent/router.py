@@ -0,0 +1,90 @@
+"""
+Routes chat messages to the cheapest tier that can answer them.
+
+    direct: a single data lookup for one symbol ("AAPL price", "TSLA news"),
+            answered from one MCP tool with a fixed template and no LLM.
+    fast:   other lookups without synthesis (several symbols or facts), run
+            through the agent on the small ``LLM_FAST_MODEL``.
+    full:   anything asking for judgement (analysis, buy/sell, comparisons,
+            portfolios), run on ``LLM_MODEL``.
+
+Classification is a local keyword heuristic; when in doubt it routes up, so
+the worst case is today's behaviour.
+
+Configuration (environment):
+    AGENT_ROUTING: Set to 0 to send every message to the full tier.
+"""
+import os
+import re
+from typing import NamedTuple
+
+from servers.stock_data import symbols
+
+DIRECT, FAST, FULL = "direct", "fast", "full"
+TIERS = (DIRECT, FAST, FULL)
+
+ROUTING_ENABLED = os.environ.get("AGENT_ROUTING", "1") != "0"
+
+# Longer messages usually carry context or conditions the templates would ignore
+MAX_LOOKUP_CHARS = 120
+
+# Intent -> (pattern, tool answering it directly)
+INTENTS = {
+    "price": (re.compile(r"\b(price|quote|trading at|how much|market cap|p/?e( ratio)?|52[- ]week|volume)\b", re.I),
+              "get_detailed_stock_info"),
+    "news": (re.compile(r"\b(news|headlines?|articles?|stories)\b", re.I), "get_stock_news"),
+    "profile": (re.compile(r"\b(profile|sector|industry|what does \S+ do|business summary|company info)\b", re.I),
+                "get_stock_profile"),
+    "technicals": (re.compile(r"\b(technicals?|indicators?|rsi|macd|moving averages?|sma|support|resistance)\b", re.I),
+                   "get_technical_summary"),
+}
+SYNTHESIS = re.compile(
+    r"\b(should|buy|sell|hold|analy[sz]e|analysis|recommend\w*|thesis|outlook|forecast|predict\w*|target|"
+    r"compare|comparison|versus|vs\.?|better|best|invest\w*|portfolio|allocat\w*|diversif\w*|risk\w*|"
+    r"why|opinion|think|worth buying|etfs?|funds?)\b",
+    re.I,
+)
+
+class Route(NamedTuple):
+    tier: str
+    intent: str = None
+    symbols: tuple = ()
+
+    @property
+    def tool(self):
+        return INTENTS[self.intent][1] if self.intent else None
+
+    @property
+    def symbol(self):
+        return self.symbols[0] if self.symbols else None
+
+
+def extract_symbols(text: str) -> tuple:
+    """Tickers mentioned in ``text`` ($TICKER, TICKER or a company name), in order of appearance."""
+    return symbols.extract(text)
+
+
+def classify(message: str) -> Route:
+    """Picks the tier (and, for direct lookups, the intent and symbol) for ``message``."""
+    text = message.strip()
+    if not ROUTING_ENABLED or not text:
+        return Route(FULL)
+    tickers = extract_symbols(text)
+    if SYNTHESIS.search(text) or len(text) > MAX_LOOKUP_CHARS:
+        return Route(FULL, symbols=tickers)
+    intents = [name for name, (pattern, _) in INTENTS.items() if pattern.search(text)]
+    if len(tickers) == 1 and len(intents) == 1:
+        return Route(DIRECT, intents[0], tickers)
+    if tickers and intents:
+        return Route(FAST, intents[0], tickers)
+    # No symbol or no recognizable lookup: let the full model work out what is wanted
+    return Route(FULL, intents[0] if intents else None, tickers)
+
+
+# The tools already format their results for people; the template only frames them
+DIRECT_TEMPLATE = "{result}\n\n_Quick lookup from market data. Ask me to analyze {symbol} for a recommendation._"
+
+
+def render(route: Route, result: str) -> str:
+    """The direct-tier reply for ``route`` from its tool's ``result``."""
+    return DIRECT_TEMPLATE.format(result=result.strip(), symbol=route.symbol)
@@ -0,0 +1,256 @@
+"""
+Priority scheduler and admission control for agent runs.
+
+Agent runs are long and hold the MCP server and the LLM quota, so they execute
+on a small dedicated worker pool instead of the web threadpool. Queued jobs are
+dispatched by priority (interactive chat before background and batch work),
+with at most ``per_user`` running jobs per user. When the queue is deeper than
+``max_queue`` (or a user has ``user_queue`` jobs waiting) new work is refused
+with ``Overloaded``, carrying a Retry-After estimate.
+
+Each job has a deadline and a cancel flag. Both are checked before the job
+starts and, via ``check_cancelled()``, between agent events while it runs, so
+work for clients that gave up or disconnected stops early.
+
+Configuration (environment):
+    AGENT_WORKERS: Concurrent agent runs (default 4).
+    AGENT_QUEUE_LIMIT: Queued jobs before interactive work is shed (default 32).
+    AGENT_USER_CONCURRENCY: Running jobs per user (default 2).
+    AGENT_USER_QUEUE_LIMIT: Queued jobs per user before shedding (default 8).
+"""
+import contextvars
+import enum
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+from core import metrics, tracing
+
+
+class Priority(enum.IntEnum):
+    INTERACTIVE = 0
+    BACKGROUND = 1
+    BATCH = 2
+
+
+# Lower priorities are shed at a fraction of the queue limit, keeping room for chat
+SHED_FRACTION = {Priority.INTERACTIVE: 1.0, Priority.BACKGROUND: 0.75, Priority.BATCH: 0.5}
+
+JOBS = metrics.counter("agent_jobs_total", "Agent jobs by outcome", ["priority", "outcome"])
+QUEUE_WAIT = metrics.histogram("agent_queue_wait_seconds", "Time agent jobs spent queued", ["priority"])
+QUEUE_DEPTH = metrics.gauge("agent_queue_depth", "Agent jobs waiting to run", ["priority"])
+RUNNING = metrics.gauge("agent_jobs_running", "Agent jobs running")
+
+
+class Overloaded(Exception):
+    """The job was refused; retry after ``retry_after`` seconds."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+
+class JobCancelled(Exception):
+    """The job was cancelled or ran past its deadline."""
+
+
+_current_job = contextvars.ContextVar("agent_job", default=None)
+
+
+def check_cancelled():
+    """Raises JobCancelled if the job running in this context should stop."""
+    job = _current_job.get()
+    if job is not None:
+        job.raise_if_stopped()
+
+
+class Job:
+    def __init__(self, fn, args, kwargs, user: str, priority: Priority, deadline: float = None):
+        self.fn, self.args, self.kwargs = fn, args, kwargs
+        self.user = user
+        self.priority = priority
+        self.deadline = deadline  # time.monotonic() value, or None
+        self.future = Future()
+        self.enqueued = time.monotonic()
+        self._cancelled = threading.Event()
+        # Run in the submitter's context so traces and the current request carry over
+        self._context = contextvars.copy_context()
+
+    def cancel(self):
+        """Stops the job: drops it if still queued, or at its next check if running."""
+        self._cancelled.set()
+
+    @property
+    def stopped(self) -> bool:
+        return self._cancelled.is_set() or (self.deadline is not None and time.monotonic() > self.deadline)
+
+    def raise_if_stopped(self):
+        if self._cancelled.is_set():
+            raise JobCancelled("cancelled")
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise JobCancelled("deadline exceeded")
+
+    def _run(self):
+        _current_job.set(self)
+        with tracing.span("agent.job", priority=self.priority.name.lower(), user=self.user):
+            return self.fn(*self.args, **self.kwargs)
+
+
+class AgentScheduler:
+    def __init__(self, workers: int = None, max_queue: int = None, per_user: int = None, user_queue: int = None):
+        self.workers = workers or int(os.environ.get("AGENT_WORKERS", "4"))
+        self.max_queue = max_queue or int(os.environ.get("AGENT_QUEUE_LIMIT", "32"))
+        self.per_user = per_user or int(os.environ.get("AGENT_USER_CONCURRENCY", "2"))
+        self.user_queue = user_queue or int(os.environ.get("AGENT_USER_QUEUE_LIMIT", "8"))
+        self._queues = {p: [] for p in Priority}
+        self._running = {}  # user -> running job count
+        self._cond = threading.Condition()
+        # Smoothed job duration, for Retry-After estimates
+        self._avg_duration = 10.0
+        self._threads = []
+        self._active = set()  # running jobs
+        self._stopping = False
+        for p in Priority:
+            QUEUE_DEPTH.set_function(lambda p=p: len(self._queues[p]), priority=p.name.lower())
+        RUNNING.set_function(lambda: sum(self._running.values()))
+
+    def start(self):
+        with self._cond:
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._worker, name=f"agent-worker-{len(self._threads)}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        return self
+
+    def queued(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    def retry_after(self) -> float:
+        waves = self.queued() / self.workers + 1
+        return max(1.0, waves * self._avg_duration)
+
+    def submit(self, fn, *args, user: str, priority: Priority = Priority.INTERACTIVE,
+               timeout: float = None, **kwargs) -> Job:
+        """Queues ``fn(*args, **kwargs)``; raises Overloaded instead of queueing past the limits."""
+        job = Job(fn, args, kwargs, user, priority, time.monotonic() + timeout if timeout else None)
+        label = priority.name.lower()
+        with self._cond:
+            if self._stopping:
+                JOBS.inc(priority=label, outcome="shed")
+                raise Overloaded("Agent scheduler is shutting down", self.retry_after())
+            if self.queued() >= self.max_queue * SHED_FRACTION[priority]:
+                JOBS.inc(priority=label, outcome="shed")
+                raise Overloaded("Agent queue is full", self.retry_after())
+            waiting = sum(1 for q in self._queues.values() for j in q if j.user == user)
+            if waiting >= self.user_queue:
+                JOBS.inc(priority=label, outcome="shed")
+                raise Overloaded("Too many queued requests for this user", self.retry_after())
+            self._queues[priority].append(job)
+            self._cond.notify()
+        return job
+
+    def _next_job(self):
+        """Highest-priority, oldest job whose user is under the concurrency limit (lock held)."""
+        for priority in Priority:
+            queue = self._queues[priority]
+            for i, job in enumerate(queue):
+                if job.stopped:
+                    # Expired or cancelled while waiting: drop without running
+                    del queue[i]
+                    return job
+                if self._running.get(job.user, 0) < self.per_user:
+                    del queue[i]
+                    return job
+        return None
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                job = self._next_job()
+                while job is None:
+                    if self._stopping:
+                        return
+                    self._cond.wait()
+                    job = self._next_job()
+                runnable = not job.stopped and job.future.set_running_or_notify_cancel()
+                if runnable:
+                    self._running[job.user] = self._running.get(job.user, 0) + 1
+                    self._active.add(job)
+
+            label = job.priority.name.lower()
+            if not runnable:
+                JOBS.inc(priority=label, outcome="expired")
+                if not job.future.cancelled() and job.future.set_running_or_notify_cancel():
+                    job.future.set_exception(JobCancelled("cancelled before start"))
+                continue
+            QUEUE_WAIT.observe(time.monotonic() - job.enqueued, priority=label)
+
+            started = time.monotonic()
+            try:
+                result = job._context.run(job._run)
+            except JobCancelled as e:
+                JOBS.inc(priority=label, outcome="cancelled")
+                job.future.set_exception(e)
+            except BaseException as e:
+                JOBS.inc(priority=label, outcome="failed")
+                job.future.set_exception(e)
+            else:
+                JOBS.inc(priority=label, outcome="completed")
+                job.future.set_result(result)
+            finally:
+                with self._cond:
+                    self._active.discard(job)
+                    self._running[job.user] -= 1
+                    if not self._running[job.user]:
+                        del self._running[job.user]
+                    self._avg_duration = 0.8 * self._avg_duration + 0.2 * (time.monotonic() - started)
+                    # A slot for this user opened up; wake everyone so a waiting job of theirs can go
+                    self._cond.notify_all()
+
+    def stop(self, timeout: float = 30):
+        """Refuses new work, fails queued jobs, cancels running ones and waits for the workers."""
+        with self._cond:
+            self._stopping = True
+            dropped = [job for queue in self._queues.values() for job in queue]
+            for queue in self._queues.values():
+                queue.clear()
+            for job in self._active:
+                job.cancel()
+            self._cond.notify_all()
+        for job in dropped:
+            job.cancel()
+            JOBS.inc(priority=job.priority.name.lower(), outcome="cancelled")
+            if job.future.set_running_or_notify_cancel():
+                job.future.set_exception(JobCancelled("scheduler shutting down"))
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+_stopped = False
+# Retry-After for work refused because the process is shutting down
+SHUTDOWN_RETRY_AFTER = 30.0
+
+
+def get_scheduler() -> AgentScheduler:
+    """The shared scheduler, started on first use; raises Overloaded once ``stop_scheduler()`` ran."""
+    global _scheduler
+    with _scheduler_lock:
+        if _stopped:
+            raise Overloaded("Agent scheduler is shutting down", SHUTDOWN_RETRY_AFTER)
+        if _scheduler is None:
+            _scheduler = AgentScheduler().start()
+        return _scheduler
+
+
+def stop_scheduler(timeout: float = 30):
+    """Stops the shared scheduler, if started, for good: later work is refused, not restarted."""
+    global _scheduler, _stopped
+    with _scheduler_lock:
+        scheduler, _scheduler = _scheduler, None
+        _stopped = True
+    if scheduler is not None:
+        scheduler.stop(timeout)
@@ -12,9 +12,11 @@ class PortfolioAnalyst:
             1. Use 'search_web' to find popular funds, ETFs, or portfolios of famous investors (e.g., "Ray Dalio portfolio").
             2. Use 'get_etf_info' to get details on specific ETFs found in search or requested by user.
             3. Use 'get_stock_history' to check performance if needed.
-            4. Focus on diversification, expense ratios, and risk management.
-            5. When recommending funds, explain WHY they fit the user's goal (e.g., "VTI for broad exposure").
-            6. If you cannot find info, state "Data Unavailable"."""
+            4. Use 'get_portfolio_risk' to measure volatility, beta, drawdown and correlations of any
+               holdings given or allocation you propose; base diversification claims on its output.
+            5. Focus on diversification, expense ratios, and risk management.
+            6. When recommending funds, explain WHY they fit the user's goal (e.g., "VTI for broad exposure").
+            7. If you cannot find info, state "Data Unavailable"."""
 
     def _create_agent(self):
         from google.adk.models import Gemini
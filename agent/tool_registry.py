@@ -0,0 +1,232 @@
+"""
+Callable wrappers for the MCP server's tools, built once per discovery.
+
+``ToolRegistry.discover`` turns each tool listed by the server into a sync and
+an async Python function with a real ``inspect.Signature`` (names, types and
+defaults from the tool's input schema, docstring from its description), which
+is what ADK reads to describe the tool to the model. Arguments are validated
+against the cached schema before a call leaves the process, and every call is
+bounded by a per-tool timeout. Both failures come back as "Error ..." strings,
+like the tools' own errors, so the agent can report or correct them.
+
+Rediscovery (on reconnect or a tools/list_changed notification) bumps
+``version``; callers that cache wrapper lists rebuild them when it changes.
+
+Configuration (environment):
+    MCP_TOOL_TIMEOUT_SECONDS: Default per-call timeout (default 60).
+    MCP_TOOL_TIMEOUTS: Per-tool overrides, e.g. "get_portfolio_risk=120,search_web=20".
+"""
+import asyncio
+import concurrent.futures
+import inspect
+import os
+import sys
+import threading
+from typing import Optional
+
+from core import metrics, tracing
+
+DEFAULT_TIMEOUT = float(os.environ.get("MCP_TOOL_TIMEOUT_SECONDS", "60"))
+# admin_profile samples for up to 300s before replying
+TOOL_TIMEOUTS = {"admin_profile": 330.0}
+for _item in os.environ.get("MCP_TOOL_TIMEOUTS", "").split(","):
+    if "=" in _item:
+        _name, _seconds = _item.split("=", 1)
+        TOOL_TIMEOUTS[_name.strip()] = float(_seconds)
+
+JSON_TYPES = {
+    "string": str,
+    "integer": int,
+    "number": float,
+    "boolean": bool,
+    "array": list,
+    "object": dict,
+}
+
+TOOL_ERRORS = metrics.counter("mcp_tool_errors_total", "MCP tool calls rejected or timed out", ["tool", "reason"])
+
+
+def _schema_types(schema: dict) -> list:
+    """JSON types a property accepts (``anyOf`` flattened)."""
+    if "anyOf" in schema:
+        return [t for option in schema["anyOf"] for t in _schema_types(option)]
+    kind = schema.get("type")
+    if kind is None:
+        return []
+    return kind if isinstance(kind, list) else [kind]
+
+
+def _check(value, types: list):
+    """Returns ``(value, ok)``, converting integral floats (as some LLMs send them) to int."""
+    if not types:
+        return value, True
+    if value is None:
+        return value, "null" in types
+    if isinstance(value, bool):
+        return value, "boolean" in types
+    if isinstance(value, int) and ("integer" in types or "number" in types):
+        return value, True
+    if isinstance(value, float):
+        if "number" in types:
+            return value, True
+        if "integer" in types and value.is_integer():
+            return int(value), True
+        return value, False
+    return value, any(t in JSON_TYPES and isinstance(value, JSON_TYPES[t]) for t in types)
+
+
+class ToolSpec:
+    """A discovered tool: its schema, signature and wrappers."""
+
+    def __init__(self, tool, registry: "ToolRegistry"):
+        self.name = tool.name
+        self.description = tool.description or f"Call {tool.name} tool"
+        schema = tool.inputSchema if isinstance(getattr(tool, "inputSchema", None), dict) else {}
+        self.properties = schema.get("properties") or {}
+        self.required = set(schema.get("required") or ())
+        self.open = schema.get("additionalProperties", False) is not False
+        self.timeout = TOOL_TIMEOUTS.get(self.name, DEFAULT_TIMEOUT)
+        self.signature = self._signature()
+        self.sync = self._wrap(registry, is_async=False)
+        self.async_ = self._wrap(registry, is_async=True)
+
+    def _signature(self) -> inspect.Signature:
+        required, optional = [], []
+        for name, info in self.properties.items():
+            types = _schema_types(info)
+            concrete = [JSON_TYPES[t] for t in types if t in JSON_TYPES]
+            annotation = concrete[0] if len(concrete) == 1 else inspect.Parameter.empty
+            if name in self.required:
+                required.append(inspect.Parameter(name, inspect.Parameter.POSITIONAL_OR_KEYWORD, annotation=annotation))
+                continue
+            default = info.get("default")
+            if default is None and annotation is not inspect.Parameter.empty:
+                annotation = Optional[annotation]
+            optional.append(inspect.Parameter(
+                name, inspect.Parameter.POSITIONAL_OR_KEYWORD, default=default, annotation=annotation
+            ))
+        return inspect.Signature(required + optional, return_annotation=str)
+
+    def _wrap(self, registry: "ToolRegistry", is_async: bool):
+        name, signature = self.name, self.signature
+
+        if is_async:
+            async def wrapper(*args, **kwargs):
+                return await registry.acall(name, signature.bind(*args, **kwargs).arguments)
+        else:
+            def wrapper(*args, **kwargs):
+                return registry.call(name, signature.bind(*args, **kwargs).arguments)
+
+        wrapper.__name__ = wrapper.__qualname__ = name
+        wrapper.__doc__ = self.description
+        wrapper.__signature__ = signature
+        wrapper.__annotations__ = {
+            p.name: p.annotation for p in signature.parameters.values() if p.annotation is not inspect.Parameter.empty
+        } | {"return": str}
+        return wrapper
+
+    def validate(self, arguments: dict):
+        """Returns ``(arguments, error)``; ``error`` is None when the call matches the schema."""
+        unknown = sorted(set(arguments) - set(self.properties))
+        if unknown and not self.open:
+            return arguments, f"unexpected argument(s) {', '.join(unknown)}"
+        missing = sorted(self.required - set(arguments))
+        if missing:
+            return arguments, f"missing required argument(s) {', '.join(missing)}"
+        checked = {}
+        for name, value in arguments.items():
+            types = _schema_types(self.properties.get(name, {}))
+            value, ok = _check(value, types)
+            if not ok:
+                return arguments, f"{name} must be {' or '.join(types)}, got {type(value).__name__}"
+            checked[name] = value
+        return checked, None
+
+
+class ToolRegistry:
+    """Tool wrappers for one MCP connection.
+
+    ``invoke`` is the connection's ``call_tool(name, arguments, traceparent=)``
+    coroutine function and ``loop`` returns the event loop it runs on.
+    """
+
+    def __init__(self, invoke, loop):
+        self._invoke = invoke
+        self._loop = loop
+        self._specs = {}
+        self._lock = threading.Lock()
+        self.version = 0
+
+    def discover(self, tools):
+        """Rebuilds the wrappers from a ``list_tools`` result."""
+        specs = {tool.name: ToolSpec(tool, self) for tool in tools}
+        with self._lock:
+            self._specs = specs
+            self.version += 1
+
+    def names(self) -> list:
+        return list(self._specs)
+
+    def spec(self, name: str) -> ToolSpec:
+        spec = self._specs.get(name)
+        if spec is None:
+            raise KeyError(f"Unknown MCP tool: {name}")
+        return spec
+
+    def get(self, name: str, is_async: bool = False):
+        """The sync (or async) wrapper for ``name``; raises KeyError if the server has no such tool."""
+        spec = self.spec(name)
+        return spec.async_ if is_async else spec.sync
+
+    def _prepare(self, name: str, arguments: dict):
+        spec = self._specs.get(name)
+        if spec is None:
+            # The name comes from the model; keep it out of the label set
+            TOOL_ERRORS.inc(tool="unknown", reason="unknown")
+            print(f"MCP tool call rejected: no tool named {name!r}", file=sys.stderr)
+            return None, None, None, f"Error calling {name}: the MCP server has no such tool"
+        arguments, error = spec.validate(arguments)
+        if error:
+            TOOL_ERRORS.inc(tool=spec.name, reason="invalid")
+            return None, None, None, f"Error calling {name}: {error}"
+        loop = self._loop()
+        if loop is None:
+            raise RuntimeError("MCP Adapter not started")
+        return spec, loop, arguments, None
+
+    def call(self, name: str, arguments: dict) -> str:
+        """Calls the tool from any thread other than the connection's loop."""
+        spec, loop, arguments, error = self._prepare(name, arguments)
+        if error:
+            return error
+        with tracing.span("mcp.call_tool", tool=name) as span:
+            future = asyncio.run_coroutine_threadsafe(
+                self._invoke(name, arguments, traceparent=span.traceparent()), loop
+            )
+            try:
+                return future.result(timeout=spec.timeout)
+            except concurrent.futures.TimeoutError:  # an alias of TimeoutError only from 3.11
+                future.cancel()
+                return self._timed_out(spec, span)
+
+    async def acall(self, name: str, arguments: dict) -> str:
+        """Calls the tool from any event loop, without blocking it."""
+        spec, loop, arguments, error = self._prepare(name, arguments)
+        if error:
+            return error
+        with tracing.span("mcp.call_tool", tool=name) as span:
+            future = asyncio.run_coroutine_threadsafe(
+                self._invoke(name, arguments, traceparent=span.traceparent()), loop
+            )
+            try:
+                # Cancelling the wrapped future also cancels the call on the connection's loop
+                return await asyncio.wait_for(asyncio.wrap_future(future), spec.timeout)
+            except asyncio.TimeoutError:
+                return self._timed_out(spec, span)
+
+    @staticmethod
+    def _timed_out(spec: ToolSpec, span) -> str:
+        TOOL_ERRORS.inc(tool=spec.name, reason="timeout")
+        message = f"Error: {spec.name} did not respond within {spec.timeout:g}s"
+        span.set_error(message)
+        return message
@@ -1,70 +1,79 @@
 from google.adk.runners import InMemoryRunner
 from google.genai.types import Content, Part
 import asyncio
+import contextvars
+import os
+import threading
 import uuid
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+# Specialist runs execute on this many long-lived threads instead of a new thread each
+SPECIALIST_WORKERS = int(os.environ.get("AGENT_SPECIALIST_WORKERS", "4"))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _executor() -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=SPECIALIST_WORKERS, thread_name_prefix="specialist")
+        return _pool
+
+
+def shutdown(wait: bool = True):
+    """Stops the specialist pool; a later run starts a new one."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=wait, cancel_futures=True)
+
+
+def _response_text(event) -> str:
+    if hasattr(event, 'response') and event.response:
+        try:
+            return event.response.text
+        except Exception:
+            return None
+    if hasattr(event, 'content') and event.content:
+        try:
+            if hasattr(event.content, 'parts'):
+                text_parts = [p.text for p in event.content.parts if hasattr(p, 'text') and p.text]
+                if text_parts:
+                    return "\n".join(text_parts)
+        except Exception:
+            return None
+    return None
+
+
+async def _run(agent_factory, prompt: str) -> str:
+    # Create the agent on the worker's loop to ensure loop-affinity of async clients
+    agent = agent_factory()
+    runner = InMemoryRunner(agent=agent, app_name="agents")
+    session_id = str(uuid.uuid4())
+    await runner.session_service.create_session(user_id="user", session_id=session_id, app_name="agents")
+
+    text = ""
+    message = Content(parts=[Part(text=prompt)], role="user")
+    async for event in runner.run_async(user_id="user", session_id=session_id, new_message=message):
+        text = _response_text(event) or text
+    return text
 
-import threading
 
 def run_agent_sync(agent_factory, prompt: str) -> str:
     """
     Runs a Google ADK Agent synchronously using InMemoryRunner.
     Safely handles extraction of the response text.
-    Executes in a separate thread to avoid nested asyncio loop conflicts.
-    Takes an agent_factory callable to create the agent on the correct thread.
+    Executes on a bounded worker pool, on an event loop of its own, to avoid
+    nested asyncio loop conflicts with the caller.
+    Takes an agent_factory callable to create the agent on the correct loop.
     """
-    result_container = {"text": "", "error": None}
-
-    def target():
-        # Create agent INSIDE the thread to ensure thread-affinity of async clients
-        agent = agent_factory()
-        
-        # Initialize Runner with correct app_name
-        enhanced_runner = InMemoryRunner(agent=agent, app_name="agents")
-        
-        # Create session
-        session_id = str(uuid.uuid4())
-        async def setup_session():
-            return await enhanced_runner.session_service.create_session(
-                user_id="user", 
-                session_id=session_id, 
-                app_name="agents"
-            )
-        
-        try:
-            # This is safe because we are in a new thread
-            asyncio.run(setup_session())
-            
-            # Prepare message
-            message = Content(parts=[Part(text=prompt)], role="user")
-            
-            # Run agent
-            for event in enhanced_runner.run(user_id="user", session_id=session_id, new_message=message):
-                if hasattr(event, 'response') and event.response:
-                    try:
-                        text = event.response.text
-                        if text:
-                            result_container["text"] = text
-                    except Exception:
-                        pass
-                elif hasattr(event, 'content') and event.content:
-                     try:
-                        if hasattr(event.content, 'parts'):
-                            parts = event.content.parts
-                            text_parts = [p.text for p in parts if hasattr(p, 'text') and p.text]
-                            if text_parts:
-                                result_container["text"] = "\n".join(text_parts)
-                     except Exception:
-                        pass
-        except Exception as e:
-            result_container["error"] = e
-            # Log error but don't crash
-            # print(f"run_agent_sync error: {e}")
-
-    t = threading.Thread(target=target)
-    t.start()
-    t.join() # Wait for the thread to complete
-    
-    if result_container["error"]:
-        return f"Agent Run Failed: {result_container['error']}"
-    
-    return result_container["text"]
+    future = _executor().submit(contextvars.copy_context().run, lambda: asyncio.run(_run(agent_factory, prompt)))
+    try:
+        return future.result()
+    except CancelledError:
+        return "Agent Run Failed: shutting down"
+    except Exception as e:
+        return f"Agent Run Failed: {e}"
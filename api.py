@@ -1,10 +1,10 @@
 import os
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 from agent.orchestrator import AdvisorAgent
 
-app = FastAPI(title="Multi-Agent Stock Advisor API")
-
 # Initialize the agent
 # Note: Ensure GOOGLE_API_KEY is set in the environment
 if "GOOGLE_API_KEY" not in os.environ:
@@ -12,6 +12,14 @@ if "GOOGLE_API_KEY" not in os.environ:
 
 advisor = AdvisorAgent()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Closes the MCP connection and stops the stock_data server process
+    await asyncio.to_thread(advisor.close)
+
+app = FastAPI(title="Multi-Agent Stock Advisor API", lifespan=lifespan)
+
 class StockRequest(BaseModel):
     symbol: str
 
@@ -3,24 +3,33 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-import yfinance as yf
-from fastapi import FastAPI, Depends, HTTPException, status
+import asyncio
+import math
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, status
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
 from typing import List
 from datetime import timedelta
 
-from api.models import Token, UserCreate, ChatMessage
+from api.models import Token, UserCreate, ChatMessage, PortfolioRiskRequest, AnalyzeJobRequest, AlertRuleRequest
+from agent.batch import FINISHED, BatchJobs
 from agent.orchestrator import AdvisorAgent
+from agent import utils as agent_utils
+from agent.scheduler import JobCancelled, Overloaded, Priority, get_scheduler, stop_scheduler
 from api.auth import (
     ACCESS_TOKEN_EXPIRE_MINUTES,
     create_access_token,
     get_password_hash,
     verify_password,
-    get_current_user
+    get_current_user,
+    get_admin_user
 )
+from core import metrics, profiling, resources, tracing
+from servers.stock_data import alerts, intervals, market_data, portfolio, shared_bars, snapshot, symbols
 
 # In-memory DB for demo purposes (backed by JSON file)
 import json
@@ -47,7 +56,29 @@ def save_users(db):
 users_db = load_users()
 watchlist_db = {} # {username: [symbol1, symbol2]}
 
-app = FastAPI()
+# Evaluated after every snapshot refresh; rules without a symbol follow the watchlist
+alert_engine = alerts.AlertEngine(snapshot.table, watchlists=lambda user: watchlist_db.get(user, []))
+
+# Country -> index symbols, from the symbol master (e.g. US: S&P 500, Dow 30, Nasdaq, Russell 2000)
+MARKET_INDEXES = symbols.indexes()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Starts the background services, and on shutdown stops them before the process exits."""
+    global loop_watchdog
+    loop_watchdog = profiling.start_watchdog()
+    profiling.get_profiler()
+    start_snapshot()
+    batch_jobs.resume_pending()
+    try:
+        yield
+    finally:
+        if loop_watchdog is not None:
+            loop_watchdog.stop()
+        profiling.get_profiler().stop()
+        await asyncio.to_thread(shutdown_services)
+
+app = FastAPI(lifespan=lifespan)
 
 # Enable CORS for frontend
 app.add_middleware(
@@ -61,6 +92,91 @@ app.add_middleware(
 # Mount static files
 app.mount("/static", StaticFiles(directory="web"), name="static")
 
+HTTP_REQUESTS = metrics.counter(
+    "http_requests_total", "HTTP requests handled", ["method", "route", "status"]
+)
+HTTP_LATENCY = metrics.histogram(
+    "http_request_duration_seconds", "HTTP request latency", ["method", "route"]
+)
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """Wraps every request in a root span and records latency per route template."""
+    parent = tracing.parse_traceparent(request.headers.get("traceparent"))
+    start = time.perf_counter()
+    status_code = 500
+    # Renamed to the route template once routing has run; the raw path is only an attribute
+    with tracing.span(f"{request.method} unmatched", parent=parent,
+                      **{"http.method": request.method, "http.target": request.url.path}) as span:
+        try:
+            response = await call_next(request)
+            status_code = response.status_code
+            span.set_attribute("http.status_code", status_code)
+            if status_code >= 500:
+                span.set_error(f"HTTP {status_code}")
+            response.headers["traceparent"] = span.traceparent()
+            return response
+        finally:
+            # Label by route template (e.g. /market/chart/{symbol}) to bound cardinality
+            route = request.scope.get("route")
+            route_path = getattr(route, "path", "unmatched")
+            span.name = f"{request.method} {route_path}"
+            HTTP_REQUESTS.inc(method=request.method, route=route_path, status=status_code)
+            HTTP_LATENCY.observe(time.perf_counter() - start, method=request.method, route=route_path)
+
+loop_watchdog = None
+
+def start_snapshot():
+    """Keeps the market snapshot current for every index and watchlist symbol."""
+    tracked = {symbol for tickers in MARKET_INDEXES.values() for symbol in tickers}
+    tracked.update(symbol for tickers in watchlist_db.values() for symbol in tickers)
+    tracked.update(alert_engine.symbols())
+    snapshot.start(tracked)
+
+@app.get("/admin/stalls")
+async def get_loop_stalls(current_user: str = Depends(get_admin_user)):
+    """Recent event-loop stalls with the blocking stack and route."""
+    if loop_watchdog is None:
+        return {"enabled": False, "stalls": []}
+    return {"enabled": True, "threshold_ms": loop_watchdog.threshold * 1000, "stalls": loop_watchdog.report()}
+
+def mcp_admin_tool(name: str):
+    """The agent's wrapper for an MCP admin tool; 404 when the server does not expose it (HTTP/SSE)."""
+    try:
+        return get_agent().mcp_adapter.get_tool_function(name)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="The MCP server only exposes admin tools over stdio or in-process")
+
+@app.get("/admin/profile", response_class=PlainTextResponse)
+def get_profile(seconds: float = 10, target: str = "api", current_user: str = Depends(get_admin_user)):
+    """Collapsed stacks (flamegraph.pl / speedscope input) for the API or MCP server process."""
+    seconds = min(max(seconds, 0.1), 300)
+    if target == "mcp":
+        return mcp_admin_tool("admin_profile")(seconds=int(seconds))
+    if target != "api":
+        raise HTTPException(status_code=400, detail="target must be 'api' or 'mcp'")
+    return profiling.get_profiler().profile(seconds)
+
+@app.get("/admin/cache/history")
+def get_history_cache_memory(limit: int = 20, target: str = "api", current_user: str = Depends(get_admin_user)):
+    """Bytes of cached price history in the API or MCP server process, per symbol."""
+    limit = min(max(limit, 0), 1000)
+    if target == "mcp":
+        return json.loads(mcp_admin_tool("admin_cache_memory")(limit=limit))
+    if target != "api":
+        raise HTTPException(status_code=400, detail="target must be 'api' or 'mcp'")
+    return market_data.history_memory(limit)
+
+@app.get("/admin/resources")
+def get_resource_usage(current_user: str = Depends(get_admin_user)):
+    """Threads, file descriptors, sockets and child processes held by the API process."""
+    return resources.usage()
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus scrape endpoint."""
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 @app.get("/")
 async def read_root():
     return FileResponse('web/index.html')
@@ -106,23 +222,58 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
+# "local": fetch and cache bars in this process; "mcp": read them from the MCP
+# server's cache through shared memory, so both processes share one copy
+BAR_SOURCE = os.environ.get("BAR_SOURCE", "local")
+
+def load_history(symbol: str, period: str, interval: str = "1d"):
+    """Blocking (upstream fetch or MCP call); call from threadpool handlers, not on the loop."""
+    if BAR_SOURCE == "mcp":
+        tool = get_agent().mcp_adapter.get_tool_function("get_stock_bars")
+        # A segment can be evicted between publish and attach; ask again once
+        for attempt in range(2):
+            reply = tool(symbol=symbol, period=period, interval=interval)
+            if reply.startswith("Error"):
+                raise ValueError(reply)
+            try:
+                return shared_bars.read_frame(reply)
+            except FileNotFoundError:
+                if attempt:
+                    raise
+    return market_data.get_history(symbol, period=period, interval=interval)
+
+def check_symbols(tickers) -> list:
+    """Normalized, distinct ``tickers``; 404 naming any that cannot exist. Blocking (may probe upstream)."""
+    checked, unknown = [], []
+    for ticker in tickers:
+        try:
+            checked.append(market_data.check_symbol(ticker))
+        except symbols.UnknownSymbol:
+            unknown.append(ticker)
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"Unknown symbols: {', '.join(unknown)}")
+    return list(dict.fromkeys(checked))
+
 @app.get("/market/indexes")
-async def get_market_indexes(country: str = "US"):
+def get_market_indexes(country: str = "US"):
     """Fetch top indexes based on country."""
-    indexes = {
-        "US": ["^GSPC", "^DJI", "^IXIC", "^RUT"], # S&P 500, Dow 30, Nasdaq, Russell 2000
-        "UK": ["^FTSE", "^GSPC"], # FTSE 100
-        "IN": ["^BSESN", "^NSEI"], # Sensex, Nifty 50
-        "JP": ["^N225"], # Nikkei 225
-    }
-    
-    symbols = indexes.get(country, indexes["US"])
+    tickers = MARKET_INDEXES.get(country, MARKET_INDEXES["US"])
     data = []
     
-    for symbol in symbols:
+    for symbol in tickers:
+        row = snapshot.table.get(symbol)
+        if row is not None and row["percent"] is not None:
+            data.append({
+                "symbol": symbol,
+                "price": round(row["price"], 2),
+                "change": round(row["change"], 2),
+                "percent": round(row["percent"], 2),
+                "name": symbol
+            })
+            continue
+        # Not snapshotted yet (first start); compute it live
         try:
-            ticker = yf.Ticker(symbol)
-            info = ticker.history(period="2d")
+            info = load_history(symbol, period="2d")
             if len(info) >= 2:
                 current = info["Close"].iloc[-1]
                 prev = info["Close"].iloc[-2]
@@ -140,15 +291,73 @@ async def get_market_indexes(country: str = "US"):
             
     return data
 
+@app.get("/market/snapshot")
+def get_market_snapshot(tickers: str = Query(None, alias="symbols"), current_user: str = Depends(get_current_user)):
+    """Pre-computed price, indicator and range records; defaults to the user's watchlist. Runs in threadpool."""
+    if tickers:
+        # Only real symbols may join the refresher's tracked set
+        wanted = check_symbols(s for s in tickers.split(",") if s.strip())
+    else:
+        wanted = watchlist_db.get(current_user, [])
+    rows = snapshot.table.get_many(wanted)
+    found = {row["symbol"] for row in rows}
+    missing = [s for s in wanted if s not in found]
+    if missing:
+        snapshot.track(missing)
+    return {"rows": rows, "pending": missing}
+
+@app.get("/market/screen")
+async def screen_market(
+    rsi_below: float = None,
+    rsi_above: float = None,
+    percent_below: float = None,
+    percent_above: float = None,
+    volume_ratio_above: float = None,
+    from_high_above: float = None,
+    from_high_below: float = None,
+    above_sma_50: bool = None,
+    above_sma_20: bool = None,
+    macd_bullish: bool = None,
+    sort: str = None,
+    descending: bool = True,
+    limit: int = 50,
+):
+    """Screens every snapshotted symbol; all given filters must match."""
+    filters = dict(
+        rsi_below=rsi_below, rsi_above=rsi_above, percent_below=percent_below,
+        percent_above=percent_above, volume_ratio_above=volume_ratio_above,
+        from_high_above=from_high_above, from_high_below=from_high_below,
+        above_sma_50=above_sma_50, above_sma_20=above_sma_20, macd_bullish=macd_bullish,
+    )
+    try:
+        return snapshot.table.screen(sort=sort, descending=descending, limit=min(max(limit, 1), 500), **filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/symbols/search")
+async def search_symbols(q: str, limit: int = 10, type: str = None):
+    """Autocomplete: symbols whose ticker or name matches ``q`` (``type``: equity, etf or index)."""
+    return symbols.search(q, limit=min(max(limit, 1), 50), kind=type)
+
 @app.get("/market/chart/{symbol}")
-async def get_chart_data(symbol: str, period: str = "1mo"):
+def get_chart_data(symbol: str, period: str = "1mo", interval: str = "1d"):
+    # Reject symbols that cannot exist before paying for an upstream round-trip
+    try:
+        symbol = symbols.check(symbol)
+    except symbols.UnknownSymbol:
+        raise HTTPException(status_code=404, detail="Symbol not found")
     try:
-        ticker = yf.Ticker(symbol)
-        hist = ticker.history(period=period)
+        hist = load_history(symbol, period=period, interval=interval)
+    except symbols.UnknownSymbol:
+        raise HTTPException(status_code=404, detail="Symbol not found")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        date_format = "%Y-%m-%d %H:%M" if intervals.is_intraday(intervals.normalize(interval)) else "%Y-%m-%d"
         data = []
         for date, row in hist.iterrows():
             data.append({
-                "date": date.strftime("%Y-%m-%d"),
+                "date": date.strftime(date_format),
                 "price": round(row["Close"], 2)
             })
         return data
@@ -170,25 +379,239 @@ def get_agent():
             raise HTTPException(status_code=500, detail=str(e))
     return agent
 
+CHAT_TIMEOUT = float(os.environ.get("AGENT_CHAT_TIMEOUT_SECONDS", "120"))
+
+def submit_agent_job(fn, *args, user: str, priority: Priority, timeout: float = None, **kwargs):
+    """Queues agent work on the scheduler, turning load shedding into 429 + Retry-After."""
+    try:
+        return get_scheduler().submit(fn, *args, user=user, priority=priority, timeout=timeout, **kwargs)
+    except Overloaded as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e),
+            headers={"Retry-After": str(math.ceil(e.retry_after))},
+        )
+
+async def await_agent_job(job, request: Request, poll_interval: float = 1.0):
+    """Waits for ``job``, cancelling it if the client disconnects or its deadline passes first.
+
+    The deadline is enforced here too, not only between agent steps, so a
+    stuck LLM call cannot hold the request open indefinitely.
+    """
+    future = asyncio.wrap_future(job.future)
+    while True:
+        timeout = poll_interval
+        if job.deadline is not None:
+            timeout = max(0.0, min(timeout, job.deadline - time.monotonic()))
+        done, _ = await asyncio.wait({future}, timeout=timeout)
+        if done:
+            return future.result()
+        if job.deadline is not None and time.monotonic() >= job.deadline:
+            job.cancel()
+            future.cancel()
+            raise JobCancelled("deadline exceeded")
+        if await request.is_disconnected():
+            job.cancel()
+            future.cancel()
+            raise JobCancelled("client disconnected")
+
 @app.post("/agent/chat")
-def chat_agent(chat: ChatMessage, current_user: str = Depends(get_current_user)):
-    """Chat with the AI Agent. Runs synchronously in threadpool."""
-    agent_instance = get_agent()
+async def chat_agent(chat: ChatMessage, request: Request, current_user: str = Depends(get_current_user)):
+    """Chat with the AI Agent. Runs on the agent scheduler at interactive priority."""
+    agent_instance = await asyncio.to_thread(get_agent)
+    job = submit_agent_job(
+        agent_instance.run, chat.message, user_id=current_user,
+        user=current_user, priority=Priority.INTERACTIVE, timeout=CHAT_TIMEOUT,
+    )
     try:
-        response = agent_instance.run(chat.message)
+        response = await await_agent_job(job, request)
         return {"response": response}
+    except JobCancelled as e:
+        if await request.is_disconnected():
+            # Nobody is listening; nginx's "client closed request"
+            return Response(status_code=499)
+        raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail=f"Agent run {e}")
     except Exception as e:
         return {"response": f"Error: {e}"}
 
+batch_jobs = BatchJobs(get_agent)
+
+def shutdown_services(timeout: float = 30):
+    """Cancels agent work, closes the MCP connection (and its server process) and stops the pools."""
+    global agent
+    # Batch jobs first, so none starts an agent or scheduler after they are stopped
+    batch_jobs.stop(timeout)
+    stop_scheduler(timeout)
+    if agent is not None:
+        agent.close()
+        agent = None
+    agent_utils.shutdown(wait=False)
+    snapshot.stop(timeout)
+
+def get_own_job(job_id: str, current_user: str):
+    job = batch_jobs.get(job_id)
+    if job is None or job["owner"] != current_user:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.post("/jobs/analyze", status_code=status.HTTP_202_ACCEPTED)
+def create_analysis_job(request: AnalyzeJobRequest, current_user: str = Depends(get_current_user)):
+    """Queues a background analysis of each symbol (and/or the watchlist). Runs in threadpool."""
+    tickers = check_symbols(s for s in request.symbols or [] if s.strip())
+    if request.use_watchlist:
+        tickers += watchlist_db.get(current_user, [])
+    try:
+        return batch_jobs.create(current_user, tickers, prompt=request.prompt)
+    except Overloaded as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e),
+            headers={"Retry-After": str(math.ceil(e.retry_after))},
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/jobs")
+async def list_analysis_jobs(current_user: str = Depends(get_current_user)):
+    return batch_jobs.list(current_user)
+
+@app.get("/jobs/{job_id}")
+async def get_analysis_job(job_id: str, current_user: str = Depends(get_current_user)):
+    """Job status and the per-symbol results completed so far."""
+    return get_own_job(job_id, current_user)
+
+@app.get("/jobs/{job_id}/stream")
+async def stream_analysis_job(job_id: str, request: Request, after: int = 0, current_user: str = Depends(get_current_user)):
+    """Server-sent events: one `result` event per symbol as it completes, then `done`.
+
+    Reconnecting clients resume via the Last-Event-ID header (or `after`)."""
+    get_own_job(job_id, current_user)
+    last_event_id = request.headers.get("last-event-id")
+    sent = int(last_event_id) if last_event_id and last_event_id.isdigit() else max(after, 0)
+
+    async def events():
+        nonlocal sent
+        while True:
+            job = batch_jobs.get(job_id)
+            for result in job["results"][sent:]:
+                sent += 1
+                yield f"id: {sent}\nevent: result\ndata: {json.dumps(result)}\n\n"
+            if job["status"] in FINISHED:
+                summary = {"status": job["status"], "completed": len(job["results"])}
+                yield f"event: done\ndata: {json.dumps(summary)}\n\n"
+                return
+            if await request.is_disconnected():
+                return
+            await asyncio.sleep(0.5)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.get("/agent/session")
+async def get_chat_session(current_user: str = Depends(get_current_user)):
+    """Turn count and token usage of the user's conversation."""
+    agent_instance = await asyncio.to_thread(get_agent)
+    info = agent_instance.session_info(current_user)
+    return info or {"turns": 0}
+
+@app.delete("/agent/session")
+def reset_chat_session(current_user: str = Depends(get_current_user)):
+    """Starts a new conversation for the user."""
+    get_agent().reset_session(current_user)
+    return {"message": "Conversation cleared"}
+
 
 @app.get("/watchlist")
 async def get_watchlist(current_user: str = Depends(get_current_user)):
     return watchlist_db.get(current_user, [])
 
 @app.post("/watchlist")
-async def add_to_watchlist(symbol: str, current_user: str = Depends(get_current_user)):
+def add_to_watchlist(symbol: str, current_user: str = Depends(get_current_user)):
+    """Adds a symbol to the user's watchlist (and the snapshot). Runs in threadpool."""
+    symbol, = check_symbols([symbol])
     if current_user not in watchlist_db:
         watchlist_db[current_user] = []
     if symbol not in watchlist_db[current_user]:
         watchlist_db[current_user].append(symbol)
+        snapshot.track([symbol])
+        alert_engine.invalidate()
     return {"message": "Symbol added"}
+
+@app.get("/alerts/rules")
+def list_alert_rules(current_user: str = Depends(get_current_user)):
+    """The user's alert rules. Runs in threadpool: the engine's lock is held during evaluation."""
+    return alert_engine.rules(current_user)
+
+@app.post("/alerts/rules", status_code=status.HTTP_201_CREATED)
+def create_alert_rule(rule: AlertRuleRequest, current_user: str = Depends(get_current_user)):
+    """Adds an alert rule over snapshot fields, e.g. rsi > 70 or price < sma_50. Runs in threadpool."""
+    symbol = check_symbols([rule.symbol])[0] if rule.symbol else None
+    try:
+        created = alert_engine.add_rule(
+            current_user, rule.field, rule.op, value=rule.value, other=rule.other, symbol=symbol
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if created["symbol"]:
+        snapshot.track([created["symbol"]])
+    return created
+
+@app.delete("/alerts/rules/{rule_id}")
+def delete_alert_rule(rule_id: str, current_user: str = Depends(get_current_user)):
+    """Removes a rule and rewrites the alerts file. Runs in threadpool."""
+    if not alert_engine.remove_rule(current_user, rule_id):
+        raise HTTPException(status_code=404, detail="Rule not found")
+    return {"message": "Rule deleted"}
+
+@app.get("/alerts")
+def list_alerts(after: int = 0, current_user: str = Depends(get_current_user)):
+    """Recent alerts, oldest first; `after` skips those already seen. Runs in threadpool."""
+    return alert_engine.alerts(current_user, after)
+
+@app.get("/alerts/stream")
+async def stream_alerts(request: Request, after: int = 0, current_user: str = Depends(get_current_user)):
+    """Server-sent `alert` events as rules fire.
+
+    Reconnecting clients first get what they missed via the Last-Event-ID header (or `after`)."""
+    last_event_id = request.headers.get("last-event-id")
+    sent = int(last_event_id) if last_event_id and last_event_id.isdigit() else max(after, 0)
+    queue = alert_engine.subscribe(current_user)
+
+    async def events():
+        nonlocal sent
+        try:
+            for alert in await asyncio.to_thread(alert_engine.alerts, current_user, sent):
+                sent = alert["id"]
+                yield f"id: {sent}\nevent: alert\ndata: {json.dumps(alert)}\n\n"
+            while not await request.is_disconnected():
+                try:
+                    alert = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    # Keeps proxies from closing an idle stream
+                    yield ": keep-alive\n\n"
+                    continue
+                if alert["id"] > sent:
+                    sent = alert["id"]
+                    yield f"id: {sent}\nevent: alert\ndata: {json.dumps(alert)}\n\n"
+        finally:
+            alert_engine.unsubscribe(current_user, queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.post("/portfolio/risk")
+def portfolio_risk(request: PortfolioRiskRequest, current_user: str = Depends(get_current_user)):
+    """Risk and correlation report for the given holdings, or the user's watchlist. Runs in threadpool."""
+    holdings = request.holdings
+    if not holdings:
+        watchlist = watchlist_db.get(current_user, [])
+        if not watchlist:
+            raise HTTPException(status_code=400, detail="No holdings given and the watchlist is empty")
+        holdings = {symbol: 1.0 for symbol in watchlist}
+    try:
+        report = portfolio.analyze(holdings, benchmark=request.benchmark, period=request.period)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if request.include_correlation:
+        report["correlation"] = report["correlation"].round(4).tolist()
+    else:
+        del report["correlation"]
+    return report
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 class UserBase(BaseModel):
     username: str
@@ -25,3 +25,21 @@ class WatchlistItem(WatchlistBase):
 
 class ChatMessage(BaseModel):
     message: str
+
+class PortfolioRiskRequest(BaseModel):
+    holdings: Optional[Dict[str, float]] = None  # symbol -> weight; defaults to the watchlist, equally weighted
+    benchmark: str = "^GSPC"
+    period: str = "1y"
+    include_correlation: bool = False
+
+class AnalyzeJobRequest(BaseModel):
+    symbols: Optional[List[str]] = None
+    use_watchlist: bool = False  # analyze the user's watchlist (added to any symbols given)
+    prompt: Optional[str] = None  # must contain "{symbol}"; defaults to "Analyze {symbol}"
+
+class AlertRuleRequest(BaseModel):
+    field: str  # snapshot field, e.g. "rsi", "price", "macd_bullish"
+    op: str  # one of > >= < <= == !=
+    value: Optional[float] = None
+    other: Optional[str] = None  # compare with another field instead of a value, e.g. "sma_50"
+    symbol: Optional[str] = None  # defaults to every symbol on the watchlist
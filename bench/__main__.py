@@ -0,0 +1,88 @@
+"""
+Offline benchmark suite.
+
+    python -m bench                                   # all scenarios, concurrency 1
+    python -m bench -s technical_summary,market_chart -c 1,8,32 -n 500
+    python -m bench --save-baseline bench/baseline.json
+    python -m bench --baseline bench/baseline.json --tolerance 0.2
+
+Exits with status 1 when any result regresses past the tolerance.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# api.main resolves users.json and web/ relative to the working directory
+os.chdir(ROOT)
+
+from bench import fake_upstream
+
+fake_upstream.install()
+
+from bench import harness
+from bench.scenarios import SCENARIOS
+
+
+async def run_scenario(name: str, concurrency_levels, iterations: int, warmup: int):
+    scenario = SCENARIOS[name]()
+    await scenario.setup()
+    results = []
+    try:
+        for concurrency in concurrency_levels:
+            latencies, errors, wall = await harness.measure(
+                scenario.call, scenario.is_async, iterations, concurrency, warmup
+            )
+            results.append(harness.summarize(name, concurrency, latencies, errors, wall))
+    finally:
+        await scenario.teardown()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the offline StockGuru benchmark suite.")
+    parser.add_argument("-s", "--scenarios", default=",".join(SCENARIOS),
+                        help=f"Comma-separated scenarios ({', '.join(SCENARIOS)})")
+    parser.add_argument("-c", "--concurrency", default="1", help="Comma-separated concurrency levels")
+    parser.add_argument("-n", "--iterations", type=int, default=100, help="Measured calls per level")
+    parser.add_argument("-w", "--warmup", type=int, default=5, help="Unmeasured warm-up calls")
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    parser.add_argument("--save-baseline", metavar="PATH", help="Save results as the new baseline")
+    parser.add_argument("--baseline", metavar="PATH", help="Compare results against this baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed regression fraction (default 0.2)")
+    args = parser.parse_args(argv)
+
+    names = [n.strip() for n in args.scenarios.split(",") if n.strip()]
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(unknown)}")
+    levels = [int(c) for c in args.concurrency.split(",")]
+
+    results = []
+    for name in names:
+        print(f"Running {name}...", file=sys.stderr)
+        results.extend(asyncio.run(run_scenario(name, levels, args.iterations, args.warmup)))
+
+    print(harness.format_table(results))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        harness.save_baseline(args.save_baseline, results)
+        print(f"Baseline saved to {args.save_baseline}")
+    if args.baseline:
+        regressions = harness.compare(results, args.baseline, args.tolerance)
+        if regressions:
+            print("\nRegressions:")
+            for line in regressions:
+                print(f"- {line}")
+            return 1
+        print("\nNo regressions against baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
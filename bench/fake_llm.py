@@ -0,0 +1,60 @@
+"""
+Deterministic stand-in for the Gemini model used in benchmarks.
+
+On the first turn it requests the analysis tools the advisor prompt prescribes
+(technical summary, news, profile) for the symbol found in the message; once
+the tool responses come back it returns a fixed-size synthesized answer. An
+optional per-turn delay models LLM latency without a network.
+"""
+import asyncio
+import re
+from typing import AsyncGenerator
+
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_response import LlmResponse
+from google.genai import types
+
+_SYMBOL_RE = re.compile(r"\$?\b([A-Z]{1,5}|\^[A-Z]{2,6})\b")
+
+ANALYSIS_TOOLS = ("get_technical_summary", "get_stock_news", "get_stock_profile")
+
+
+def _message_text(content) -> str:
+    return " ".join(p.text for p in (content.parts or []) if getattr(p, "text", None))
+
+
+class FakeLlm(BaseLlm):
+    model: str = "fake-llm"
+    turn_latency: float = 0.0
+
+    @classmethod
+    def supported_models(cls) -> list:
+        return [r"fake-.*"]
+
+    async def generate_content_async(self, llm_request, stream: bool = False) -> AsyncGenerator[LlmResponse, None]:
+        if self.turn_latency:
+            await asyncio.sleep(self.turn_latency)
+
+        contents = llm_request.contents or []
+        last = contents[-1] if contents else None
+        answered = last is not None and any(getattr(p, "function_response", None) for p in (last.parts or []))
+
+        if not answered:
+            user_text = next((_message_text(c) for c in reversed(contents) if c.role == "user"), "")
+            match = _SYMBOL_RE.search(user_text)
+            symbol = match.group(1) if match else "AAPL"
+            available = set(getattr(llm_request, "tools_dict", {}) or {})
+            calls = [
+                types.Part(function_call=types.FunctionCall(name=name, args={"symbol": symbol}))
+                for name in ANALYSIS_TOOLS if not available or name in available
+            ]
+            if calls:
+                yield LlmResponse(content=types.Content(role="model", parts=calls))
+                return
+
+        tool_chars = sum(
+            len(str(p.function_response.response)) for c in contents for p in (c.parts or [])
+            if getattr(p, "function_response", None)
+        )
+        text = f"Recommendation: HOLD. Synthesized from {tool_chars} characters of tool output."
+        yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=text)]))
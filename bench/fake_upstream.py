@@ -0,0 +1,128 @@
+"""
+Offline stand-ins for the ``yfinance`` and ``ddgs`` modules.
+
+``install()`` registers both fakes in ``sys.modules`` so that code importing
+``yfinance``/``ddgs`` afterwards transparently replays the fixtures from
+``bench.fixtures``. ``BENCH_UPSTREAM_LATENCY_MS`` adds a fixed delay per call to
+mimic network round-trips.
+"""
+import os
+import sys
+import time
+import types
+
+import pandas as pd
+
+from bench import fixtures
+
+INTRADAY = {"1m": "1min", "2m": "2min", "5m": "5min", "15m": "15min", "30m": "30min",
+            "60m": "60min", "90m": "90min", "1h": "60min"}
+
+PERIOD_DAYS = {"1d": 1, "5d": 5, "1mo": 30, "3mo": 91, "6mo": 182, "1y": 365, "2y": 730,
+               "5y": 1826, "10y": 3652, "60d": 60, "7d": 7, "730d": 730}
+
+
+def _latency():
+    ms = float(os.environ.get("BENCH_UPSTREAM_LATENCY_MS", "0"))
+    if ms > 0:
+        time.sleep(ms / 1000.0)
+
+
+def _frame(bars: dict, tz: str) -> pd.DataFrame:
+    index = pd.to_datetime(bars["index"], unit="s", utc=True).tz_convert(tz)
+    df = pd.DataFrame({c: bars[c] for c in fixtures.BAR_COLUMNS}, index=index)
+    df.index.name = "Date"
+    return df
+
+
+def _timestamp(value, tz: str) -> pd.Timestamp:
+    ts = pd.Timestamp(value)
+    return ts.tz_localize(tz) if ts.tz is None else ts
+
+
+def _resample(df: pd.DataFrame, rule: str, **kwargs) -> pd.DataFrame:
+    out = df.resample(rule, **kwargs).agg({
+        "Open": "first", "High": "max", "Low": "min", "Close": "last",
+        "Volume": "sum", "Dividends": "sum", "Stock Splits": "sum",
+    })
+    return out.dropna(subset=["Close"])
+
+
+class Ticker:
+    def __init__(self, symbol: str, session=None):
+        self.ticker = symbol.upper()
+        self._fixture = fixtures.load(self.ticker)
+
+    def history(self, period: str = "1mo", interval: str = "1d", start=None, end=None, **kwargs) -> pd.DataFrame:
+        _latency()
+        recorded = self._fixture["history"]
+        tz = self._fixture.get("timezone", "America/New_York")
+        if interval in recorded:
+            df = _frame(recorded[interval], tz)
+        elif interval in INTRADAY and "5m" in recorded:
+            df = _resample(_frame(recorded["5m"], tz), INTRADAY[interval])
+        elif interval == "1wk":
+            df = _resample(_frame(recorded["1d"], tz), "W-MON", label="left", closed="left")
+        elif interval == "1mo":
+            df = _resample(_frame(recorded["1d"], tz), "MS")
+        else:
+            df = _frame(recorded["1d"], tz)
+
+        if df.empty:
+            return df
+        if start is not None or end is not None:
+            if start is not None:
+                df = df[df.index >= _timestamp(start, tz)]
+            if end is not None:
+                df = df[df.index < _timestamp(end, tz)]
+            return df.copy()
+        if period == "max":
+            return df.copy()
+        if period == "ytd":
+            return df[df.index >= df.index[-1].replace(month=1, day=1, hour=0, minute=0, second=0)].copy()
+        if interval == "1d" and period.endswith("d"):
+            return df.iloc[-int(period[:-1]):].copy()
+        days = PERIOD_DAYS.get(period, 30)
+        return df[df.index > df.index[-1] - pd.Timedelta(days=days)].copy()
+
+    @property
+    def info(self) -> dict:
+        _latency()
+        return dict(self._fixture.get("info", {}))
+
+    @property
+    def news(self) -> list:
+        _latency()
+        return list(self._fixture.get("news", []))
+
+
+class DDGS:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def text(self, query: str, max_results: int = 5, **kwargs) -> list:
+        _latency()
+        slug = "-".join(query.lower().split())
+        return [
+            {"title": f"Result {i} for {query}", "href": f"https://search.example.com/{slug}/{i}",
+             "body": f"Synthetic search snippet {i} about {query}."}
+            for i in range(max_results)
+        ]
+
+
+def install():
+    """Replaces the real upstream client modules with the offline fakes."""
+    yf = types.ModuleType("yfinance")
+    yf.Ticker = Ticker
+    yf.__fake__ = True
+    ddgs = types.ModuleType("ddgs")
+    ddgs.DDGS = DDGS
+    ddgs.__fake__ = True
+    sys.modules["yfinance"] = yf
+    sys.modules["ddgs"] = ddgs
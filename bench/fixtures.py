@@ -0,0 +1,167 @@
+"""
+Recorded market fixtures for benchmarks.
+
+A fixture is one JSON file per symbol holding OHLCV bars, the ``info`` dict and
+the ``news`` list exactly as yfinance returned them. Record real data once with
+
+    python -m bench.fixtures record AAPL MSFT ^GSPC
+
+and the offline yfinance stand-in replays it. Symbols without a recording get a
+deterministic synthetic series so the suite always runs without network access.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+from datetime import datetime, timedelta, timezone
+
+FIXTURE_DIR = os.environ.get("BENCH_FIXTURE_DIR", os.path.join(os.path.dirname(__file__), "fixtures"))
+
+DEFAULT_SYMBOLS = ["AAPL", "MSFT", "NVDA", "TSLA", "SPY", "VTI", "^GSPC", "^DJI", "^IXIC", "^RUT"]
+
+BAR_COLUMNS = ["Open", "High", "Low", "Close", "Volume", "Dividends", "Stock Splits"]
+
+_cache = {}
+
+
+def _path(symbol: str) -> str:
+    return os.path.join(FIXTURE_DIR, symbol.replace("^", "_").upper() + ".json")
+
+
+def load(symbol: str) -> dict:
+    """Returns the fixture for ``symbol``, synthesizing one if none was recorded."""
+    symbol = symbol.upper()
+    fixture = _cache.get(symbol)
+    if fixture is None:
+        path = _path(symbol)
+        if os.path.exists(path):
+            with open(path) as f:
+                fixture = json.load(f)
+        else:
+            fixture = synthesize(symbol)
+        _cache[symbol] = fixture
+    return fixture
+
+
+def synthesize(symbol: str, days: int = 2520, intraday_days: int = 30) -> dict:
+    """Builds a deterministic random-walk fixture seeded by the symbol name."""
+    rng = random.Random(symbol)
+    price = rng.uniform(20, 500)
+    drift = rng.uniform(-0.0002, 0.0008)
+    vol = rng.uniform(0.01, 0.03)
+
+    daily = {"index": [], **{c: [] for c in BAR_COLUMNS}}
+    day = datetime(2024, 1, 1, tzinfo=timezone.utc) - timedelta(days=int(days * 7 / 5))
+    while len(daily["index"]) < days:
+        day += timedelta(days=1)
+        if day.weekday() >= 5:
+            continue
+        open_ = price
+        price = max(1.0, price * math.exp(drift + vol * rng.gauss(0, 1)))
+        high = max(open_, price) * (1 + abs(rng.gauss(0, vol / 3)))
+        low = min(open_, price) * (1 - abs(rng.gauss(0, vol / 3)))
+        daily["index"].append(int(day.replace(hour=14, minute=30).timestamp()))
+        daily["Open"].append(round(open_, 4))
+        daily["High"].append(round(high, 4))
+        daily["Low"].append(round(low, 4))
+        daily["Close"].append(round(price, 4))
+        daily["Volume"].append(int(rng.uniform(1e6, 5e7)))
+        daily["Dividends"].append(0.0)
+        daily["Stock Splits"].append(0.0)
+
+    # 5-minute bars for the trailing sessions (78 bars per regular session)
+    intraday = {"index": [], **{c: [] for c in BAR_COLUMNS}}
+    price = daily["Close"][-intraday_days - 1]
+    for ts in daily["index"][-intraday_days:]:
+        for i in range(78):
+            open_ = price
+            price = max(1.0, price * math.exp(vol / 9 * rng.gauss(0, 1)))
+            intraday["index"].append(ts + i * 300)
+            intraday["Open"].append(round(open_, 4))
+            intraday["High"].append(round(max(open_, price) * 1.0005, 4))
+            intraday["Low"].append(round(min(open_, price) * 0.9995, 4))
+            intraday["Close"].append(round(price, 4))
+            intraday["Volume"].append(int(rng.uniform(1e4, 5e5)))
+            intraday["Dividends"].append(0.0)
+            intraday["Stock Splits"].append(0.0)
+
+    is_index = symbol.startswith("^")
+    return {
+        "symbol": symbol,
+        "timezone": "America/New_York",
+        "history": {"1d": daily, "5m": intraday},
+        "info": {
+            "symbol": symbol,
+            "shortName": symbol,
+            "longName": f"{symbol} Synthetic Corp",
+            "quoteType": "INDEX" if is_index else "EQUITY",
+            "sector": "Technology",
+            "industry": "Software",
+            "category": "Large Blend",
+            "longBusinessSummary": f"{symbol} is a synthetic company used for offline benchmarks. " * 20,
+            "currentPrice": daily["Close"][-1],
+            "dayHigh": daily["High"][-1],
+            "dayLow": daily["Low"][-1],
+            "fiftyTwoWeekHigh": max(daily["High"][-252:]),
+            "fiftyTwoWeekLow": min(daily["Low"][-252:]),
+            "volume": daily["Volume"][-1],
+            "averageVolume": int(sum(daily["Volume"][-60:]) / 60),
+            "marketCap": int(daily["Close"][-1] * 1e9),
+            "trailingPE": round(rng.uniform(8, 60), 2),
+            "totalAssets": int(rng.uniform(1e9, 1e11)),
+            "annualReportExpenseRatio": 0.0003,
+        },
+        "news": [
+            {"content": {
+                "title": f"{symbol} headline {i}",
+                "canonicalUrl": {"url": f"https://news.example.com/{symbol.lower()}/{i}"},
+            }}
+            for i in range(10)
+        ],
+    }
+
+
+def record(symbols, periods=(("1d", "10y"), ("5m", "60d"))):
+    """Fetches live data with yfinance and writes one fixture file per symbol."""
+    import yfinance as yf
+
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    for symbol in symbols:
+        ticker = yf.Ticker(symbol)
+        history = {}
+        tz = "America/New_York"
+        for interval, period in periods:
+            df = ticker.history(period=period, interval=interval)
+            if df.empty:
+                continue
+            tz = str(df.index.tz or tz)
+            bars = {"index": [int(ts.timestamp()) for ts in df.index]}
+            for column in BAR_COLUMNS:
+                bars[column] = [float(v) for v in df[column]] if column in df else [0.0] * len(df)
+            history[interval] = bars
+        fixture = {
+            "symbol": symbol.upper(),
+            "timezone": tz,
+            "history": history,
+            "info": ticker.info,
+            "news": ticker.news,
+        }
+        with open(_path(symbol), "w") as f:
+            json.dump(fixture, f, default=str)
+        print(f"Recorded {symbol}: " + ", ".join(f"{k}={len(v['index'])} bars" for k, v in history.items()))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Record benchmark fixtures from live yfinance data.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rec = sub.add_parser("record", help="Record live fixtures (requires network)")
+    rec.add_argument("symbols", nargs="*", default=DEFAULT_SYMBOLS)
+    args = parser.parse_args(argv)
+    if args.command == "record":
+        record(args.symbols)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
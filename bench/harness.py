@@ -0,0 +1,120 @@
+"""
+Latency/throughput measurement and baseline comparison for benchmark scenarios.
+"""
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def percentile(sorted_values, q: float) -> float:
+    """Linear-interpolated percentile of an already sorted list (q in 0..100)."""
+    if not sorted_values:
+        return 0.0
+    pos = (len(sorted_values) - 1) * q / 100.0
+    lo = int(pos)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (pos - lo)
+
+
+def summarize(name: str, concurrency: int, latencies, errors: int, wall: float) -> dict:
+    values = sorted(latencies)
+    completed = len(values)
+    return {
+        "scenario": name,
+        "concurrency": concurrency,
+        "iterations": completed + errors,
+        "errors": errors,
+        "throughput": completed / wall if wall > 0 else 0.0,
+        "mean": sum(values) / completed if completed else 0.0,
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+    }
+
+
+async def measure(call, is_async: bool, iterations: int, concurrency: int, warmup: int = 0):
+    """Runs ``call`` ``iterations`` times with at most ``concurrency`` in flight.
+
+    Sync callables run on a dedicated thread pool sized to ``concurrency`` so
+    they never block the event loop. Returns (latencies, errors, wall_seconds).
+    """
+    pool = None if is_async else ThreadPoolExecutor(max_workers=concurrency)
+    loop = asyncio.get_running_loop()
+
+    async def invoke():
+        if is_async:
+            return await call()
+        return await loop.run_in_executor(pool, call)
+
+    try:
+        for _ in range(warmup):
+            await invoke()
+
+        latencies = []
+        errors = 0
+        remaining = iterations
+
+        async def worker():
+            nonlocal remaining, errors
+            while remaining > 0:
+                remaining -= 1
+                start = time.perf_counter()
+                try:
+                    await invoke()
+                    latencies.append(time.perf_counter() - start)
+                except Exception:
+                    errors += 1
+
+        wall_start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return latencies, errors, time.perf_counter() - wall_start
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+
+def result_key(result: dict) -> str:
+    return f"{result['scenario']}@{result['concurrency']}"
+
+
+def save_baseline(path: str, results):
+    with open(path, "w") as f:
+        json.dump({"results": {result_key(r): r for r in results}}, f, indent=2)
+
+
+def compare(results, baseline_path: str, tolerance: float):
+    """Returns a list of human-readable regressions against a saved baseline.
+
+    A result regresses when its p95 latency grows, or its throughput drops, by
+    more than ``tolerance`` (a fraction) relative to the baseline entry.
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f).get("results", {})
+    regressions = []
+    for result in results:
+        base = baseline.get(result_key(result))
+        if not base:
+            continue
+        if base["p95"] > 0 and result["p95"] > base["p95"] * (1 + tolerance):
+            regressions.append(
+                f"{result_key(result)}: p95 {result['p95'] * 1000:.2f}ms vs baseline {base['p95'] * 1000:.2f}ms"
+            )
+        if base["throughput"] > 0 and result["throughput"] < base["throughput"] * (1 - tolerance):
+            regressions.append(
+                f"{result_key(result)}: throughput {result['throughput']:.1f}/s vs baseline {base['throughput']:.1f}/s"
+            )
+        if result["errors"] > base.get("errors", 0):
+            regressions.append(f"{result_key(result)}: {result['errors']} errors vs baseline {base.get('errors', 0)}")
+    return regressions
+
+
+def format_table(results) -> str:
+    header = f"{'scenario':<28}{'conc':>6}{'iters':>8}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    lines = [header, "-" * len(header)]
+    for r in results:
+        lines.append(
+            f"{r['scenario']:<28}{r['concurrency']:>6}{r['iterations']:>8}{r['errors']:>8}"
+            f"{r['throughput']:>10.1f}{r['p50'] * 1000:>10.2f}{r['p95'] * 1000:>10.2f}{r['p99'] * 1000:>10.2f}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,265 @@
+"""
+Load-test mode: synthetic users against an in-process API with stubbed upstreams.
+
+    python -m bench.loadtest --users 50 --levels 1,4,16,64 --duration 10 \\
+        --mix chart=5,indexes=2,watchlist=2,chat=1
+
+Each synthetic user is registered and logged in through the real auth flow,
+then at every concurrency level that many virtual users loop over requests
+drawn from the traffic mix. For each level the report shows throughput,
+latency percentiles, error rate, event-loop lag and threadpool utilization,
+and the first level where the node saturates (and why).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+from bench import fake_upstream
+
+fake_upstream.install()
+
+from bench import harness
+from bench.scenarios import EQUITIES, STUB_SERVER_PATH
+
+DEFAULT_MIX = "chart=5,indexes=2,watchlist=2,chat=1"
+
+# A level is saturated when adding load no longer buys throughput, or when
+# latency/errors degrade past these limits.
+MIN_THROUGHPUT_GAIN = 0.10
+MAX_ERROR_RATE = 0.01
+LOOP_LAG_LIMIT = 0.1
+THREADPOOL_BUSY_LIMIT = 0.95
+
+
+def parse_mix(spec: str) -> dict:
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ("chart", "indexes", "watchlist", "chat"):
+            raise ValueError(f"Unknown traffic type: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def prepare_app(llm_latency: float, with_agent: bool):
+    """Imports the app with isolated user storage and a stubbed agent."""
+    import api.main
+    from agent.orchestrator import AdvisorAgent
+    from bench.fake_llm import FakeLlm
+
+    api.main.USERS_FILE = os.path.join(tempfile.mkdtemp(prefix="loadtest_"), "users.json")
+    api.main.users_db.clear()
+    api.main.watchlist_db.clear()
+    if with_agent:
+        api.main.agent = AdvisorAgent(model_instance=FakeLlm(turn_latency=llm_latency), server_path=STUB_SERVER_PATH)
+    return api.main.app
+
+
+class Sampler:
+    """Samples event-loop lag and threadpool occupancy while a level runs."""
+
+    def __init__(self, interval: float = 0.02):
+        self.interval = interval
+        self.max_lag = 0.0
+        self.busy_samples = []
+        self._task = None
+
+    async def _run(self):
+        import anyio.to_thread
+
+        limiter = anyio.to_thread.current_default_thread_limiter()
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.max_lag = max(self.max_lag, time.perf_counter() - start - self.interval)
+            self.busy_samples.append(limiter.borrowed_tokens / limiter.total_tokens)
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    @property
+    def threadpool_busy(self) -> float:
+        return sum(self.busy_samples) / len(self.busy_samples) if self.busy_samples else 0.0
+
+
+class LoadTest:
+    def __init__(self, client, mix: dict, seed: int = 0):
+        self.client = client
+        self.mix_names = list(mix)
+        self.mix_weights = [mix[n] for n in self.mix_names]
+        self.rng = random.Random(seed)
+        self.tokens = []
+
+    async def create_users(self, count: int, concurrency: int = 8):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def create(i):
+            username, password = f"loaduser{i}", f"secret-{i}"
+            async with semaphore:
+                response = await self.client.post("/auth/register", json={"username": username, "password": password})
+                response.raise_for_status()
+                response = await self.client.post("/auth/token", data={"username": username, "password": password})
+                response.raise_for_status()
+                return response.json()["access_token"]
+
+        self.tokens = await asyncio.gather(*(create(i) for i in range(count)))
+
+    async def request(self, kind: str, token: str):
+        headers = {"Authorization": f"Bearer {token}"}
+        symbol = self.rng.choice(EQUITIES)
+        if kind == "chart":
+            return await self.client.get(f"/market/chart/{symbol}?period=1mo")
+        if kind == "indexes":
+            return await self.client.get("/market/indexes?country=US")
+        if kind == "watchlist":
+            if self.rng.random() < 0.3:
+                return await self.client.post(f"/watchlist?symbol={symbol}", headers=headers)
+            return await self.client.get("/watchlist", headers=headers)
+        return await self.client.post("/agent/chat", json={"message": f"Analyze {symbol}"}, headers=headers)
+
+    async def run_level(self, concurrency: int, duration: float) -> dict:
+        latencies, by_kind = [], {}
+        errors = 0
+        deadline = time.perf_counter() + duration
+
+        async def virtual_user(i):
+            nonlocal errors
+            token = self.tokens[i % len(self.tokens)]
+            while time.perf_counter() < deadline:
+                kind = self.rng.choices(self.mix_names, self.mix_weights)[0]
+                start = time.perf_counter()
+                try:
+                    response = await self.request(kind, token)
+                    # /agent/chat reports agent failures with a 200 and an error string
+                    ok = response.status_code < 400 and not (
+                        kind == "chat" and any(m in response.text[:60] for m in ("Error", "Advisor failed"))
+                    )
+                except Exception:
+                    ok = False
+                elapsed = time.perf_counter() - start
+                if ok:
+                    latencies.append(elapsed)
+                    by_kind.setdefault(kind, []).append(elapsed)
+                else:
+                    errors += 1
+
+        sampler = Sampler()
+        sampler.start()
+        wall_start = time.perf_counter()
+        await asyncio.gather(*(virtual_user(i) for i in range(concurrency)))
+        wall = time.perf_counter() - wall_start
+        await sampler.stop()
+
+        result = harness.summarize("mixed", concurrency, latencies, errors, wall)
+        result["error_rate"] = errors / result["iterations"] if result["iterations"] else 0.0
+        result["loop_lag_max"] = sampler.max_lag
+        result["threadpool_busy"] = sampler.threadpool_busy
+        result["by_kind"] = {
+            kind: {"count": len(values), "p95": harness.percentile(sorted(values), 95)}
+            for kind, values in by_kind.items()
+        }
+        return result
+
+
+def find_saturation(curve):
+    """Returns (level, reason) for the first saturated level, or (None, None)."""
+    previous = None
+    for point in curve:
+        reasons = []
+        if point["error_rate"] > MAX_ERROR_RATE:
+            reasons.append(f"error rate {point['error_rate']:.1%}")
+        if point["threadpool_busy"] >= THREADPOOL_BUSY_LIMIT:
+            reasons.append(f"threadpool {point['threadpool_busy']:.0%} busy")
+        if point["loop_lag_max"] > LOOP_LAG_LIMIT:
+            reasons.append(f"event loop stalled {point['loop_lag_max'] * 1000:.0f}ms")
+        if previous and previous["throughput"] > 0:
+            gain = point["throughput"] / previous["throughput"] - 1
+            if gain < MIN_THROUGHPUT_GAIN:
+                reasons.append(f"throughput gain {gain:+.0%}, p99 {previous['p99'] * 1000:.0f}->{point['p99'] * 1000:.0f}ms")
+        if reasons:
+            return point["concurrency"], "; ".join(reasons)
+        previous = point
+    return None, None
+
+
+def format_curve(curve) -> str:
+    header = f"{'users':>6}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>9}{'loop lag':>10}{'pool busy':>11}"
+    lines = [header, "-" * len(header)]
+    for p in curve:
+        lines.append(
+            f"{p['concurrency']:>6}{p['throughput']:>10.1f}{p['p50'] * 1000:>10.1f}{p['p95'] * 1000:>10.1f}"
+            f"{p['p99'] * 1000:>10.1f}{p['error_rate']:>9.1%}{p['loop_lag_max'] * 1000:>8.0f}ms{p['threadpool_busy']:>11.0%}"
+        )
+    return "\n".join(lines)
+
+
+async def run(args) -> list:
+    import httpx
+
+    mix = parse_mix(args.mix)
+    app = prepare_app(args.llm_latency_ms / 1000.0, with_agent=mix.get("chat", 0) > 0)
+    # ASGITransport sends no lifespan events, which keeps the snapshot refresher and batch
+    # resumption (live upstream calls, writes under data/) out of the run. The shutdown
+    # half is still needed to stop the scheduler and the stub agent's MCP server.
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://loadtest",
+                                     timeout=args.timeout) as client:
+            test = LoadTest(client, mix, seed=args.seed)
+            print(f"Registering {args.users} synthetic users...", file=sys.stderr)
+            await test.create_users(args.users)
+            curve = []
+            for level in args.levels:
+                print(f"Running {level} concurrent users for {args.duration}s...", file=sys.stderr)
+                curve.append(await test.run_level(level, args.duration))
+            return curve
+    finally:
+        import api.main
+
+        await asyncio.to_thread(api.main.shutdown_services)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the API in-process with synthetic users.")
+    parser.add_argument("--users", type=int, default=20, help="Synthetic users to register and log in")
+    parser.add_argument("--levels", default="1,2,4,8,16,32,64",
+                        type=lambda s: [int(x) for x in s.split(",")], help="Concurrency levels to step through")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per level")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Traffic ratios (default {DEFAULT_MIX})")
+    parser.add_argument("--llm-latency-ms", type=float, default=500.0, help="Simulated LLM turn latency")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request client timeout")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the saturation curve as JSON to this path")
+    args = parser.parse_args(argv)
+
+    curve = asyncio.run(run(args))
+    print(format_curve(curve))
+    level, reason = find_saturation(curve)
+    if level is None:
+        print("\nNo saturation observed up to the highest level tested.")
+    else:
+        print(f"\nSaturation at {level} concurrent users: {reason}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"curve": curve, "saturation": {"level": level, "reason": reason}}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,21 @@
+"""
+Launches the stock_data MCP server with the offline upstream fakes installed.
+
+Used in place of ``servers/stock_data/mcp_server.py`` by benchmarks so the MCP
+round-trip is measured without touching the network.
+"""
+import os
+import runpy
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench import fake_upstream
+
+fake_upstream.install()
+
+SERVER_PATH = os.path.join(ROOT, "servers", "stock_data", "mcp_server.py")
+
+if __name__ == "__main__":
+    runpy.run_path(SERVER_PATH, run_name="__main__")
@@ -0,0 +1,187 @@
+"""
+Benchmark scenarios. Each scenario is set up once per run and exposes a
+``call`` (sync or async) that performs one measured operation.
+
+``bench.fake_upstream.install()`` must run before this module imports any
+application code, so every scenario replays fixtures instead of hitting Yahoo.
+"""
+import asyncio
+import importlib.util
+import itertools
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER_PATH = os.path.join(ROOT, "servers", "stock_data", "mcp_server.py")
+STUB_SERVER_PATH = os.path.join(ROOT, "bench", "mcp_stub_server.py")
+
+EQUITIES = ["AAPL", "MSFT", "NVDA", "TSLA"]
+
+_server_module = None
+
+
+def load_server():
+    """Imports the MCP server module in-process (its tools are plain functions)."""
+    global _server_module
+    if _server_module is None:
+        spec = importlib.util.spec_from_file_location("bench_stock_data_server", SERVER_PATH)
+        _server_module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(_server_module)
+    return _server_module
+
+
+def tool_function(name: str):
+    tool = getattr(load_server(), name)
+    # FastMCP 2.x wraps decorated functions in a Tool object exposing `.fn`
+    return getattr(tool, "fn", tool)
+
+
+class Scenario:
+    name = ""
+    is_async = False
+
+    async def setup(self):
+        pass
+
+    async def teardown(self):
+        pass
+
+
+class TechnicalSummary(Scenario):
+    name = "technical_summary"
+
+    async def setup(self):
+        fn = tool_function("get_technical_summary")
+        symbols = itertools.cycle(EQUITIES)
+        self.call = lambda: fn(symbol=next(symbols))
+
+
+class HistorySerialization(Scenario):
+    name = "history_serialization"
+
+    async def setup(self):
+        fn = tool_function("get_stock_history")
+        symbols = itertools.cycle(EQUITIES)
+        self.call = lambda: fn(symbol=next(symbols), period="1y")
+
+
+class _ApiScenario(Scenario):
+    is_async = True
+
+    async def setup(self):
+        import httpx
+        import api.main
+
+        self.client = httpx.AsyncClient(transport=httpx.ASGITransport(app=api.main.app), base_url="http://bench")
+
+    async def teardown(self):
+        await self.client.aclose()
+
+    async def _get(self, path: str):
+        response = await self.client.get(path)
+        response.raise_for_status()
+        return response
+
+
+class MarketChart(_ApiScenario):
+    name = "market_chart"
+
+    async def setup(self):
+        await super().setup()
+        symbols = itertools.cycle(EQUITIES)
+        self.call = lambda: self._get(f"/market/chart/{next(symbols)}?period=1y")
+
+
+class MarketIndexes(_ApiScenario):
+    name = "market_indexes"
+
+    async def setup(self):
+        await super().setup()
+        self.call = lambda: self._get("/market/indexes?country=US")
+
+
+class McpRoundTrip(Scenario):
+    """One tool call through ``MCPToolAdapter`` over ``transport``, to compare per-call overhead."""
+    name = "mcp_roundtrip"
+    transport = "stdio"
+    is_async = True
+
+    async def setup(self):
+        from agent.mcp_client import MCPToolAdapter
+
+        self.server = None
+        url = None
+        if self.transport == "http":
+            url = await self._start_http_server()
+        self.adapter = MCPToolAdapter(STUB_SERVER_PATH, transport=self.transport, url=url)
+        await self.adapter.start()
+        symbols = itertools.cycle(EQUITIES)
+        self.call = lambda: self.adapter.call_tool("get_stock_history", {"symbol": next(symbols), "period": "1mo"})
+
+    async def _start_http_server(self) -> str:
+        import asyncio
+        import socket
+        import subprocess
+        import sys
+
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        self.server = subprocess.Popen(
+            [sys.executable, STUB_SERVER_PATH, "--transport", "http", "--port", str(port)],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        for _ in range(100):
+            try:
+                _, writer = await asyncio.open_connection("127.0.0.1", port)
+                writer.close()
+                break
+            except OSError:
+                await asyncio.sleep(0.1)
+        else:
+            raise RuntimeError("MCP HTTP server did not start")
+        return f"http://127.0.0.1:{port}/mcp"
+
+    async def teardown(self):
+        await self.adapter.close()
+        if self.server is not None:
+            self.server.terminate()
+            self.server.wait()
+
+
+class McpRoundTripInProcess(McpRoundTrip):
+    name = "mcp_roundtrip_inprocess"
+    transport = "inprocess"
+
+
+class McpRoundTripHttp(McpRoundTrip):
+    name = "mcp_roundtrip_http"
+    transport = "http"
+
+
+class AdvisorRun(Scenario):
+    name = "advisor_run"
+
+    async def setup(self):
+        from agent.orchestrator import AdvisorAgent
+        from bench.fake_llm import FakeLlm
+
+        turn_latency = float(os.environ.get("BENCH_LLM_LATENCY_MS", "0")) / 1000.0
+        self.agent = AdvisorAgent(model_instance=FakeLlm(turn_latency=turn_latency), server_path=STUB_SERVER_PATH)
+        symbols = itertools.cycle(EQUITIES)
+
+        def call():
+            text = self.agent.run(f"Analyze {next(symbols)}")
+            if text.startswith("Advisor failed"):
+                raise RuntimeError(text)
+            return text
+
+        self.call = call
+
+    async def teardown(self):
+        await asyncio.to_thread(self.agent.close)
+
+
+SCENARIOS = {cls.name: cls for cls in (
+    TechnicalSummary, HistorySerialization, MarketChart, MarketIndexes,
+    McpRoundTrip, McpRoundTripInProcess, McpRoundTripHttp, AdvisorRun,
+)}
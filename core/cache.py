@@ -0,0 +1,164 @@
+"""
+Thread-safe TTL cache with LRU bounds, single-flight loading and stale fallback.
+
+Expired entries are kept (up to ``max_stale`` seconds past expiry) so callers
+can fall back to the last good value when the upstream is unavailable.
+
+Given a ``sizeof`` function, the cache also accounts the bytes each entry
+holds and, with ``max_bytes``, evicts least recently used entries to stay
+under that budget.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from core import metrics, tracing
+
+CACHE_REQUESTS = metrics.counter("cache_requests_total", "Cache lookups by result", ["cache", "result"])
+CACHE_ENTRIES = metrics.gauge("cache_entries", "Entries held per cache", ["cache"])
+CACHE_BYTES = metrics.gauge("cache_bytes", "Bytes held per cache, for caches that account sizes", ["cache"])
+
+
+class TTLCache:
+    def __init__(self, name: str, max_entries: int = 1024, max_stale: float = 86400.0,
+                 sizeof=None, max_bytes: int = None):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_stale = max_stale
+        self.sizeof = sizeof
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._data = OrderedDict()  # key -> (value, expires_at)
+        self._sizes = {}  # key -> bytes, when sizeof is given
+        self._lock = threading.Lock()
+        self._loading = {}
+        CACHE_ENTRIES.set_function(lambda: len(self._data), cache=name)
+        if sizeof is not None:
+            CACHE_BYTES.set_function(lambda: self.nbytes, cache=name)
+
+    def __len__(self):
+        return len(self._data)
+
+    def _lookup(self, key, allow_stale: bool):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at >= now:
+                self._data.move_to_end(key)
+                return value
+            if allow_stale and now - expires_at <= self.max_stale:
+                return value
+            if now - expires_at > self.max_stale:
+                self._remove(key)
+            return None
+
+    def get(self, key):
+        """Returns the value if present and fresh, else None."""
+        return self._lookup(key, allow_stale=False)
+
+    def get_stale(self, key):
+        """Returns the value even if expired, as long as it is within ``max_stale``."""
+        return self._lookup(key, allow_stale=True)
+
+    def set(self, key, value, ttl: float):
+        with self._lock:
+            self._store(key, value, time.monotonic() + ttl)
+            self._evict()
+
+    def delete(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self.nbytes = 0
+
+    def sizes(self) -> list:
+        """(key, bytes) for every entry; empty unless the cache was given ``sizeof``."""
+        with self._lock:
+            return list(self._sizes.items())
+
+    def _store(self, key, value, expires_at: float):
+        self._remove(key)
+        self._data[key] = (value, expires_at)
+        if self.sizeof is not None:
+            size = self.sizeof(value)
+            self._sizes[key] = size
+            self.nbytes += size
+
+    def _remove(self, key):
+        if self._data.pop(key, None) is not None:
+            self.nbytes -= self._sizes.pop(key, 0)
+
+    def _evict(self):
+        """Drops least recently used entries beyond the entry and byte limits (lock held)."""
+        while len(self._data) > self.max_entries or (
+            self.max_bytes is not None and self.nbytes > self.max_bytes and len(self._data) > 1
+        ):
+            self._remove(next(iter(self._data)))
+
+    def items(self):
+        with self._lock:
+            return [(key, value) for key, (value, _) in self._data.items()]
+
+    def export(self) -> list:
+        """Entries as (key, value, expires_at_unix) for persistence."""
+        offset = time.time() - time.monotonic()
+        with self._lock:
+            return [(key, value, expires_at + offset) for key, (value, expires_at) in self._data.items()]
+
+    def restore(self, entries):
+        """Loads entries produced by ``export()``, dropping ones too old to serve even stale."""
+        offset = time.time() - time.monotonic()
+        now = time.monotonic()
+        with self._lock:
+            for key, value, expires_unix in entries:
+                expires_at = expires_unix - offset
+                if now - expires_at <= self.max_stale:
+                    self._store(key, value, expires_at)
+            self._evict()
+
+    def get_or_load(self, key, loader, ttl, stale_on_error: bool = True):
+        """Returns a fresh cached value or calls ``loader()`` to produce one.
+
+        Concurrent misses for the same key share a single ``loader`` call. When
+        the loader raises and an expired value is still held, that stale value
+        is returned instead of the error. ``ttl`` may be a callable taking the
+        loaded value, to cache e.g. empty results for less time.
+        """
+        with tracing.span("cache.lookup", cache=self.name) as span:
+            value = self.get(key)
+            span.set_attribute("cache.hit", value is not None)
+        if value is not None:
+            CACHE_REQUESTS.inc(cache=self.name, result="hit")
+            return value
+
+        with self._lock:
+            key_lock = self._loading.setdefault(key, threading.Lock())
+        with key_lock:
+            try:
+                # Another caller may have loaded the value while we waited
+                value = self.get(key)
+                if value is not None:
+                    CACHE_REQUESTS.inc(cache=self.name, result="hit")
+                    return value
+                CACHE_REQUESTS.inc(cache=self.name, result="miss")
+                try:
+                    value = loader()
+                except Exception:
+                    stale = self.get_stale(key) if stale_on_error else None
+                    if stale is None:
+                        raise
+                    CACHE_REQUESTS.inc(cache=self.name, result="stale")
+                    return stale
+                self.set(key, value, ttl(value) if callable(ttl) else ttl)
+                return value
+            finally:
+                with self._lock:
+                    if self._loading.get(key) is key_lock:
+                        del self._loading[key]
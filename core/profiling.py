@@ -0,0 +1,227 @@
+"""
+Event-loop stall detection and a sampling profiler for production processes.
+
+``LoopWatchdog`` runs a heartbeat task on an asyncio loop and a monitor thread;
+when the heartbeat falls behind by more than the threshold, the monitor
+captures the loop thread's stack while it is still blocked and records it with
+a label (the HTTP route or MCP tool found on the stack).
+
+``SamplingProfiler`` samples the stacks of all threads at a fixed interval and
+aggregates them into collapsed ("folded") stacks, the input format of
+flamegraph.pl and speedscope. It either keeps a rolling window in the
+background or samples on demand for a requested number of seconds.
+
+Configuration (environment):
+    LOOP_WATCHDOG_MS: Stall threshold in ms; the watchdog is off when unset.
+    PROFILER_ENABLED: ``1`` keeps a rolling background sample window.
+    PROFILER_INTERVAL_MS: Sampling interval (default 10).
+    PROFILER_WINDOW_SECONDS: Rolling window length (default 300).
+"""
+import asyncio
+import collections
+import os
+import sys
+import threading
+import time
+import traceback
+
+from core import metrics
+
+LOOP_STALLS = metrics.counter("event_loop_stalls_total", "Event loop stalls above the threshold", ["label"])
+LOOP_STALL_SECONDS = metrics.histogram(
+    "event_loop_stall_seconds", "Duration of detected event loop stalls", ["label"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+
+MAX_STACK_DEPTH = 40
+
+
+def route_label(frame):
+    """Finds the ASGI route being served by walking outwards from ``frame``."""
+    while frame is not None:
+        scope = frame.f_locals.get("scope")
+        if isinstance(scope, dict) and "path" in scope:
+            route = scope.get("route")
+            return f"{scope.get('method', '')} {getattr(route, 'path', scope['path'])}".strip()
+        frame = frame.f_back
+    return "unknown"
+
+
+def function_label(names):
+    """Returns a label function matching the first stack frame whose function is in ``names``."""
+    names = set(names)
+
+    def label(frame):
+        while frame is not None:
+            if frame.f_code.co_name in names:
+                return frame.f_code.co_name
+            frame = frame.f_back
+        return "unknown"
+    return label
+
+
+class LoopWatchdog:
+    def __init__(self, loop, threshold: float, label=route_label, history: int = 50):
+        self.loop = loop
+        self.threshold = threshold
+        self.label = label
+        self.stalls = collections.deque(maxlen=history)
+        self._interval = max(threshold / 4, 0.005)
+        self._last_tick = time.monotonic()
+        self._loop_thread_id = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._heartbeat = None
+
+    async def _beat(self):
+        self._loop_thread_id = threading.get_ident()
+        while True:
+            self._last_tick = time.monotonic()
+            await asyncio.sleep(self._interval)
+
+    def start(self):
+        """Starts the watchdog; must be called from the loop's own thread."""
+        self._heartbeat = self.loop.create_task(self._beat())
+        self._thread = threading.Thread(target=self._monitor, name="loop-watchdog", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+
+    def _monitor(self):
+        current = None
+        while not self._stop.wait(self._interval):
+            lag = time.monotonic() - self._last_tick - self._interval
+            if lag > self.threshold:
+                if current is None:
+                    frame = sys._current_frames().get(self._loop_thread_id)
+                    if frame is None:
+                        continue
+                    current = {
+                        "started_at": time.time() - lag,
+                        "duration": lag,
+                        "label": self.label(frame),
+                        "stack": traceback.format_stack(frame)[-MAX_STACK_DEPTH:],
+                    }
+                    self.stalls.append(current)
+                    print(f"Warning: event loop blocked >{self.threshold * 1000:.0f}ms in {current['label']}",
+                          file=sys.stderr)
+                current["duration"] = lag
+            elif current is not None:
+                LOOP_STALLS.inc(label=current["label"])
+                LOOP_STALL_SECONDS.observe(current["duration"], label=current["label"])
+                current = None
+
+    def report(self) -> list:
+        return [
+            {**stall, "stack": "".join(stall["stack"])}
+            for stall in reversed(self.stalls)
+        ]
+
+
+def _fold(frame) -> str:
+    parts = []
+    while frame is not None:
+        code = frame.f_code
+        parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(parts))
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float = 0.01, window: float = 300.0):
+        self.interval = interval
+        self.window = window
+        self._samples = collections.deque()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _sample_once(self, own_ident):
+        names = {t.ident: t.name for t in threading.enumerate()}
+        stacks = []
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            stacks.append(f"{names.get(ident, ident)};{_fold(frame)}")
+        return stacks
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            now = time.monotonic()
+            stacks = self._sample_once(own)
+            with self._lock:
+                self._samples.append((now, stacks))
+                while self._samples and self._samples[0][0] < now - self.window:
+                    self._samples.popleft()
+
+    def start(self):
+        if not self.running:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def folded(self, seconds: float) -> str:
+        """Collapsed stacks for the last ``seconds`` of the rolling window."""
+        cutoff = time.monotonic() - seconds
+        with self._lock:
+            samples = [stacks for ts, stacks in self._samples if ts >= cutoff]
+        return _collapse(samples)
+
+    def capture(self, seconds: float) -> str:
+        """Samples for the next ``seconds`` (blocking) and returns collapsed stacks."""
+        own = threading.get_ident()
+        samples = []
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            samples.append(self._sample_once(own))
+            time.sleep(self.interval)
+        return _collapse(samples)
+
+    def profile(self, seconds: float) -> str:
+        """Last ``seconds`` from the background window if running, else a fresh capture."""
+        if self.running:
+            return self.folded(seconds)
+        return self.capture(seconds)
+
+
+def _collapse(samples) -> str:
+    counts = collections.Counter(stack for stacks in samples for stack in stacks)
+    return "\n".join(f"{stack} {count}" for stack, count in counts.most_common())
+
+
+_profiler = None
+
+
+def get_profiler() -> SamplingProfiler:
+    """Process-wide profiler, started in the background when PROFILER_ENABLED=1."""
+    global _profiler
+    if _profiler is None:
+        _profiler = SamplingProfiler(
+            interval=float(os.environ.get("PROFILER_INTERVAL_MS", "10")) / 1000.0,
+            window=float(os.environ.get("PROFILER_WINDOW_SECONDS", "300")),
+        )
+        if os.environ.get("PROFILER_ENABLED") == "1":
+            _profiler.start()
+    return _profiler
+
+
+def start_watchdog(loop=None, label=route_label):
+    """Starts a LoopWatchdog on the running loop when LOOP_WATCHDOG_MS is set."""
+    threshold_ms = os.environ.get("LOOP_WATCHDOG_MS")
+    if not threshold_ms:
+        return None
+    loop = loop or asyncio.get_running_loop()
+    return LoopWatchdog(loop, float(threshold_ms) / 1000.0, label=label).start()
@@ -0,0 +1,80 @@
+"""
+Process resource gauges: OS threads, open file descriptors, sockets and child processes.
+
+Values are read from this process's own /proc entries at scrape time (cheap
+enough for the async /metrics handler), so a soak test can watch them stay
+flat across request bursts and agent runs. Where /proc is unavailable the
+samples are skipped (threads fall back to the Python thread count).
+"""
+import os
+import threading
+
+from core import metrics
+
+PROCESS_THREADS = metrics.gauge("process_threads", "OS threads in this process")
+PROCESS_OPEN_FDS = metrics.gauge("process_open_fds", "Open file descriptors")
+PROCESS_OPEN_SOCKETS = metrics.gauge("process_open_sockets", "Open sockets")
+PROCESS_CHILDREN = metrics.gauge("process_child_processes", "Child processes, e.g. stdio MCP servers (zombies included)")
+
+
+def threads() -> int:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("Threads:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return threading.active_count()
+
+
+def _fd_targets():
+    for fd in os.listdir("/proc/self/fd"):
+        try:
+            yield os.readlink(f"/proc/self/fd/{fd}")
+        except OSError:
+            # Closed between listing and reading (e.g. the listing's own fd)
+            continue
+
+
+def open_fds() -> int:
+    return len(os.listdir("/proc/self/fd"))
+
+
+def open_sockets() -> int:
+    return sum(1 for target in _fd_targets() if target.startswith("socket:"))
+
+
+def child_processes() -> int:
+    # Per-thread lists of direct children: no scan of every process on the host
+    count, read = 0, False
+    for task in os.listdir("/proc/self/task"):
+        try:
+            with open(f"/proc/self/task/{task}/children") as f:
+                count += len(f.read().split())
+            read = True
+        except FileNotFoundError:
+            # The thread exited since the listing
+            continue
+    if not read:
+        # Kernel built without CONFIG_PROC_CHILDREN; skip the sample rather than report 0
+        raise FileNotFoundError("/proc/self/task/*/children")
+    return count
+
+
+def usage() -> dict:
+    """Current values of every gauge, None where they cannot be read."""
+    result = {}
+    for name, fn in (("threads", threads), ("open_fds", open_fds),
+                     ("open_sockets", open_sockets), ("child_processes", child_processes)):
+        try:
+            result[name] = fn()
+        except OSError:
+            result[name] = None
+    return result
+
+
+PROCESS_THREADS.set_function(threads)
+PROCESS_OPEN_FDS.set_function(open_fds)
+PROCESS_OPEN_SOCKETS.set_function(open_sockets)
+PROCESS_CHILDREN.set_function(child_processes)
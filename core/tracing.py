@@ -0,0 +1,231 @@
+"""
+Lightweight request tracing with OpenTelemetry-compatible span data.
+
+Spans use W3C trace context identifiers, so a trace started by the API can be
+continued inside the MCP server by forwarding ``span.traceparent()`` with the
+tool call. Finished spans are exported as OTLP-style JSON lines and their
+durations are recorded in the ``trace_span_duration_seconds`` histogram.
+
+Configuration (environment):
+    TRACE_EXPORTER: ``none`` (default), ``console`` (stderr) or ``file``.
+    TRACE_FILE: Output path for the ``file`` exporter (default ``traces.jsonl``).
+    TRACE_SERVICE_NAME: Service name recorded on every span.
+"""
+import contextvars
+import functools
+import inspect
+import json
+import os
+import re
+import secrets
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from core import metrics
+
+SPAN_DURATION = metrics.histogram(
+    "trace_span_duration_seconds",
+    "Duration of traced operations",
+    ["span", "status"],
+)
+
+_TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class SpanContext:
+    """Identifiers of a (possibly remote) span."""
+
+    __slots__ = ("trace_id", "span_id")
+
+    def __init__(self, trace_id: str, span_id: str):
+        self.trace_id = trace_id
+        self.span_id = span_id
+
+
+class Span:
+    def __init__(self, name: str, parent=None, attributes=None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = dict(attributes or {})
+        self.events = []
+        self.status = "OK"
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self._start_perf = time.perf_counter()
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def record_exception(self, exc: BaseException):
+        self.status = "ERROR"
+        self.events.append({
+            "name": "exception",
+            "timeUnixNano": time.time_ns(),
+            "attributes": {"exception.type": type(exc).__name__, "exception.message": str(exc)},
+        })
+
+    def set_error(self, message: str):
+        self.status = "ERROR"
+        self.attributes["error.message"] = message
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    @property
+    def duration(self) -> float:
+        return time.perf_counter() - self._start_perf
+
+    def end(self):
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        SPAN_DURATION.observe(self.duration, span=self.name, status=self.status)
+        _exporter().export(self)
+
+    def to_dict(self) -> dict:
+        return {
+            "resource": {"service.name": _service_name},
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "attributes": self.attributes,
+            "events": self.events,
+            "status": {"code": self.status},
+        }
+
+
+class _NoopExporter:
+    def export(self, span: Span):
+        pass
+
+
+class _StreamExporter:
+    def __init__(self, stream):
+        self._stream = stream
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock:
+            try:
+                self._stream.write(line + "\n")
+                self._stream.flush()
+            except Exception:
+                pass
+
+
+_service_name = os.environ.get("TRACE_SERVICE_NAME", "stockguru")
+_exporter_instance = None
+_exporter_lock = threading.Lock()
+
+
+def _exporter():
+    global _exporter_instance
+    if _exporter_instance is None:
+        with _exporter_lock:
+            if _exporter_instance is None:
+                _exporter_instance = _build_exporter()
+    return _exporter_instance
+
+
+def _build_exporter():
+    kind = os.environ.get("TRACE_EXPORTER", "none").lower()
+    if kind == "console":
+        # stderr, never stdout: the MCP server speaks JSON-RPC on stdout.
+        return _StreamExporter(sys.stderr)
+    if kind == "file":
+        path = os.environ.get("TRACE_FILE", "traces.jsonl")
+        return _StreamExporter(open(path, "a", buffering=1))
+    return _NoopExporter()
+
+
+def configure(service_name: str = None, exporter: str = None):
+    """Overrides the service name and/or exporter chosen from the environment."""
+    global _service_name, _exporter_instance
+    if service_name:
+        _service_name = service_name
+    if exporter:
+        os.environ["TRACE_EXPORTER"] = exporter
+        with _exporter_lock:
+            _exporter_instance = _build_exporter()
+
+
+def current_span():
+    return _current_span.get()
+
+
+def parse_traceparent(value):
+    """Returns a SpanContext for a W3C ``traceparent`` header, or None if invalid."""
+    if not value:
+        return None
+    match = _TRACEPARENT_RE.match(value.strip().lower())
+    if not match:
+        return None
+    return SpanContext(match.group(1), match.group(2))
+
+
+def start_span(name: str, parent=None, **attributes) -> Span:
+    """Starts a span without making it current; the caller must call ``end()``."""
+    return Span(name, parent if parent is not None else _current_span.get(), attributes)
+
+
+@contextmanager
+def span(name: str, parent=None, **attributes):
+    """Runs the enclosed block inside a new span that becomes the current span."""
+    s = start_span(name, parent=parent, **attributes)
+    token = _current_span.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.record_exception(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        s.end()
+
+
+@contextmanager
+def continue_trace(traceparent):
+    """Parents spans started in the enclosed block to the remote span in ``traceparent``.
+
+    For hand-offs that lose the context (another thread's event loop) but keep
+    the traceparent string, such as in-process MCP tool calls.
+    """
+    parent = parse_traceparent(traceparent)
+    if parent is None:
+        yield
+        return
+    token = _current_span.set(parent)
+    try:
+        yield
+    finally:
+        _current_span.reset(token)
+
+
+def traced(name: str = None, **attributes):
+    """Decorator that wraps a sync or async function in a span."""
+    def decorator(fn):
+        span_name = name or fn.__qualname__
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name, **attributes):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name, **attributes):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,244 @@
+"""
+Shared access layer for upstream data providers (yfinance, DuckDuckGo).
+
+Every call goes through its provider's token-bucket rate limiter and circuit
+breaker, and failed calls are retried with full-jitter backoff only while the
+process-wide retry budget allows it. All waiting is bounded by a per-call
+deadline, so a throttling upstream makes requests fail fast (or fall back to
+stale cache entries, see ``core.cache``) instead of piling up.
+
+Configuration (environment), with ``<P>`` the upper-cased provider name:
+    UPSTREAM_<P>_RATE: Sustained calls per second (default per provider).
+    UPSTREAM_<P>_BURST: Bucket size.
+    UPSTREAM_<P>_FAILURES: Consecutive failures that open the circuit (default 5).
+    UPSTREAM_<P>_RESET_SECONDS: Open-circuit cool-down (default 30).
+    UPSTREAM_MAX_ATTEMPTS: Attempts per call including the first (default 3).
+    UPSTREAM_DEADLINE_SECONDS: Upper bound on waiting per call (default 10).
+    UPSTREAM_RETRY_RATIO: Retries allowed as a fraction of recent calls (default 0.2).
+"""
+import os
+import random
+import sys
+import threading
+import time
+from collections import deque
+
+from core import metrics
+
+UPSTREAM_CALLS = metrics.counter("upstream_calls_total", "Upstream calls by outcome", ["provider", "outcome"])
+UPSTREAM_RETRIES = metrics.counter("upstream_retries_total", "Upstream retry attempts", ["provider"])
+CIRCUIT_STATE = metrics.gauge("upstream_circuit_open", "1 while the provider circuit is open", ["provider"])
+
+DEFAULT_LIMITS = {
+    "yfinance": (5.0, 10),
+    "ddgs": (1.0, 3),
+}
+
+
+class UpstreamUnavailable(Exception):
+    """Raised when a provider call is rejected before or after reaching the upstream."""
+
+    def __init__(self, provider: str, reason: str):
+        super().__init__(f"{provider} unavailable: {reason}")
+        self.provider = provider
+        self.reason = reason
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = float(burst)
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Takes a token if available; otherwise returns seconds until one is."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        while True:
+            wait = self._reserve()
+            if wait == 0.0:
+                return True
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class RetryBudget:
+    """Caps retries at a fraction of the calls made in a sliding window."""
+
+    def __init__(self, ratio: float = 0.2, min_per_second: float = 1.0, window: float = 10.0):
+        self.ratio = ratio
+        self.min_retries = min_per_second * window
+        self.window = window
+        self._calls = deque()
+        self._retries = deque()
+        self._lock = threading.Lock()
+
+    def _trim(self, q, now):
+        while q and q[0] < now - self.window:
+            q.popleft()
+
+    def record_call(self):
+        now = time.monotonic()
+        with self._lock:
+            self._calls.append(now)
+            self._trim(self._calls, now)
+
+    def try_retry(self) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            self._trim(self._calls, now)
+            self._trim(self._retries, now)
+            if len(self._retries) >= self.min_retries + self.ratio * len(self._calls):
+                return False
+            self._retries.append(now)
+            return True
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == self.HALF_OPEN and not self._trial_in_flight:
+                # Let exactly one trial call probe the upstream
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def cancel_trial(self):
+        """Releases a half-open trial slot that was granted but never used."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._trial_in_flight = False
+            if self.state != self.CLOSED:
+                self.state = self.CLOSED
+                CIRCUIT_STATE.set(0, provider=self.name)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    print(f"Warning: circuit for {self.name} opened after {self._failures} failures", file=sys.stderr)
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                CIRCUIT_STATE.set(1, provider=self.name)
+
+
+class Provider:
+    def __init__(self, name: str, rate: float, burst: int, budget: RetryBudget,
+                 failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 max_attempts: int = 3, deadline: float = 10.0,
+                 base_delay: float = 0.25, max_delay: float = 4.0):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(name, failure_threshold, reset_timeout)
+        self.budget = budget
+        self.max_attempts = max_attempts
+        self.deadline = deadline
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def call(self, fn, *args, **kwargs):
+        """Calls ``fn(*args, **kwargs)`` under this provider's limits.
+
+        Raises UpstreamUnavailable when the circuit is open or no rate-limit
+        token becomes available before the deadline; otherwise re-raises the
+        last upstream error once attempts, budget or deadline run out.
+        """
+        deadline = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                UPSTREAM_CALLS.inc(provider=self.name, outcome="circuit_open")
+                raise UpstreamUnavailable(self.name, "circuit open")
+            if not self.bucket.acquire(max(0.0, deadline - time.monotonic())):
+                self.breaker.cancel_trial()
+                UPSTREAM_CALLS.inc(provider=self.name, outcome="rate_limited")
+                raise UpstreamUnavailable(self.name, "rate limit wait exceeds deadline")
+
+            self.budget.record_call()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception:
+                self.breaker.record_failure()
+                attempt += 1
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                if (attempt >= self.max_attempts or time.monotonic() + delay >= deadline
+                        or not self.budget.try_retry()):
+                    UPSTREAM_CALLS.inc(provider=self.name, outcome="error")
+                    raise
+                UPSTREAM_RETRIES.inc(provider=self.name)
+                time.sleep(delay)
+                continue
+            self.breaker.record_success()
+            UPSTREAM_CALLS.inc(provider=self.name, outcome="ok")
+            return result
+
+
+_retry_budget = RetryBudget(ratio=_env_float("UPSTREAM_RETRY_RATIO", 0.2))
+_providers = {}
+_providers_lock = threading.Lock()
+
+
+def provider(name: str) -> Provider:
+    """Returns the process-wide Provider for ``name``, configured from the environment."""
+    with _providers_lock:
+        p = _providers.get(name)
+        if p is None:
+            key = name.upper()
+            rate, burst = DEFAULT_LIMITS.get(name, (5.0, 10))
+            p = _providers[name] = Provider(
+                name,
+                rate=_env_float(f"UPSTREAM_{key}_RATE", rate),
+                burst=int(_env_float(f"UPSTREAM_{key}_BURST", burst)),
+                budget=_retry_budget,
+                failure_threshold=int(_env_float(f"UPSTREAM_{key}_FAILURES", 5)),
+                reset_timeout=_env_float(f"UPSTREAM_{key}_RESET_SECONDS", 30.0),
+                max_attempts=int(_env_float("UPSTREAM_MAX_ATTEMPTS", 3)),
+                deadline=_env_float("UPSTREAM_DEADLINE_SECONDS", 10.0),
+            )
+        return p
+
+
+def call(name: str, fn, *args, **kwargs):
+    return provider(name).call(fn, *args, **kwargs)
@@ -0,0 +1,330 @@
+"""
+Watchlist alerts evaluated against the market snapshot.
+
+A rule compares one snapshot field of a symbol, or of every symbol on its
+owner's watchlist, with a number or with another field: ``rsi > 70``,
+``macd_bullish == 1``, ``price < sma_50``. Alerts are edge-triggered: a rule
+fires when its condition becomes true for a symbol and can fire again only
+after it has been false.
+
+Rules are compiled into flat arrays with one entry per (rule, symbol) pair:
+snapshot row, field, operator, threshold or other field. They are recompiled
+only when rules, watchlists or the set of snapshot symbols change. Each
+snapshot refresh then evaluates every pair with a few NumPy gathers and
+comparisons. Fired alerts are kept per user, persisted with the rules and
+pushed to subscribed clients.
+
+Configuration (environment):
+    ALERTS_PATH: Persisted rules and recent alerts (default data/alerts.json).
+    ALERTS_MAX_RULES: Rules per user (default 200).
+"""
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from core import metrics, tracing
+from servers.stock_data import symbols
+from servers.stock_data.snapshot import SNAPSHOT_DTYPE
+
+ALERTS_PATH = os.environ.get("ALERTS_PATH", os.path.join("data", "alerts.json"))
+MAX_RULES = int(os.environ.get("ALERTS_MAX_RULES", "200"))
+# Recent alerts kept (and replayed to reconnecting clients) per user
+HISTORY_LIMIT = 100
+# Alerts buffered per connected client before it is considered stuck
+QUEUE_LIMIT = 256
+
+OPS = {
+    ">": np.greater, ">=": np.greater_equal, "<": np.less, "<=": np.less_equal,
+    "==": np.equal, "!=": np.not_equal,
+}
+FIELDS = tuple(name for name in SNAPSHOT_DTYPE.names if name not in ("symbol", "as_of", "updated"))
+_FIELD_INDEX = {name: i for i, name in enumerate(FIELDS)}
+_OP_CODES = {op: i for i, op in enumerate(OPS)}
+
+ALERT_RULES = metrics.gauge("alert_rules", "Alert rules across all users")
+ALERT_PAIRS = metrics.gauge("alert_rule_symbols", "Compiled (rule, symbol) pairs evaluated per refresh")
+ALERTS_FIRED = metrics.counter("alerts_fired_total", "Alerts fired", ["field"])
+ALERT_EVAL_SECONDS = metrics.histogram(
+    "alert_evaluation_seconds", "Time to evaluate every alert rule against the snapshot",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1),
+)
+
+
+def _describe(rule: dict) -> str:
+    target = rule["other"] if rule["other"] else f"{rule['value']:g}"
+    return f"{rule['field']} {rule['op']} {target}"
+
+
+class _Compiled:
+    """Flat per-(rule, symbol) arrays for one set of rules and snapshot rows."""
+
+    def __init__(self, pairs, active):
+        self.keys = [(owner, rule, symbol) for owner, rule, symbol, _ in pairs]
+        self.rows = np.array([row for *_, row in pairs], dtype=np.intp)
+        self.field = np.array([_FIELD_INDEX[rule["field"]] for _, rule, _, _ in pairs], dtype=np.intp)
+        self.other = np.array(
+            [_FIELD_INDEX[rule["other"]] if rule["other"] else -1 for _, rule, _, _ in pairs], dtype=np.intp
+        )
+        self.threshold = np.array(
+            [np.nan if rule["value"] is None else rule["value"] for _, rule, _, _ in pairs], dtype=np.float64
+        )
+        self.op = np.array([_OP_CODES[rule["op"]] for _, rule, _, _ in pairs], dtype=np.int8)
+        self.prev = np.array(active, dtype=bool)
+
+
+class AlertEngine:
+    """Per-user alert rules, evaluated whenever ``table`` is updated."""
+
+    def __init__(self, table, watchlists=None, path: str = ALERTS_PATH, max_rules: int = MAX_RULES):
+        self.table = table
+        # owner -> symbols, for rules without a symbol
+        self.watchlists = watchlists or (lambda owner: ())
+        self.path = path
+        self.max_rules = max_rules
+        self._rules = {}  # owner -> [rule]
+        self._history = {}  # owner -> [alert], oldest first
+        self._seq = {}  # owner -> id of the owner's last alert
+        self._subscribers = {}  # owner -> {(loop, queue)}
+        self._lock = threading.RLock()
+        self._compiled = None
+        self._compiled_key = None
+        self._version = 0
+        ALERT_RULES.set_function(lambda: sum(len(r) for r in self._rules.values()))
+        ALERT_PAIRS.set_function(lambda: len(self._compiled.keys) if self._compiled else 0)
+        self._load()
+        table.add_listener(self.evaluate)
+
+    # Rules
+
+    def add_rule(self, owner: str, field: str, op: str, value: float = None, other: str = None,
+                 symbol: str = None) -> dict:
+        """Adds a rule; ``symbol`` None applies it to every symbol on the owner's watchlist."""
+        if field not in _FIELD_INDEX:
+            raise ValueError(f"Unknown field {field!r}; expected one of {', '.join(FIELDS)}")
+        if op not in OPS:
+            raise ValueError(f"Unknown operator {op!r}; expected one of {', '.join(OPS)}")
+        if (value is None) == (other is None):
+            raise ValueError("Give exactly one of value or other")
+        if other is not None and other not in _FIELD_INDEX:
+            raise ValueError(f"Unknown field {other!r}; expected one of {', '.join(FIELDS)}")
+        rule = {
+            "id": uuid.uuid4().hex[:12],
+            "symbol": symbols.check(symbol) if symbol else None,
+            "field": field,
+            "op": op,
+            "value": None if value is None else float(value),
+            "other": other,
+            "created": time.time(),
+            "active": [],  # symbols whose condition currently holds
+        }
+        with self._lock:
+            rules = self._rules.setdefault(owner, [])
+            if len(rules) >= self.max_rules:
+                raise ValueError(f"At most {self.max_rules} alert rules per user")
+            rules.append(rule)
+            self._changed()
+        # Fire right away if the condition already holds for a snapshotted symbol
+        self.evaluate()
+        return dict(rule)
+
+    def remove_rule(self, owner: str, rule_id: str) -> bool:
+        with self._lock:
+            rules = self._rules.get(owner, [])
+            kept = [r for r in rules if r["id"] != rule_id]
+            if len(kept) == len(rules):
+                return False
+            self._rules[owner] = kept
+            self._changed()
+            return True
+
+    def rules(self, owner: str) -> list:
+        with self._lock:
+            return [dict(r) for r in self._rules.get(owner, [])]
+
+    def symbols(self) -> set:
+        """Symbols named by any rule (watchlist rules excluded)."""
+        with self._lock:
+            return {r["symbol"] for rules in self._rules.values() for r in rules if r["symbol"]}
+
+    def invalidate(self):
+        """Recompiles on the next evaluation, e.g. after a watchlist changed."""
+        with self._lock:
+            self._version += 1
+
+    def _changed(self):
+        self._version += 1
+        self._save()
+
+    # Alerts
+
+    def alerts(self, owner: str, after: int = 0) -> list:
+        """The owner's recent alerts with ids greater than ``after``, oldest first."""
+        with self._lock:
+            return [a for a in self._history.get(owner, []) if a["id"] > after]
+
+    def subscribe(self, owner: str) -> asyncio.Queue:
+        """A queue receiving the owner's alerts as they fire; call from the consuming event loop."""
+        queue = asyncio.Queue(maxsize=QUEUE_LIMIT)
+        with self._lock:
+            self._subscribers.setdefault(owner, set()).add((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, owner: str, queue: asyncio.Queue):
+        with self._lock:
+            subscribers = self._subscribers.get(owner, set())
+            subscribers.difference_update({s for s in subscribers if s[1] is queue})
+            if not subscribers:
+                self._subscribers.pop(owner, None)
+
+    # Evaluation
+
+    def _compile(self, index: dict):
+        """Returns the compiled pairs, and whether any rule's ``active`` list was pruned.
+
+        ``active`` is rebuilt from the pairs: a symbol that left the watchlist (or
+        the snapshot) is forgotten, so it fires again if re-added while its
+        condition holds.
+        """
+        pairs, active, pruned = [], [], False
+        for owner, rules in self._rules.items():
+            watchlist = None
+            for rule in rules:
+                if rule["symbol"]:
+                    tickers = (rule["symbol"],)
+                else:
+                    if watchlist is None:
+                        watchlist = {s.upper() for s in self.watchlists(owner)}
+                    tickers = watchlist
+                held = set(rule["active"])
+                still = []
+                for symbol in tickers:
+                    row = index.get(symbol)
+                    # Symbols not in the snapshot yet join when the index grows
+                    if row is not None:
+                        pairs.append((owner, rule, symbol, row))
+                        active.append(symbol in held)
+                        if symbol in held:
+                            still.append(symbol)
+                if len(still) != len(rule["active"]):
+                    rule["active"] = still
+                    pruned = True
+        return _Compiled(pairs, active), pruned
+
+    def evaluate(self):
+        """Evaluates every rule against the current snapshot and dispatches new alerts."""
+        started = time.perf_counter()
+        rows, index = self.table.view()
+        with self._lock, tracing.span("alerts.evaluate") as span:
+            # Rows are only ever appended, so the row count identifies the index
+            key = (self._version, len(index))
+            if key != self._compiled_key:
+                self._compiled, pruned = self._compile(index)
+                self._compiled_key = key
+                if pruned:
+                    self._save()
+            compiled = self._compiled
+            span.set_attribute("alerts.pairs", len(compiled.keys))
+            if not compiled.keys:
+                return []
+
+            values = np.empty((len(FIELDS), len(rows)), dtype=np.float64)
+            for i, name in enumerate(FIELDS):
+                values[i] = rows[name]
+            lhs = values[compiled.field, compiled.rows]
+            rhs = np.where(compiled.other >= 0, values[compiled.other, compiled.rows], compiled.threshold)
+            holds = np.zeros(len(lhs), dtype=bool)
+            for code, compare in enumerate(OPS.values()):
+                selected = compiled.op == code
+                if selected.any():
+                    holds[selected] = compare(lhs[selected], rhs[selected])
+            # Missing data never satisfies (or resets) a rule
+            known = np.isfinite(lhs) & np.isfinite(rhs)
+            holds = np.where(known, holds, compiled.prev)
+
+            fired = np.flatnonzero(holds & ~compiled.prev)
+            changed = np.flatnonzero(holds != compiled.prev)
+            for i in changed:
+                _, rule, symbol = compiled.keys[i]
+                if holds[i]:
+                    rule["active"].append(symbol)
+                else:
+                    rule["active"].remove(symbol)
+            compiled.prev = holds
+
+            alerts = [self._fire(*compiled.keys[i], float(lhs[i])) for i in fired]
+            if len(changed):
+                self._save()
+            span.set_attribute("alerts.fired", len(alerts))
+        ALERT_EVAL_SECONDS.observe(time.perf_counter() - started)
+        return alerts
+
+    def _fire(self, owner: str, rule: dict, symbol: str, observed: float) -> dict:
+        """Records and dispatches one alert (lock held)."""
+        alert_id = self._seq.get(owner, 0) + 1
+        self._seq[owner] = alert_id
+        alert = {
+            "id": alert_id,
+            "rule": rule["id"],
+            "symbol": symbol,
+            "condition": _describe(rule),
+            "observed": observed,
+            "message": f"{symbol}: {_describe(rule)} (now {observed:.2f})",
+            "time": time.time(),
+        }
+        history = self._history.setdefault(owner, [])
+        history.append(alert)
+        del history[:-HISTORY_LIMIT]
+        ALERTS_FIRED.inc(field=rule["field"])
+        subscribers = self._subscribers.get(owner, set())
+        for subscriber in list(subscribers):
+            loop, queue = subscriber
+            try:
+                loop.call_soon_threadsafe(_offer, queue, alert)
+            except RuntimeError:
+                # The subscriber's loop is closed; its stream is gone
+                subscribers.discard(subscriber)
+        if not subscribers:
+            self._subscribers.pop(owner, None)
+        return alert
+
+    # Persistence
+
+    def _save(self):
+        """Writes rules and recent alerts atomically (lock held)."""
+        if not self.path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp = self.path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump({"rules": self._rules, "alerts": self._history, "seq": self._seq}, f)
+            os.replace(tmp, self.path)
+        except Exception as e:
+            print(f"Error saving alerts: {e}", file=sys.stderr)
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"Error loading alerts {self.path}: {e}", file=sys.stderr)
+            return
+        self._rules = data.get("rules", {})
+        self._history = data.get("alerts", {})
+        self._seq = data.get("seq", {})
+
+
+def _offer(queue: asyncio.Queue, alert: dict):
+    try:
+        queue.put_nowait(alert)
+    except asyncio.QueueFull:
+        # The client stopped reading; it can catch up from the history on reconnect
+        pass
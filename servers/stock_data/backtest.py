@@ -0,0 +1,196 @@
+"""
+Backtest of the technical price-range predictions from ``get_technical_summary``.
+
+For every bar of every symbol in the universe, the 1-week/1-month/1-year target
+ranges are computed in one vectorized pass (``technicals.predict_ranges`` with a
+rolling 6-month volatility window, as the tool sees) and compared with the
+close actually realized 5/20/252 bars later. Symbols are processed in parallel
+on a process pool; each worker returns only aggregate counts.
+
+    python -m servers.stock_data.backtest --symbols-file universe.txt --fill --workers 8
+
+Reports, per horizon, the hit rate (realized close inside the range), misses
+above/below the range, mean range width, and a calibration table of hit rate
+by range width.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from servers.stock_data import bar_store, technicals
+
+# The tool computes volatility over a 6-month (~126 bar) history
+VOL_WINDOW = 126
+# Bars needed before every indicator (SMA50, MACD slow EMA) is defined
+WARMUP = 60
+# Relative half-width bucket edges for the calibration table
+WIDTH_BINS = np.array([0.0, 0.01, 0.02, 0.05, 0.1, 0.2, 0.35, 0.5, np.inf])
+
+
+def _empty_stats() -> dict:
+    n_bins = len(WIDTH_BINS) - 1
+    return {
+        horizon: {
+            "n": 0, "hits": 0, "above": 0, "below": 0, "width_sum": 0.0, "abs_error_sum": 0.0,
+            "bin_n": [0] * n_bins, "bin_hits": [0] * n_bins,
+        }
+        for horizon in technicals.HORIZONS
+    }
+
+
+def backtest_symbol(symbol: str, start: str = None, end: str = None) -> dict:
+    """Aggregate prediction outcomes for one symbol from the bar store."""
+    stats = _empty_stats()
+    df = bar_store.load(symbol)
+    if df is None or len(df) < WARMUP + VOL_WINDOW:
+        return {"symbol": symbol, "bars": 0 if df is None else len(df), "stats": stats}
+
+    df = df[["Close"]].copy()
+    technicals.add_indicators(df)
+    ranges = technicals.predict_ranges(df, vol_window=VOL_WINDOW)
+
+    close = df["Close"].to_numpy()
+    in_window = np.ones(len(df), dtype=bool)
+    if start:
+        in_window &= df.index >= start
+    if end:
+        in_window &= df.index < end
+    in_window[: WARMUP + VOL_WINDOW] = False
+
+    for horizon, bars in technicals.HORIZONS.items():
+        low = ranges[f"{horizon}_low"].to_numpy()
+        high = ranges[f"{horizon}_high"].to_numpy()
+        realized = np.full(len(close), np.nan)
+        realized[:-bars] = close[bars:]
+        valid = in_window & ~np.isnan(realized) & ~np.isnan(low) & ~np.isnan(high)
+        if not valid.any():
+            continue
+
+        low, high, realized, base = low[valid], high[valid], realized[valid], close[valid]
+        hit = (realized >= low) & (realized <= high)
+        half_width = (high - low) / 2 / base
+        miss_distance = np.where(realized > high, realized - high, np.where(realized < low, low - realized, 0.0)) / base
+        bins = np.clip(np.digitize(half_width, WIDTH_BINS) - 1, 0, len(WIDTH_BINS) - 2)
+
+        s = stats[horizon]
+        s["n"] += int(valid.sum())
+        s["hits"] += int(hit.sum())
+        s["above"] += int((realized > high).sum())
+        s["below"] += int((realized < low).sum())
+        s["width_sum"] += float((half_width * 2).sum())
+        s["abs_error_sum"] += float(miss_distance.sum())
+        s["bin_n"] = np.bincount(bins, minlength=len(WIDTH_BINS) - 1).tolist()
+        s["bin_hits"] = np.bincount(bins, weights=hit.astype(float), minlength=len(WIDTH_BINS) - 1).astype(int).tolist()
+
+    return {"symbol": symbol, "bars": len(df), "stats": stats}
+
+
+def _merge(total: dict, part: dict):
+    for horizon, s in part.items():
+        t = total[horizon]
+        for key in ("n", "hits", "above", "below", "width_sum", "abs_error_sum"):
+            t[key] += s[key]
+        t["bin_n"] = [a + b for a, b in zip(t["bin_n"], s["bin_n"])]
+        t["bin_hits"] = [a + b for a, b in zip(t["bin_hits"], s["bin_hits"])]
+
+
+def _backtest_args(args):
+    return backtest_symbol(*args)
+
+
+def run_backtest(symbols, workers: int = None, start: str = None, end: str = None) -> dict:
+    """Backtests ``symbols`` across a process pool and returns the merged report."""
+    total = _empty_stats()
+    per_symbol = {}
+    started = time.perf_counter()
+    jobs = [(symbol, start, end) for symbol in symbols]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for result in pool.map(_backtest_args, jobs, chunksize=max(1, len(jobs) // ((workers or os.cpu_count() or 1) * 4))):
+            _merge(total, result["stats"])
+            per_symbol[result["symbol"]] = {
+                h: (s["hits"] / s["n"] if s["n"] else None) for h, s in result["stats"].items()
+            }
+    return {
+        "symbols": len(symbols),
+        "seconds": time.perf_counter() - started,
+        "horizons": {h: _summarize(s) for h, s in total.items()},
+        "per_symbol_hit_rate": per_symbol,
+    }
+
+
+def _summarize(s: dict) -> dict:
+    n = s["n"]
+    calibration = []
+    for i, (count, hits) in enumerate(zip(s["bin_n"], s["bin_hits"])):
+        if count:
+            calibration.append({
+                "half_width": f"{WIDTH_BINS[i]:.0%}-{WIDTH_BINS[i + 1]:.0%}" if np.isfinite(WIDTH_BINS[i + 1])
+                else f">{WIDTH_BINS[i]:.0%}",
+                "n": count,
+                "hit_rate": hits / count,
+            })
+    return {
+        "predictions": n,
+        "hit_rate": s["hits"] / n if n else None,
+        "above_rate": s["above"] / n if n else None,
+        "below_rate": s["below"] / n if n else None,
+        "mean_width": s["width_sum"] / n if n else None,
+        "mean_miss_distance": s["abs_error_sum"] / n if n else None,
+        "calibration": calibration,
+    }
+
+
+def format_report(report: dict) -> str:
+    lines = [f"Backtest over {report['symbols']} symbols in {report['seconds']:.1f}s", ""]
+    for horizon, r in report["horizons"].items():
+        if not r["predictions"]:
+            lines.append(f"{horizon}: no predictions")
+            continue
+        lines.append(
+            f"{horizon} ({technicals.HORIZONS[horizon]} bars): {r['predictions']} predictions, "
+            f"hit rate {r['hit_rate']:.1%} (above {r['above_rate']:.1%}, below {r['below_rate']:.1%}), "
+            f"mean width {r['mean_width']:.1%}, mean miss {r['mean_miss_distance']:.2%}"
+        )
+        for row in r["calibration"]:
+            lines.append(f"    half-width {row['half_width']:>9}: {row['hit_rate']:6.1%} of {row['n']}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backtest technical price-range predictions.")
+    parser.add_argument("symbols", nargs="*", help="Symbols to test (default: everything in the bar store)")
+    parser.add_argument("--symbols-file", help="File with one symbol per line")
+    parser.add_argument("--fill", action="store_true", help="Fetch missing symbols into the bar store first")
+    parser.add_argument("--period", default="10y", help="History to fetch with --fill (default 10y)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--start", help="Only score predictions made on or after this date")
+    parser.add_argument("--end", help="Only score predictions made before this date")
+    parser.add_argument("--output", help="Write the full report as JSON")
+    args = parser.parse_args(argv)
+
+    symbols = list(args.symbols)
+    if args.symbols_file:
+        with open(args.symbols_file) as f:
+            symbols.extend(line.strip().upper() for line in f if line.strip() and not line.startswith("#"))
+    if args.fill:
+        bar_store.fill(symbols, period=args.period)
+    if not symbols:
+        symbols = bar_store.symbols()
+    if not symbols:
+        parser.error("No symbols given and the bar store is empty")
+
+    report = run_backtest(symbols, workers=args.workers, start=args.start, end=args.end)
+    print(format_report(report))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
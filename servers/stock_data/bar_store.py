@@ -0,0 +1,67 @@
+"""
+On-disk store of OHLCV bars, one compressed ``.npz`` file per symbol and interval.
+
+Used for offline work over long histories (backtests) without re-fetching from
+Yahoo. Files live under ``BAR_STORE_DIR`` (default ``data/bars``).
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+BAR_STORE_DIR = os.environ.get("BAR_STORE_DIR", os.path.join("data", "bars"))
+
+COLUMNS = ["Open", "High", "Low", "Close", "Volume", "Dividends", "Stock Splits"]
+
+
+def _path(symbol: str, interval: str) -> str:
+    return os.path.join(BAR_STORE_DIR, interval, symbol.upper().replace("^", "_") + ".npz")
+
+
+def save(symbol: str, df: pd.DataFrame, interval: str = "1d"):
+    path = _path(symbol, interval)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    index = df.index if df.index.tz is not None else df.index.tz_localize("UTC")
+    arrays = {c: df[c].to_numpy(dtype=np.float64) for c in COLUMNS if c in df}
+    tmp = path + ".tmp.npz"
+    np.savez_compressed(tmp, ts=index.asi8, tz=np.array(str(index.tz)), **arrays)
+    os.replace(tmp, path)
+
+
+def load(symbol: str, interval: str = "1d"):
+    """Returns the stored bars as a DataFrame, or None if the symbol has none."""
+    path = _path(symbol, interval)
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        index = pd.DatetimeIndex(data["ts"]).tz_localize("UTC").tz_convert(str(data["tz"]))
+        df = pd.DataFrame({c: data[c] for c in COLUMNS if c in data.files}, index=index)
+    df.index.name = "Date"
+    return df
+
+
+def symbols(interval: str = "1d") -> list:
+    directory = os.path.join(BAR_STORE_DIR, interval)
+    if not os.path.isdir(directory):
+        return []
+    return sorted(f[:-4].replace("_", "^", 1) if f.startswith("_") else f[:-4]
+                  for f in os.listdir(directory) if f.endswith(".npz"))
+
+
+def fill(symbol_list, period: str = "10y"):
+    """Fetches daily history for symbols missing from the store."""
+    from servers.stock_data import market_data
+
+    for symbol in symbol_list:
+        if os.path.exists(_path(symbol, "1d")):
+            continue
+        try:
+            df = market_data.get_history(symbol, period=period)
+        except Exception as e:
+            print(f"Error fetching {symbol}: {e}", file=sys.stderr)
+            continue
+        if df.empty:
+            print(f"No history for {symbol}", file=sys.stderr)
+            continue
+        save(symbol, df)
@@ -0,0 +1,149 @@
+"""
+Compact in-memory representation of OHLCV bars for the history cache.
+
+A yfinance history frame holds float64 prices and corporate actions and an
+int64 ``Volume``. It carries a tz-aware index object, and its
+``Dividends``/``Stock Splits`` columns are zero on almost every row. ``CompactBars`` holds the same data as:
+
+- int64 epoch nanoseconds (UTC) plus the timezone name,
+- float32 prices when every price survives the round trip to within
+  ``PRICE_TOLERANCE`` (ordinary stock prices), float64 otherwise,
+- uint32 volumes when they are whole numbers below 2**32, else the
+  smallest of int64/float64 that is exact (returned in their original dtype),
+- corporate actions (dividends, splits, capital gains) as sparse
+  ``(row, value)`` pairs.
+
+``from_frame``/``to_frame`` convert to and from yfinance-style frames;
+``nbytes`` is what the cache accounts per entry.
+"""
+import sys
+
+import numpy as np
+import pandas as pd
+
+PRICES = ("Open", "High", "Low", "Close")
+VOLUME = "Volume"
+# Mostly-zero event columns, stored as (row, value) pairs
+ACTIONS = ("Dividends", "Stock Splits", "Capital Gains")
+# Largest error allowed when storing prices as float32 (a hundredth of a cent)
+PRICE_TOLERANCE = 1e-4
+
+
+def _compact_prices(values: np.ndarray) -> np.ndarray:
+    narrow = values.astype(np.float32)
+    finite = np.isfinite(values)
+    if np.array_equal(np.isfinite(narrow), finite) and (
+        not finite.any() or np.abs(narrow[finite] - values[finite]).max() <= PRICE_TOLERANCE
+    ):
+        return narrow
+    return values
+
+
+def _compact_volume(values: np.ndarray) -> np.ndarray:
+    if not np.isfinite(values).all() or not np.array_equal(values, np.round(values)):
+        return values
+    if not len(values) or (values.min() >= 0 and values.max() < 2**32):
+        return values.astype(np.uint32)
+    return values.astype(np.int64)
+
+
+class CompactBars:
+    """Immutable OHLCV bars with narrow dtypes and sparse corporate actions."""
+
+    __slots__ = ("ts", "tz", "index_name", "columns", "prices", "volume", "volume_dtype", "actions", "extra")
+
+    def __init__(self, ts, tz, index_name, columns, prices, volume, actions, extra, volume_dtype=None):
+        self.ts = ts  # int64 ns since the epoch, UTC
+        self.tz = tz  # timezone name, or None for a naive index
+        self.index_name = index_name
+        self.columns = columns  # original column order
+        self.prices = prices  # column -> float32/float64 array
+        self.volume = volume  # uint32/int64/float64 array, or None
+        self.volume_dtype = volume_dtype  # the frame's Volume dtype, restored by to_frame
+        self.actions = actions  # column -> (int32 rows, float64 values)
+        self.extra = extra  # any other column -> array, as given
+        for array in (ts, volume, *prices.values(), *extra.values(), *(a for pair in actions.values() for a in pair)):
+            if array is not None:
+                array.flags.writeable = False
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "CompactBars":
+        index = pd.DatetimeIndex(df.index).as_unit("ns")
+        tz = str(index.tz) if index.tz is not None else None
+        ts = (index.tz_convert("UTC") if tz else index).asi8.copy()
+        prices, actions, extra, volume, volume_dtype = {}, {}, {}, None, None
+        for column in df.columns:
+            values = df[column].to_numpy()
+            if column in PRICES and values.dtype.kind == "f":
+                prices[column] = _compact_prices(values.astype(np.float64, copy=False))
+            elif column == VOLUME and values.dtype.kind in "fiu":
+                volume = _compact_volume(values.astype(np.float64, copy=False))
+                volume_dtype = values.dtype
+            elif column in ACTIONS and values.dtype.kind in "fiu":
+                rows = np.flatnonzero(values).astype(np.int32)
+                actions[column] = (rows, values[rows].astype(np.float64))
+            else:
+                extra[column] = values.copy()
+        return cls(ts, tz, df.index.name, tuple(df.columns), prices, volume, actions, extra, volume_dtype)
+
+    def to_frame(self, lookback: pd.Timedelta = None) -> pd.DataFrame:
+        """A new, writable frame with the original columns, index, timezone and Volume dtype (prices as float64).
+
+        With ``lookback``, only bars within that span of the last bar are expanded.
+        """
+        first = 0
+        if lookback is not None and len(self.ts):
+            first = int(np.searchsorted(self.ts, self.ts[-1] - lookback.value, "left"))
+        index = pd.DatetimeIndex(self.ts[first:])
+        if self.tz:
+            index = index.tz_localize("UTC").tz_convert(self.tz)
+        index.name = self.index_name
+        if any(values.dtype.kind != "f" for values in self.extra.values()):
+            data = {column: self._column(column, first) for column in self.columns}
+            return pd.DataFrame(data, index=index, columns=list(self.columns), copy=False)
+        # One float64 block: much faster to build than a frame of separate columns
+        block = np.empty((len(index), len(self.columns)), dtype=np.float64)
+        restore = None
+        for i, column in enumerate(self.columns):
+            if column == VOLUME and self.volume is not None and self.volume_dtype != np.float64:
+                restore = i  # filled below, in its own dtype
+                continue
+            block[:, i] = self._column(column, first)
+        df = pd.DataFrame(block, index=index, columns=list(self.columns), copy=False)
+        if restore is not None:
+            df.isetitem(restore, self._column(VOLUME, first))
+        return df
+
+    def _column(self, column: str, first: int = 0) -> np.ndarray:
+        if column in self.prices:
+            return self.prices[column][first:].astype(np.float64)
+        if column == VOLUME and self.volume is not None:
+            return self.volume[first:].astype(self.volume_dtype)
+        if column in self.actions:
+            rows, values = self.actions[column]
+            dense = np.zeros(len(self.ts) - first, dtype=np.float64)
+            kept = rows >= first
+            dense[rows[kept] - first] = values[kept]
+            return dense
+        return self.extra[column][first:].copy()
+
+    def __len__(self):
+        return len(self.ts)
+
+    @property
+    def empty(self) -> bool:
+        return not len(self.ts)
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the arrays plus the object overhead."""
+        arrays = [self.ts, *self.prices.values(), *self.extra.values()]
+        arrays += [a for pair in self.actions.values() for a in pair]
+        if self.volume is not None:
+            arrays.append(self.volume)
+        return sum(a.nbytes for a in arrays) + sys.getsizeof(self) + 96 * len(arrays)
+
+
+def frame_nbytes(df: pd.DataFrame) -> int:
+    """Deep memory use of a frame, for comparison with ``CompactBars.nbytes``."""
+    return int(df.memory_usage(index=True, deep=True).sum())
@@ -0,0 +1,198 @@
+"""
+Bar intervals, lookback periods and OHLCV resampling.
+
+Only a few base intervals are fetched from Yahoo (1m, 5m, 1h, 1d); every other
+interval is derived from a cached base by aggregating whole buckets: open =
+first, high = max, low = min, close = last, volume and dividends summed and
+split ratios multiplied. Intraday buckets are anchored at each session's first
+bar (so hourly bars run 9:30-10:30 like Yahoo's), weeks start on Monday and
+months/quarters on their first day, all in the exchange's timezone.
+
+Daily bars always come from Yahoo's daily series rather than being summed from
+intraday bars, because only the daily series is split/dividend adjusted and
+closes on the official closing price.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+INTRADAY_SECONDS = {"1m": 60, "2m": 120, "5m": 300, "15m": 900, "30m": 1800, "1h": 3600, "90m": 5400}
+CALENDAR = ("1d", "1wk", "1mo", "3mo")
+ALIASES = {"60m": "1h"}
+
+# How far back Yahoo serves each base interval, and the periods fetched for it
+# (smallest first) so that one download covers most later requests
+BASES = {
+    "1m": {"max_days": 7, "periods": ["7d"]},
+    "5m": {"max_days": 60, "periods": ["60d"]},
+    "1h": {"max_days": 730, "periods": ["730d"]},
+    "1d": {"max_days": None, "periods": ["2y", "5y", "10y", "max"]},
+}
+
+AGGREGATIONS = {
+    "Open": "first",
+    "High": "max",
+    "Low": "min",
+    "Close": "last",
+    "Volume": "sum",
+    "Dividends": "sum",
+    "Capital Gains": "sum",
+}
+
+_PERIOD_RE = re.compile(r"^(\d+)(d|wk|mo|y)$")
+
+
+def normalize(interval: str) -> str:
+    """Canonical interval name; raises ValueError for intervals Yahoo doesn't offer."""
+    interval = interval.strip().lower()
+    interval = ALIASES.get(interval, interval)
+    if interval not in INTRADAY_SECONDS and interval not in CALENDAR:
+        raise ValueError(f"Unsupported interval: {interval}")
+    return interval
+
+
+def is_intraday(interval: str) -> bool:
+    return interval in INTRADAY_SECONDS
+
+
+def period_days(period: str):
+    """Calendar days spanned by a Yahoo period string, or None for 'max'.
+
+    Day periods count sessions, so they are widened to cover weekends and
+    holidays.
+    """
+    if period == "max":
+        return None
+    if period == "ytd":
+        return pd.Timestamp.now().dayofyear
+    match = _PERIOD_RE.match(period)
+    if not match:
+        raise ValueError(f"Unsupported period: {period}")
+    n, unit = int(match.group(1)), match.group(2)
+    if unit == "d":
+        return n * 7 // 5 + 4
+    return n * {"wk": 7, "mo": 31, "y": 366}[unit]
+
+
+def lookback(period: str, interval: str):
+    """How far before the last bar ``trim(..., period, interval)`` can reach, or None for 'max'.
+
+    Covers the period plus the calendar bucket its first bar may start in, with
+    a week's slack, so base bars older than this never affect the result.
+    """
+    days = period_days(period)
+    if days is None:
+        return None
+    bucket = {"1wk": 7, "1mo": 31, "3mo": 92}.get(interval, 0)
+    return pd.Timedelta(days=days + bucket + 7)
+
+
+def base_candidates(interval: str) -> list:
+    """Base intervals ``interval`` can be derived from, preferred first."""
+    if interval in CALENDAR:
+        return ["1d"]
+    step = INTRADAY_SECONDS[interval]
+    return [base for base in ("5m", "1m", "1h") if step % INTRADAY_SECONDS[base] == 0]
+
+
+def base_periods(base: str, days) -> list:
+    """Fetch periods of ``base`` that cover ``days``, smallest first (empty if Yahoo can't)."""
+    spec = BASES[base]
+    if spec["max_days"] is not None and (days is None or days > spec["max_days"]):
+        return []
+    covering = []
+    for period in spec["periods"]:
+        covered = period_days(period)
+        if covered is None or (days is not None and covered >= days):
+            covering.append(period)
+    return covering
+
+
+def _period_starts(local: pd.DatetimeIndex, interval: str) -> pd.DatetimeIndex:
+    if interval == "1d":
+        return local.normalize()
+    if interval == "1wk":
+        return local.normalize() - pd.to_timedelta(local.weekday, unit="D")
+    if interval == "1mo":
+        return local.to_period("M").to_timestamp()
+    if interval == "3mo":
+        return local.to_period("Q").to_timestamp()
+    raise ValueError(f"Unsupported interval: {interval}")
+
+
+def _split_product(ratios: pd.Series) -> float:
+    ratios = ratios[ratios != 0]
+    return float(ratios.prod()) if len(ratios) else 0.0
+
+
+def _aggregate(df: pd.DataFrame, labels) -> pd.DataFrame:
+    grouped = df.groupby(labels, sort=True)
+    out = grouped.agg({c: AGGREGATIONS.get(c, "last") for c in df.columns if c != "Stock Splits"})
+    if "Stock Splits" in df.columns:
+        out["Stock Splits"] = grouped["Stock Splits"].agg(_split_product)
+    return out[list(df.columns)]
+
+
+def resample(df: pd.DataFrame, interval: str) -> pd.DataFrame:
+    """Aggregates bars of a finer interval into ``interval`` bars."""
+    if df.empty:
+        return df
+    tz = df.index.tz
+    local = df.index.tz_localize(None) if tz is not None else df.index
+
+    if is_intraday(interval):
+        step = np.timedelta64(INTRADAY_SECONDS[interval], "s")
+        anchor = pd.Series(local, index=df.index).groupby(local.normalize()).transform("min").to_numpy()
+        into_bucket = (local.to_numpy() - anchor) % step
+        # Subtract in absolute time so labels stay right across DST changes
+        out = _aggregate(df, df.index - pd.to_timedelta(into_bucket))
+        out.index.name = "Datetime"
+        return out
+
+    out = _aggregate(df, _period_starts(local, interval))
+    if tz is not None:
+        out.index = out.index.tz_localize(tz)
+    out.index.name = "Date"
+    return out
+
+
+def drop_partial_head(derived: pd.DataFrame, base: pd.DataFrame, interval: str) -> pd.DataFrame:
+    """Drops the first derived calendar bar if the base data starts partway into it."""
+    if derived.empty or is_intraday(interval) or interval == "1d":
+        return derived
+    if base.index[0].normalize() > derived.index[0]:
+        return derived.iloc[1:]
+    return derived
+
+
+def trim(df: pd.DataFrame, period: str, interval: str) -> pd.DataFrame:
+    """Keeps the bars Yahoo would return for ``period``."""
+    if df.empty or period == "max":
+        return df
+    tz = df.index.tz
+    now = pd.Timestamp.now(tz=tz)
+    match = _PERIOD_RE.match(period)
+    if period == "ytd":
+        start = now.normalize().replace(month=1, day=1)
+    elif match and match.group(2) == "d":
+        n = int(match.group(1))
+        if interval == "1d":
+            return df.iloc[-n:]
+        if is_intraday(interval):
+            sessions = df.index.normalize().unique()
+            return df[df.index >= sessions[-n]] if len(sessions) > n else df
+        start = now - pd.Timedelta(days=n)
+    elif match:
+        n, unit = int(match.group(1)), match.group(2)
+        start = now - {"wk": pd.DateOffset(weeks=n), "mo": pd.DateOffset(months=n), "y": pd.DateOffset(years=n)}[unit]
+    else:
+        raise ValueError(f"Unsupported period: {period}")
+
+    if interval in CALENDAR and interval != "1d":
+        # Keep the bar whose bucket contains the start, as Yahoo does
+        local = pd.DatetimeIndex([start.tz_localize(None) if tz is not None else start])
+        start = _period_starts(local, interval)[0]
+        if tz is not None:
+            start = start.tz_localize(tz)
+    return df[df.index >= start]
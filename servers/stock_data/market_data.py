@@ -0,0 +1,186 @@
+"""
+Cached, rate-limited access to market data shared by the MCP tools and the API.
+
+All yfinance and DuckDuckGo traffic goes through ``core.upstream`` providers and
+is cached in ``core.cache.TTLCache`` instances. When a provider is throttled or
+its circuit is open, the last good value is served from cache instead.
+
+HTTP connections are kept alive across calls: yfinance routes every ``Ticker``
+through one process-wide session, and each worker thread reuses one ``DDGS``
+client (whose search engines each hold a keep-alive HTTP client).
+
+Price history is cached per symbol and base interval (see ``intervals``); any
+other interval is resampled from the cached bars instead of fetched again.
+Cached bars are held as ``CompactBars`` (narrow dtypes, sparse corporate
+actions) under a byte budget, and expanded into a private frame per call.
+
+Configuration (environment):
+    HISTORY_TTL_SECONDS: Freshness of daily price history (default 300).
+    INTRADAY_TTL_SECONDS: Freshness of intraday bars (default 60).
+    INFO_TTL_SECONDS: Freshness of ticker info (default 900).
+    NEWS_TTL_SECONDS: Freshness of ticker news (default 300).
+    SEARCH_TTL_SECONDS: Freshness of web search results (default 3600).
+    HISTORY_CACHE_MAX_MB: Memory budget for cached price history (default 256).
+    HISTORY_CACHE_MAX_ENTRIES: Cached (symbol, interval, period) entries (default 8192).
+    News and search caching is further configured in ``news_store``.
+"""
+import os
+import threading
+
+import yfinance as yf
+from ddgs import DDGS
+
+from core import tracing, upstream
+from core.cache import TTLCache
+from servers.stock_data import intervals, symbols
+from servers.stock_data.bars import CompactBars
+from servers.stock_data.news_store import NewsStore
+
+HISTORY_TTL = float(os.environ.get("HISTORY_TTL_SECONDS", "300"))
+INTRADAY_TTL = float(os.environ.get("INTRADAY_TTL_SECONDS", "60"))
+INFO_TTL = float(os.environ.get("INFO_TTL_SECONDS", "900"))
+NEWS_TTL = float(os.environ.get("NEWS_TTL_SECONDS", "300"))
+SEARCH_TTL = float(os.environ.get("SEARCH_TTL_SECONDS", "3600"))
+# Empty results (unknown symbol, delisted, transient glitch) are re-checked sooner
+EMPTY_TTL = 60.0
+
+history_cache = TTLCache(
+    "history",
+    max_entries=int(os.environ.get("HISTORY_CACHE_MAX_ENTRIES", "8192")),
+    sizeof=lambda bars: bars.nbytes,
+    max_bytes=int(float(os.environ.get("HISTORY_CACHE_MAX_MB", "256")) * 2**20),
+)
+info_cache = TTLCache("info", max_entries=2048)
+news_store = NewsStore(
+    news_ttl=NEWS_TTL,
+    search_ttl=SEARCH_TTL,
+    max_articles=int(os.environ.get("NEWS_CACHE_MAX_ARTICLES", "5000")),
+    path=os.environ.get("NEWS_CACHE_PATH") or None,
+)
+
+
+def _fetch_history(symbol: str, period: str, interval: str) -> CompactBars:
+    with tracing.span("upstream.yfinance.history", symbol=symbol, period=period, interval=interval):
+        df = upstream.call("yfinance", yf.Ticker(symbol).history, period=period, interval=interval)
+    return CompactBars.from_frame(df)
+
+
+def _base_bars(symbol: str, interval: str, days):
+    """Cached base bars covering ``days``, as ``(base_interval, CompactBars)``.
+
+    Prefers any fresh cached base that already covers the window; otherwise
+    fetches the preferred base over the smallest covering period. Returns
+    ``(None, None)`` when no base interval can serve the window.
+    """
+    choice = None
+    for base in intervals.base_candidates(interval):
+        periods = intervals.base_periods(base, days)
+        for period in periods:
+            cached = history_cache.get((symbol, base, period))
+            if cached is not None:
+                return base, cached
+        if periods and choice is None:
+            choice = (base, periods[0])
+    if choice is None:
+        return None, None
+
+    base, period = choice
+    ttl = INTRADAY_TTL if intervals.is_intraday(base) else HISTORY_TTL
+    bars = history_cache.get_or_load(
+        (symbol, base, period),
+        lambda: _fetch_history(symbol, period, base),
+        lambda bars: EMPTY_TTL if bars.empty else ttl,
+    )
+    return base, bars
+
+
+def _listed(symbol: str) -> bool:
+    """Whether Yahoo has recent daily bars for ``symbol``; the probe behind ``check_symbol``."""
+    _, bars = _base_bars(symbol, "1d", intervals.period_days("5d"))
+    return bars is not None and not bars.empty
+
+
+def check_symbol(symbol: str) -> str:
+    """``symbols.check``, looking up tickers missing from the symbol master on Yahoo (blocking)."""
+    return symbols.check(symbol, probe=_listed)
+
+
+def get_history(symbol: str, period: str = "1mo", interval: str = "1d"):
+    """Returns a private copy of the OHLCV bars for ``symbol`` over ``period``.
+
+    Raises ValueError for an unsupported interval or period.
+    """
+    symbol = check_symbol(symbol)
+    interval = intervals.normalize(interval)
+    base, bars = _base_bars(symbol, interval, intervals.period_days(period))
+    if base is None:
+        # Nothing cached can serve this window (e.g. 90m bars beyond 60 days);
+        # let Yahoo answer or reject it directly
+        return history_cache.get_or_load(
+            (symbol, interval, period),
+            lambda: _fetch_history(symbol, period, interval),
+            lambda bars: EMPTY_TTL if bars.empty else HISTORY_TTL,
+        ).to_frame()
+    # Only expand the bars the requested period can reach
+    bars = bars.to_frame(lookback=intervals.lookback(period, interval))
+    if base != interval:
+        with tracing.span("history.resample", symbol=symbol, source=base, interval=interval, bars=len(bars)):
+            bars = intervals.drop_partial_head(intervals.resample(bars, interval), bars, interval)
+    # Callers add indicator columns; give them a frame of their own, not a slice
+    return intervals.trim(bars, period, interval).copy()
+
+
+def history_memory(limit: int = None) -> dict:
+    """Bytes of cached price history in total and per symbol (largest ``limit`` symbols first)."""
+    by_symbol = {}
+    for (symbol, _, _), size in history_cache.sizes():
+        by_symbol[symbol] = by_symbol.get(symbol, 0) + size
+    ranked = sorted(by_symbol.items(), key=lambda item: -item[1])
+    return {
+        "bytes": history_cache.nbytes,
+        "budget": history_cache.max_bytes,
+        "entries": len(history_cache),
+        "symbols": len(by_symbol),
+        "by_symbol": dict(ranked[:limit]),
+    }
+
+
+def get_info(symbol: str) -> dict:
+    symbol = check_symbol(symbol)
+
+    def load():
+        with tracing.span("upstream.yfinance.info", symbol=symbol):
+            return upstream.call("yfinance", lambda: yf.Ticker(symbol).info)
+
+    return dict(info_cache.get_or_load(symbol, load, lambda info: INFO_TTL if info else EMPTY_TTL))
+
+
+def get_news(symbol: str) -> list:
+    """Deduplicated articles (url, title, publisher, published, summary) for ``symbol``."""
+    symbol = check_symbol(symbol)
+
+    def fetch():
+        with tracing.span("upstream.yfinance.news", symbol=symbol):
+            return upstream.call("yfinance", lambda: yf.Ticker(symbol).news) or []
+
+    return news_store.symbol_news(symbol, fetch)
+
+
+_ddgs = threading.local()
+
+
+def _search_client() -> DDGS:
+    """This thread's DDGS client; a fresh one per call would redo every TLS handshake."""
+    client = getattr(_ddgs, "client", None)
+    if client is None:
+        client = _ddgs.client = DDGS()
+    return client
+
+
+def search_text(query: str, max_results: int = 5) -> list:
+    """Web search results as articles, cached by normalized query."""
+    def fetch(n):
+        with tracing.span("upstream.ddgs.text", query=query):
+            return upstream.call("ddgs", lambda: _search_client().text(query, max_results=n)) or []
+
+    return news_store.search(query, max_results, fetch)
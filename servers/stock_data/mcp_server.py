@@ -1,13 +1,75 @@
+import asyncio
+import functools
+import json
+import os
+import sys
+
 from fastmcp import FastMCP
-import yfinance as yf
-import ta
-import pandas as pd
-from ddgs import DDGS
+
+# Make the project packages importable when launched as a script by MCPToolAdapter
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from contextlib import asynccontextmanager
+
+from core import profiling, tracing
+from servers.stock_data import intervals, market_data, portfolio, shared_bars, technicals
+
+TOOL_NAMES = set()
+# Administrative tools; removed when serving over HTTP/SSE, which has no authentication
+ADMIN_TOOLS = ("admin_profile", "admin_cache_memory")
+
+
+@asynccontextmanager
+async def lifespan(server):
+    """Attaches the stall watchdog to the server's event loop while it runs."""
+    watchdog = profiling.start_watchdog(label=profiling.function_label(TOOL_NAMES))
+    profiling.get_profiler()
+    try:
+        yield {}
+    finally:
+        if watchdog is not None:
+            watchdog.stop()
+
 
 # Initialize FastMCP server
-mcp = FastMCP("stock_data")
+mcp = FastMCP("stock_data", lifespan=lifespan)
+
+
+def _request_traceparent():
+    """Returns the caller's W3C traceparent sent in the tool call's `_meta`, if any."""
+    try:
+        try:
+            from fastmcp.server.dependencies import get_context
+            ctx = get_context()
+        except ImportError:
+            ctx = mcp.get_context()
+        meta = ctx.request_context.meta
+    except Exception:
+        return None
+    if meta is None:
+        return None
+    if isinstance(meta, dict):
+        return meta.get("traceparent")
+    return getattr(meta, "traceparent", None) or (getattr(meta, "model_extra", None) or {}).get("traceparent")
+
+
+def traced_tool(fn):
+    """Runs a tool inside a `tool.<name>` span parented to the client's trace."""
+    TOOL_NAMES.add(fn.__name__)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        parent = tracing.parse_traceparent(_request_traceparent())
+        with tracing.span(f"tool.{fn.__name__}", parent=parent, **kwargs) as span:
+            result = fn(*args, **kwargs)
+            # Tools report failures as text, so flag those spans explicitly.
+            if isinstance(result, str) and result.startswith(("Error", "Search failed")):
+                span.set_error(result[:200])
+            return result
+    return wrapper
 
 @mcp.tool()
+@traced_tool
 def search_web(query: str, max_results: int = 5) -> str:
     """
     Performs a web search using DuckDuckGo.
@@ -18,19 +80,20 @@ def search_web(query: str, max_results: int = 5) -> str:
         max_results: Maximum number of results to return (default 5).
     """
     try:
-        results = DDGS().text(query, max_results=max_results)
+        results = market_data.search_text(query, max_results=max_results)
         if not results:
             return "No results found."
         
         formatted = []
         for r in results:
-            formatted.append(f"- {r['title']}: {r['href']}\n  {r['body']}")
+            formatted.append(f"- {r['title']}: {r['url']}\n  {r['summary']}")
         
         return "\n".join(formatted)
     except Exception as e:
         return f"Search failed: {e}"
 
 @mcp.tool()
+@traced_tool
 def get_etf_info(symbol: str) -> str:
     """
     Fetches detailed information for an ETF, including top holdings and expense ratio.
@@ -39,8 +102,7 @@ def get_etf_info(symbol: str) -> str:
         symbol: The ETF ticker symbol.
     """
     try:
-        ticker = yf.Ticker(symbol)
-        info = ticker.info
+        info = market_data.get_info(symbol)
         
         # Extract ETF specific data
         name = info.get('longName', symbol)
@@ -64,51 +126,50 @@ def get_etf_info(symbol: str) -> str:
         return f"Error fetching ETF info for {symbol}: {e}"
 
 @mcp.tool()
-def get_stock_history(symbol: str, period: str = "1mo") -> str:
+@traced_tool
+def get_stock_history(symbol: str, period: str = "1mo", interval: str = "1d") -> str:
     """
     Fetches historical stock data for a given symbol.
     
     Args:
         symbol: The stock ticker symbol (e.g., 'AAPL').
         period: The period to fetch data for (e.g., '1d', '5d', '1mo', '3mo', '1y').
+        interval: Bar size (e.g., '5m', '15m', '1h', '1d', '1wk', '1mo'). Intraday
+            bars are only available for recent periods (1m: 7 days, 5m-90m: 60 days, 1h: 2 years).
     """
     try:
-        ticker = yf.Ticker(symbol)
-        history = ticker.history(period=period)
+        history = market_data.get_history(symbol, period=period, interval=interval)
         if history.empty:
             return f"No history found for {symbol}."
-        return f"History for {symbol} ({period}):\n{history.to_string()}"
+        return f"History for {symbol} ({period}, {interval} bars):\n{history.to_string()}"
     except Exception as e:
         return f"Error fetching history for {symbol}: {e}"
 
 @mcp.tool()
-def get_stock_news(symbol: str) -> str:
+@traced_tool
+def get_stock_news(symbol: str, limit: int = 5) -> str:
     """
     Fetches the latest news for a given stock symbol.
     
     Args:
         symbol: The stock ticker symbol.
+        limit: Maximum number of news items to return (default 5).
     """
     try:
-        ticker = yf.Ticker(symbol)
-        news = ticker.news
+        news = market_data.get_news(symbol)
         if not news:
             return f"No news found for {symbol}."
         
         formatted_news = []
-        for item in news[:5]: # Limit to top 5 news items
-            # yfinance news structure: item['content']['title'] and item['content']['canonicalUrl']['url']
-            content = item.get('content', {})
-            title = content.get('title', 'No Title')
-            canonical = content.get('canonicalUrl', {})
-            link = canonical.get('url', 'No Link')
-            formatted_news.append(f"- {title}\n  {link}")
+        for item in news[:limit]:
+            formatted_news.append(f"- {item['title']}\n  {item['url'] or 'No Link'}")
             
         return f"Latest news for {symbol}:\n" + "\n".join(formatted_news)
     except Exception as e:
         return f"Error fetching news for {symbol}: {e}"
 
 @mcp.tool()
+@traced_tool
 def get_stock_profile(symbol: str) -> str:
     """
     Fetches the company profile for a given stock symbol.
@@ -117,8 +178,7 @@ def get_stock_profile(symbol: str) -> str:
         symbol: The stock ticker symbol.
     """
     try:
-        ticker = yf.Ticker(symbol)
-        info = ticker.info
+        info = market_data.get_info(symbol)
         
         sector = info.get('sector', 'N/A')
         industry = info.get('industry', 'N/A')
@@ -129,6 +189,7 @@ def get_stock_profile(symbol: str) -> str:
         return f"Error fetching profile for {symbol}: {e}"
 
 @mcp.tool()
+@traced_tool
 def get_detailed_stock_info(symbol: str) -> str:
     """
     Fetches detailed stock information including current price, ranges, and key metrics.
@@ -137,8 +198,7 @@ def get_detailed_stock_info(symbol: str) -> str:
         symbol: The stock ticker symbol.
     """
     try:
-        ticker = yf.Ticker(symbol)
-        info = ticker.info
+        info = market_data.get_info(symbol)
         
         # Get current price and ranges
         current_price = info.get('currentPrice') or info.get('regularMarketPrice', 'N/A')
@@ -197,74 +257,44 @@ P/E Ratio: {pe_ratio if pe_ratio != 'N/A' else 'N/A'}"""
 
 
 @mcp.tool()
-def get_technical_summary(symbol: str) -> str:
+@traced_tool
+def get_technical_summary(symbol: str, interval: str = "1d") -> str:
     """
     Performs a comprehensive technical analysis using the 'ta' library.
     Calculates RSI, MACD, Bollinger Bands, and SMA.
     
     Args:
         symbol: The stock ticker symbol.
+        interval: Bar size the indicators are computed on (e.g., '15m', '1h', '1d', '1wk').
+            Price predictions are only given for daily bars.
     """
     try:
-        # Fetch data (need enough data for indicators, e.g., 6 months)
-        ticker = yf.Ticker(symbol)
-        df = ticker.history(period="6mo")
+        interval = intervals.normalize(interval)
+        # Fetch enough bars for the indicators (6 months of daily bars)
+        df = market_data.get_history(symbol, period=technicals.HISTORY_PERIODS[interval], interval=interval)
         
         if df.empty:
             return f"No history found for {symbol}."
             
-        # Add indicators (don't use ta.utils.dropna as it removes all rows)
-        
-        # RSI
-        rsi_indicator = ta.momentum.RSIIndicator(close=df["Close"], window=14)
-        df["rsi"] = rsi_indicator.rsi()
-        
-        # MACD
-        macd_indicator = ta.trend.MACD(close=df["Close"])
-        df["macd"] = macd_indicator.macd()
-        df["macd_signal"] = macd_indicator.macd_signal()
-        df["macd_diff"] = macd_indicator.macd_diff()
-        
-        # Bollinger Bands
-        bb_indicator = ta.volatility.BollingerBands(close=df["Close"], window=20, window_dev=2)
-        df["bb_high"] = bb_indicator.bollinger_hband()
-        df["bb_low"] = bb_indicator.bollinger_lband()
-        
-        # SMA
-        df["sma_20"] = ta.trend.SMAIndicator(close=df["Close"], window=20).sma_indicator()
-        df["sma_50"] = ta.trend.SMAIndicator(close=df["Close"], window=50).sma_indicator()
+        with tracing.span("technical.indicators", symbol=symbol, interval=interval):
+            technicals.add_indicators(df)
+            ranges = technicals.predict_ranges(df).iloc[-1]
         
         # Get latest values
         latest = df.iloc[-1]
         current_price = latest['Close']
+        as_of = latest.name.strftime("%Y-%m-%d %H:%M") if intervals.is_intraday(interval) else latest.name.date()
         
-        # Calculate price predictions based on technical indicators
-        # Weekly prediction (5 trading days)
-        weekly_volatility = (latest['bb_high'] - latest['bb_low']) / current_price
-        weekly_trend = 1 + (latest['macd_diff'] / current_price * 0.1)  # Trend factor
-        weekly_low = current_price * (1 - weekly_volatility * 0.3) * weekly_trend
-        weekly_high = current_price * (1 + weekly_volatility * 0.3) * weekly_trend
-        
-        # Monthly prediction (20 trading days)
-        monthly_volatility = df['Close'].pct_change().std() * (20 ** 0.5)
-        monthly_trend = 1 + (latest['macd_diff'] / current_price * 0.3)
-        monthly_low = current_price * (1 - monthly_volatility) * monthly_trend
-        monthly_high = current_price * (1 + monthly_volatility) * monthly_trend
-        
-        # Yearly prediction (252 trading days)
-        yearly_volatility = df['Close'].pct_change().std() * (252 ** 0.5)
-        # Consider SMA trend for longer term
-        sma_trend = 1 + ((latest['sma_20'] - latest['sma_50']) / current_price * 0.5)
-        yearly_low = current_price * (1 - yearly_volatility * 0.8) * sma_trend
-        yearly_high = current_price * (1 + yearly_volatility * 0.8) * sma_trend
+        # Price predictions based on technical indicators (see technicals.predict_ranges)
+        weekly_low, weekly_high = ranges['week_low'], ranges['week_high']
+        monthly_low, monthly_high = ranges['month_low'], ranges['month_high']
+        yearly_low, yearly_high = ranges['year_low'], ranges['year_high']
         
         # Calculate support and resistance
-        recent_prices = df['Close'].tail(20)
-        support = recent_prices.min()
-        resistance = recent_prices.max()
+        support, resistance = technicals.support_resistance(df)
         
         summary = [
-            f"Technical Analysis Summary for {symbol} (as of {latest.name.date()}):",
+            f"Technical Analysis Summary for {symbol} ({interval} bars, as of {as_of}):",
             f"Current Price: ${current_price:.2f}",
             "",
             "Momentum:",
@@ -285,19 +315,108 @@ def get_technical_summary(symbol: str) -> str:
             "Support & Resistance:",
             f"- Support: ${support:.2f}",
             f"- Resistance: ${resistance:.2f}",
-            "",
-            "Price Predictions (Technical Analysis Based):",
-            f"- 1 Week Target: ${weekly_low:.2f} - ${weekly_high:.2f}",
-            f"- 1 Month Target: ${monthly_low:.2f} - ${monthly_high:.2f}",
-            f"- 1 Year Target: ${yearly_low:.2f} - ${yearly_high:.2f}",
-            "",
-            "Note: Predictions are estimates based on technical indicators and historical volatility."
         ]
+        # The prediction horizons are calibrated in daily bars
+        if interval == "1d":
+            summary += [
+                "",
+                "Price Predictions (Technical Analysis Based):",
+                f"- 1 Week Target: ${weekly_low:.2f} - ${weekly_high:.2f}",
+                f"- 1 Month Target: ${monthly_low:.2f} - ${monthly_high:.2f}",
+                f"- 1 Year Target: ${yearly_low:.2f} - ${yearly_high:.2f}",
+                "",
+                "Note: Predictions are estimates based on technical indicators and historical volatility."
+            ]
         
         return "\n".join(summary)
         
     except Exception as e:
         return f"Error performing technical analysis for {symbol}: {e}"
 
+@mcp.tool()
+@traced_tool
+def get_stock_bars(symbol: str, period: str = "1mo", interval: str = "1d", start: str = None, end: str = None) -> str:
+    """
+    Returns a JSON shared-memory handle to a symbol's OHLCV bars, for programs in other
+    processes (read with servers.stock_data.shared_bars.read_frame). Not intended for
+    analysis agents; use get_stock_history for readable data.
+    
+    Args:
+        symbol: The stock ticker symbol.
+        period: The period to fetch data for (e.g., '5d', '1mo', '1y').
+        interval: Bar size (e.g., '5m', '1h', '1d', '1wk').
+        start: Optional first timestamp to include (e.g., '2024-01-02').
+        end: Optional timestamp to stop before.
+    """
+    try:
+        symbol, interval = market_data.check_symbol(symbol), intervals.normalize(interval)
+        df = market_data.get_history(symbol, period=period, interval=interval)
+        handle = shared_bars.publisher.publish((symbol, period, interval), df, symbol=symbol, interval=interval)
+        return json.dumps(shared_bars.slice_handle(handle, start, end))
+    except Exception as e:
+        return f"Error publishing bars for {symbol}: {e}"
+
+@mcp.tool()
+@traced_tool
+def get_portfolio_risk(holdings: str, benchmark: str = "^GSPC", period: str = "1y") -> str:
+    """
+    Computes risk and diversification statistics for a portfolio: volatility, beta,
+    max drawdown, Value at Risk, pairwise correlations and each holding's share of risk.
+    
+    Args:
+        holdings: Comma-separated symbols with optional weights, e.g. 'AAPL:0.4, MSFT:30%, SPY'.
+            Symbols without a weight share the remaining weight equally.
+        benchmark: Index to compute beta against (default '^GSPC').
+        period: Lookback period of daily returns (e.g., '6mo', '1y', '3y').
+    """
+    try:
+        report = portfolio.analyze(portfolio.parse_holdings(holdings), benchmark=benchmark, period=period)
+        return portfolio.format_report(report)
+    except Exception as e:
+        return f"Error computing portfolio risk: {e}"
+
+@mcp.tool()
+async def admin_profile(seconds: int = 10) -> str:
+    """
+    Administrative: returns collapsed stacks of the MCP server process for the last
+    (or next) `seconds` seconds. Not intended for use by analysis agents.
+    
+    Args:
+        seconds: Length of the sampling window in seconds (max 300).
+    """
+    # Sample off the event loop so the capture observes the server, not itself
+    profiler = profiling.get_profiler()
+    folded = await asyncio.to_thread(profiler.profile, min(max(seconds, 1), 300))
+    return folded or "No samples collected."
+
+@mcp.tool()
+def admin_cache_memory(limit: int = 20) -> str:
+    """
+    Administrative: returns JSON with the bytes of price history cached by the MCP
+    server process, in total and for the `limit` largest symbols. Not intended for
+    use by analysis agents.
+    
+    Args:
+        limit: Number of symbols to list.
+    """
+    return json.dumps(market_data.history_memory(max(limit, 0)))
+
+
 if __name__ == "__main__":
-    mcp.run()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="stock_data MCP server")
+    parser.add_argument("--transport", choices=("stdio", "http", "sse"), default="stdio",
+                        help="stdio for one client (default); http or sse to share one server between processes")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    # Only when running as the server process; the in-process transport imports this module
+    tracing.configure(service_name="stock_data_mcp")
+    if args.transport == "stdio":
+        mcp.run()
+    else:
+        for name in ADMIN_TOOLS:
+            mcp.remove_tool(name)
+        mcp.run(transport="streamable-http" if args.transport == "http" else "sse", host=args.host, port=args.port)
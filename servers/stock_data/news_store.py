@@ -0,0 +1,199 @@
+"""
+Deduplicated cache for news articles and web search results.
+
+Articles are stored once, keyed by canonical URL, no matter how many symbols or
+search queries returned them. Per-symbol news and per-query search results are
+TTL-cached lists of those URLs, so repeated questions skip the upstream and a
+story covering AAPL and MSFT costs one slot. The article table is an LRU
+bounded by ``max_articles``; an index entry whose articles were evicted is
+treated as a miss.
+
+Configuration (environment):
+    NEWS_CACHE_MAX_ARTICLES: Article bound (default 5000).
+    NEWS_CACHE_PATH: JSON file to persist the cache across restarts (off when unset).
+"""
+import atexit
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from core import metrics
+from core.cache import TTLCache
+
+ARTICLES = metrics.gauge("news_articles_cached", "Unique articles held in the news cache")
+DUPLICATES = metrics.counter("news_articles_deduplicated_total", "Fetched articles already stored under another key")
+
+SUMMARY_MAX_CHARS = 500
+SAVE_INTERVAL = 30.0
+
+_TRACKING_PARAMS = re.compile(r"^(utm_.*|guccounter|guce_.*|ncid|fbclid|gclid|yptr|\.tsrc|soc_src|soc_trk|cmpid|ref)$", re.I)
+_QUERY_NOISE = re.compile(r"[^\w\s$^.\-]")
+
+
+def canonical_url(url: str) -> str:
+    """Normalizes a URL so the same article under different tracking links compares equal."""
+    if not url:
+        return ""
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not _TRACKING_PARAMS.match(k))
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit(("https" if parts.scheme in ("http", "https", "") else parts.scheme, host, path, urlencode(query), ""))
+
+
+def normalize_query(query: str) -> str:
+    """Case-folds a search query and strips punctuation/extra whitespace."""
+    return " ".join(_QUERY_NOISE.sub(" ", query.lower()).split())
+
+
+def article_from_yfinance(item: dict) -> dict:
+    """Flattens a yfinance news item (new nested or legacy flat layout)."""
+    content = item.get("content") or item
+    canonical = content.get("canonicalUrl") or content.get("clickThroughUrl") or {}
+    url = canonical.get("url") if isinstance(canonical, dict) else None
+    provider = content.get("provider") or {}
+    return {
+        "url": url or content.get("link") or "",
+        "title": content.get("title") or "No Title",
+        "publisher": provider.get("displayName") if isinstance(provider, dict) else content.get("publisher"),
+        "published": content.get("pubDate") or content.get("providerPublishTime"),
+        "summary": (content.get("summary") or "")[:SUMMARY_MAX_CHARS],
+    }
+
+
+def article_from_search(result: dict) -> dict:
+    return {
+        "url": result.get("href") or result.get("url") or "",
+        "title": result.get("title") or "No Title",
+        "publisher": None,
+        "published": None,
+        "summary": (result.get("body") or "")[:SUMMARY_MAX_CHARS],
+    }
+
+
+class NewsStore:
+    def __init__(self, news_ttl: float, search_ttl: float, max_articles: int = 5000, path: str = None):
+        self.news_ttl = news_ttl
+        self.search_ttl = search_ttl
+        self.max_articles = max_articles
+        self.path = path
+        self._articles = OrderedDict()  # canonical url -> article dict
+        self._lock = threading.Lock()
+        self._symbols = TTLCache("news", max_entries=4096)
+        self._queries = TTLCache("search", max_entries=4096)
+        self._last_save = 0.0
+        # One writer at a time: concurrent saves would share the temp file
+        self._save_lock = threading.Lock()
+        ARTICLES.set_function(lambda: len(self._articles))
+        if path:
+            self.load()
+            atexit.register(self.save)
+
+    def _put(self, articles) -> tuple:
+        """Stores articles (deduplicating by canonical URL) and returns their keys in order."""
+        keys = []
+        with self._lock:
+            for article in articles:
+                key = canonical_url(article["url"]) or f"title:{article['title']}"
+                if key in self._articles:
+                    DUPLICATES.inc()
+                    self._articles.move_to_end(key)
+                else:
+                    self._articles[key] = article
+                if key not in keys:
+                    keys.append(key)
+            while len(self._articles) > self.max_articles:
+                self._articles.popitem(last=False)
+        return tuple(keys)
+
+    def _resolve(self, keys):
+        """Returns the articles for ``keys``, or None if any has been evicted."""
+        with self._lock:
+            if any(key not in self._articles for key in keys):
+                return None
+            for key in keys:
+                self._articles.move_to_end(key)
+            return [dict(self._articles[key]) for key in keys]
+
+    def _cached(self, index: TTLCache, key, loader, ttl, keys_of=lambda value: value):
+        entry = index.get(key)
+        if entry is not None and self._resolve(keys_of(entry)) is None:
+            index.delete(key)
+        articles = self._resolve(keys_of(index.get_or_load(key, loader, ttl)))
+        self._maybe_save()
+        return articles or []
+
+    def symbol_news(self, symbol: str, fetch) -> list:
+        """Articles for ``symbol``; ``fetch()`` returns raw yfinance news items on a miss."""
+        def load():
+            return self._put(article_from_yfinance(item) for item in fetch())
+
+        return self._cached(self._symbols, symbol.upper(), load,
+                            lambda keys: self.news_ttl if keys else min(self.news_ttl, 60.0))
+
+    def search(self, query: str, max_results: int, fetch) -> list:
+        """Search results for ``query``; ``fetch(n)`` returns raw DDGS results on a miss.
+
+        Results cached for a larger ``max_results`` satisfy smaller requests.
+        """
+        key = normalize_query(query)
+        cached = self._queries.get(key)
+        if cached is not None and cached[0] < max_results and len(cached[1]) >= cached[0]:
+            # Cached for fewer results than now requested and more may exist upstream
+            self._queries.delete(key)
+
+        def load():
+            return (max_results, self._put(article_from_search(r) for r in fetch(max_results)))
+
+        articles = self._cached(self._queries, key, load, self.search_ttl, keys_of=lambda entry: entry[1])
+        return articles[:max_results]
+
+    def _maybe_save(self):
+        # A save already in progress will do
+        if self.path and time.monotonic() - self._last_save >= SAVE_INTERVAL and not self._save_lock.locked():
+            self.save()
+
+    def save(self):
+        """Atomically writes articles and both indexes to ``path``."""
+        if not self.path:
+            return
+        with self._save_lock:
+            self._last_save = time.monotonic()
+            with self._lock:
+                articles = list(self._articles.items())
+            data = {
+                "articles": articles,
+                "symbols": [[k, list(v), exp] for k, v, exp in self._symbols.export()],
+                "queries": [[k, [v[0], list(v[1])], exp] for k, v, exp in self._queries.export()],
+            }
+            tmp = f"{self.path}.tmp"
+            try:
+                with open(tmp, "w") as f:
+                    json.dump(data, f)
+                os.replace(tmp, self.path)
+            except Exception as e:
+                print(f"Error saving news cache: {e}", file=sys.stderr)
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"Error loading news cache: {e}", file=sys.stderr)
+            return
+        with self._lock:
+            for key, article in data.get("articles", []):
+                self._articles[key] = article
+            while len(self._articles) > self.max_articles:
+                self._articles.popitem(last=False)
+        self._symbols.restore((k, tuple(v), exp) for k, v, exp in data.get("symbols", []))
+        self._queries.restore((k, (v[0], tuple(v[1])), exp) for k, v, exp in data.get("queries", []))
@@ -0,0 +1,217 @@
+"""
+Portfolio risk analytics over cached daily bars.
+
+Closes for every holding and the benchmark are aligned on trading dates into
+one return matrix; covariance/correlation, portfolio and per-holding
+volatility, betas, risk contributions, drawdown and VaR are then computed with
+a handful of matrix operations, so hundreds of holdings cost milliseconds once
+their bars are cached.
+"""
+import contextvars
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from core import tracing
+from servers.stock_data import market_data
+
+TRADING_DAYS = 252
+# Holdings with fewer aligned closes than this fraction of the benchmark's are dropped
+MIN_COVERAGE = 0.8
+FETCH_WORKERS = int(os.environ.get("PORTFOLIO_FETCH_WORKERS", "8"))
+# One-sided normal quantiles for parametric VaR
+Z_SCORES = {0.95: 1.6449, 0.99: 2.3263}
+
+_HOLDING_RE = re.compile(r"^([A-Za-z0-9.\-^=]+?)(?::([-+]?\d*\.?\d+)(%?))?$")
+
+
+def parse_holdings(text: str) -> dict:
+    """Parses 'AAPL:0.4, MSFT:30%, SPY' into weights; unweighted symbols share the rest equally."""
+    weights, unweighted = {}, []
+    for item in re.split(r"[,;\s]+", re.sub(r"\s*[:=]\s*", ":", text.strip())):
+        if not item:
+            continue
+        match = _HOLDING_RE.match(item)
+        if not match:
+            raise ValueError(f"Cannot parse holding '{item}'")
+        symbol, weight, percent = match.group(1).upper(), match.group(2), match.group(3)
+        if weight is None:
+            unweighted.append(symbol)
+        else:
+            weights[symbol] = weights.get(symbol, 0.0) + float(weight) / (100 if percent else 1)
+    if unweighted:
+        share = max(1.0 - sum(weights.values()), 0.0) / len(unweighted) if weights else 1.0 / len(unweighted)
+        for symbol in unweighted:
+            weights[symbol] = weights.get(symbol, 0.0) + share
+    return weights
+
+
+def _closes(symbols, period: str) -> dict:
+    """Daily closes per symbol keyed by exchange-local date, fetched in parallel."""
+    def fetch(symbol):
+        try:
+            close = market_data.get_history(symbol, period=period)["Close"]
+        except Exception:
+            return symbol, None
+        if close.empty:
+            return symbol, None
+        # Align exchanges in different timezones on the trading date
+        close.index = close.index.tz_localize(None).normalize() if close.index.tz is not None else close.index.normalize()
+        return symbol, close[~close.index.duplicated(keep="last")]
+
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as pool:
+        # Run each fetch in a copy of the caller's context so its spans keep their parent
+        futures = [pool.submit(contextvars.copy_context().run, fetch, symbol) for symbol in symbols]
+        results = [future.result() for future in futures]
+    return {symbol: close for symbol, close in results if close is not None}
+
+
+def return_matrix(symbols, benchmark: str, period: str = "1y"):
+    """Aligned daily simple returns: ``(dates, R[T, N], benchmark_returns[T], symbols, excluded)``."""
+    closes = _closes(list(dict.fromkeys([benchmark, *symbols])), period)
+    if benchmark not in closes:
+        raise ValueError(f"No history for benchmark {benchmark}")
+    bench = closes[benchmark]
+    frame = pd.DataFrame({s: closes[s] for s in symbols if s in closes}).reindex(bench.index)
+
+    coverage = frame.notna().sum() / len(bench)
+    kept = [s for s in frame.columns if coverage[s] >= MIN_COVERAGE]
+    excluded = [s for s in symbols if s not in kept]
+
+    # Carry a price across another market's holiday, then keep dates where everything traded
+    values = np.column_stack([frame[kept].ffill(limit=5).to_numpy(dtype=float), bench.to_numpy(dtype=float)])
+    complete = ~np.isnan(values).any(axis=1)
+    values, dates = values[complete], bench.index[complete]
+    returns = values[1:] / values[:-1] - 1.0
+    return dates[1:], returns[:, :-1], returns[:, -1], kept, excluded
+
+
+def analyze(holdings: dict, benchmark: str = "^GSPC", period: str = "1y") -> dict:
+    """Risk report for ``holdings`` ({symbol: weight}); weights are normalized to sum to 1."""
+    if not holdings:
+        raise ValueError("No holdings given")
+    symbols = [s.upper() for s in holdings]
+    raw_weights = {s.upper(): float(w) for s, w in holdings.items()}
+    benchmark = benchmark.upper()
+
+    with tracing.span("portfolio.returns", holdings=len(symbols), period=period):
+        dates, R, rb, kept, excluded = return_matrix(symbols, benchmark, period)
+    if not kept:
+        raise ValueError("None of the holdings have enough history")
+    if len(dates) < 20:
+        raise ValueError(f"Only {len(dates)} aligned trading days; use a longer period")
+
+    w = np.array([raw_weights[s] for s in kept])
+    if w.sum() <= 0:
+        raise ValueError("Weights must sum to a positive number")
+    w = w / w.sum()
+
+    with tracing.span("portfolio.risk", holdings=len(kept), days=len(dates)):
+        T = len(dates)
+        mean = R.mean(axis=0)
+        centered = R - mean
+        bench_centered = rb - rb.mean()
+        cov = centered.T @ centered / (T - 1)
+        vol = np.sqrt(np.diag(cov))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            corr = np.nan_to_num(cov / np.outer(vol, vol))
+        np.fill_diagonal(corr, 1.0)
+
+        bench_var = bench_centered @ bench_centered / (T - 1)
+        betas = centered.T @ bench_centered / (T - 1) / bench_var
+
+        rp = R @ w
+        marginal = cov @ w
+        port_var = float(w @ marginal)
+        port_vol = np.sqrt(port_var)
+        contributions = w * marginal / port_var if port_var > 0 else np.zeros_like(w)
+
+        wealth = np.cumprod(1.0 + rp)
+        drawdowns = wealth / np.maximum.accumulate(wealth) - 1.0
+        trough = int(drawdowns.argmin())
+        peak = int(wealth[: trough + 1].argmax())
+
+        # Most correlated distinct pairs from the upper triangle
+        rows, cols = np.triu_indices(len(kept), k=1)
+        pair_corr = corr[rows, cols]
+        top = np.argsort(pair_corr)[::-1][:5]
+
+    n_kept = len(kept)
+    return {
+        "benchmark": benchmark,
+        "period": period,
+        "start": str(dates[0].date()),
+        "end": str(dates[-1].date()),
+        "days": T,
+        "holdings": n_kept,
+        "excluded": excluded,
+        "annual_return": float((1.0 + rp.mean()) ** TRADING_DAYS - 1.0),
+        "annual_volatility": float(port_vol * np.sqrt(TRADING_DAYS)),
+        "beta": float(w @ betas),
+        "max_drawdown": float(drawdowns[trough]),
+        "drawdown_peak": str(dates[peak].date()),
+        "drawdown_trough": str(dates[trough].date()),
+        "var": {
+            f"{int(level * 100)}": {
+                "historical": float(-np.quantile(rp, 1.0 - level)),
+                "parametric": float(z * port_vol - rp.mean()),
+            }
+            for level, z in Z_SCORES.items()
+        },
+        "diversification_ratio": float(w @ vol / port_vol) if port_vol > 0 else None,
+        "average_correlation": float(pair_corr.mean()) if n_kept > 1 else None,
+        "top_correlations": [
+            {"pair": [kept[rows[i]], kept[cols[i]]], "correlation": float(pair_corr[i])} for i in top
+        ],
+        "positions": [
+            {
+                "symbol": s,
+                "weight": float(w[i]),
+                "annual_volatility": float(vol[i] * np.sqrt(TRADING_DAYS)),
+                "beta": float(betas[i]),
+                "risk_contribution": float(contributions[i]),
+            }
+            for i, s in enumerate(kept)
+        ],
+        "symbols": kept,
+        "correlation": corr,
+    }
+
+
+def format_report(report: dict, max_positions: int = 15) -> str:
+    """Plain-text report for the MCP tool; largest risk contributors first."""
+    var95, var99 = report["var"]["95"], report["var"]["99"]
+    lines = [
+        f"Portfolio Risk ({report['holdings']} holdings vs {report['benchmark']}, "
+        f"{report['start']} to {report['end']}, {report['days']} trading days):",
+        f"- Annualized Return: {report['annual_return']:.1%}",
+        f"- Annualized Volatility: {report['annual_volatility']:.1%}",
+        f"- Beta vs {report['benchmark']}: {report['beta']:.2f}",
+        f"- Max Drawdown: {report['max_drawdown']:.1%} ({report['drawdown_peak']} to {report['drawdown_trough']})",
+        f"- 1-Day VaR 95%: {var95['historical']:.2%} historical, {var95['parametric']:.2%} parametric",
+        f"- 1-Day VaR 99%: {var99['historical']:.2%} historical, {var99['parametric']:.2%} parametric",
+    ]
+    if report["average_correlation"] is not None:
+        lines += [
+            f"- Average Pairwise Correlation: {report['average_correlation']:.2f}",
+            f"- Diversification Ratio: {report['diversification_ratio']:.2f}",
+            "",
+            "Most Correlated Pairs:",
+        ]
+        lines += [f"- {' / '.join(p['pair'])}: {p['correlation']:.2f}" for p in report["top_correlations"]]
+
+    positions = sorted(report["positions"], key=lambda p: p["risk_contribution"], reverse=True)
+    lines += ["", "Positions (by share of portfolio risk):"]
+    for p in positions[:max_positions]:
+        lines.append(
+            f"- {p['symbol']}: weight {p['weight']:.1%}, risk {p['risk_contribution']:.1%}, "
+            f"vol {p['annual_volatility']:.1%}, beta {p['beta']:.2f}"
+        )
+    if len(positions) > max_positions:
+        lines.append(f"- ... {len(positions) - max_positions} more")
+    if report["excluded"]:
+        lines += ["", f"Excluded (insufficient history): {', '.join(report['excluded'])}"]
+    return "\n".join(lines)
@@ -0,0 +1,202 @@
+"""
+Shared-memory exchange of OHLCV bars between processes.
+
+The process that owns the market-data cache (the MCP server) publishes bars
+into a ``multiprocessing.shared_memory`` segment laid out as a ``BAR_DTYPE``
+array and returns a small JSON handle: segment name, row count, timezone and
+an optional ``[start, stop)`` slice. Other processes (the API, batch jobs,
+backtest workers) attach the segment and read the rows in place, with no
+text serialization or parsing.
+
+Segments are republished only when the underlying bars change, kept for the
+``SHARED_BARS_MAX_SEGMENTS`` most recently used keys, and unlinked by the
+publisher on eviction or exit. A reader that attaches after an unlink gets
+``FileNotFoundError`` and should ask for a fresh handle. Unlinking while a
+reader is attached is safe; its mapping stays valid until closed.
+"""
+import atexit
+import itertools
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+import pandas as pd
+
+BAR_DTYPE = np.dtype([
+    ("ts", "<i8"),  # nanoseconds since the epoch, UTC
+    ("open", "<f8"),
+    ("high", "<f8"),
+    ("low", "<f8"),
+    ("close", "<f8"),
+    ("volume", "<i8"),
+    ("dividends", "<f8"),
+    ("splits", "<f8"),
+])
+COLUMNS = {
+    "open": "Open", "high": "High", "low": "Low", "close": "Close",
+    "volume": "Volume", "dividends": "Dividends", "splits": "Stock Splits",
+}
+FORMAT = "bars-v2"
+MAX_SEGMENTS = int(os.environ.get("SHARED_BARS_MAX_SEGMENTS", "256"))
+
+
+def to_records(df: pd.DataFrame) -> np.ndarray:
+    """Packs a yfinance-style OHLCV frame into a ``BAR_DTYPE`` array."""
+    rows = np.zeros(len(df), dtype=BAR_DTYPE)
+    index = df.index if df.index.tz is not None else df.index.tz_localize("UTC")
+    rows["ts"] = index.as_unit("ns").asi8
+    for field, column in COLUMNS.items():
+        if column in df:
+            values = df[column].to_numpy(dtype=np.float64)
+            # Volume is int64, as yfinance returns it; missing volumes become 0
+            rows[field] = np.nan_to_num(values).round() if field == "volume" else values
+    return rows
+
+
+def to_frame(rows: np.ndarray, tz: str = "UTC") -> pd.DataFrame:
+    """Unpacks ``BAR_DTYPE`` rows into a yfinance-style frame."""
+    # Copy out of the segment so the frame outlives the mapping
+    index = pd.DatetimeIndex(rows["ts"].copy()).tz_localize("UTC").tz_convert(tz)
+    df = pd.DataFrame({column: np.array(rows[field]) for field, column in COLUMNS.items()}, index=index, copy=False)
+    df.index.name = "Date"
+    return df
+
+
+def _fingerprint(rows: np.ndarray) -> tuple:
+    if not len(rows):
+        return (0,)
+    return (len(rows), int(rows["ts"][0]), int(rows["ts"][-1]), float(rows["close"][-1]), float(rows["volume"][-1]))
+
+
+class SegmentPublisher:
+    """Owns the segments this process published, keyed by what they contain."""
+
+    def __init__(self, max_segments: int = MAX_SEGMENTS):
+        self.max_segments = max_segments
+        self._segments = OrderedDict()  # key -> (SharedMemory, fingerprint, handle)
+        self._lock = threading.Lock()
+        self._names = itertools.count()
+        atexit.register(self.close)
+
+    def publish(self, key, df: pd.DataFrame, **meta) -> dict:
+        """Returns a handle to ``df``'s bars, copying them into shared memory only if changed."""
+        rows = to_records(df)
+        fingerprint = _fingerprint(rows)
+        with self._lock:
+            current = self._segments.get(key)
+            if current is not None and current[1] == fingerprint:
+                self._segments.move_to_end(key)
+                return dict(current[2])
+
+            # Short names: macOS limits POSIX shared memory names to 31 characters
+            name = f"sb{os.getpid()}_{next(self._names)}"
+            shm = shared_memory.SharedMemory(name=name, create=True, size=max(rows.nbytes, 1))
+            np.ndarray(rows.shape, dtype=BAR_DTYPE, buffer=shm.buf)[:] = rows
+            handle = {
+                "format": FORMAT,
+                "name": shm.name,
+                "rows": len(rows),
+                "start": 0,
+                "stop": len(rows),
+                "tz": str(df.index.tz or "UTC"),
+                **meta,
+            }
+            if current is not None:
+                self._release(current[0])
+            self._segments[key] = (shm, fingerprint, handle)
+            self._segments.move_to_end(key)
+            while len(self._segments) > self.max_segments:
+                _, (old, _, _) = self._segments.popitem(last=False)
+                self._release(old)
+            return dict(handle)
+
+    @staticmethod
+    def _release(shm):
+        try:
+            shm.close()
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Error releasing shared segment {shm.name}: {e}", file=sys.stderr)
+
+    def close(self):
+        with self._lock:
+            while self._segments:
+                _, (shm, _, _) = self._segments.popitem()
+                self._release(shm)
+
+
+def slice_handle(handle: dict, start=None, end=None) -> dict:
+    """Narrows a handle to bars with ``start <= ts < end`` (timestamps or date strings)."""
+    if start is None and end is None:
+        return handle
+    with open_bars(handle) as rows:
+        ts = rows["ts"]
+        lo = int(np.searchsorted(ts, _to_ns(start, handle["tz"]), "left")) if start is not None else 0
+        hi = int(np.searchsorted(ts, _to_ns(end, handle["tz"]), "left")) if end is not None else len(ts)
+    base = handle["start"]
+    return {**handle, "start": base + lo, "stop": base + max(lo, hi)}
+
+
+def _to_ns(value, tz: str) -> int:
+    ts = pd.Timestamp(value)
+    if ts.tz is None:
+        ts = ts.tz_localize(tz)
+    return ts.value
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    shm = shared_memory.SharedMemory(name=name)
+    if name.startswith(f"sb{os.getpid()}_"):
+        # Published by this process (in-process MCP): the registration is the
+        # publisher's own, needed for its unlink and for cleanup after a crash
+        return shm
+    # Before 3.13 attaching registers the segment with this process's resource
+    # tracker, which would unlink the publisher's segment when we exit
+    try:
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+    return shm
+
+
+@contextmanager
+def open_bars(handle: dict):
+    """Maps the handle's segment and yields a read-only ``BAR_DTYPE`` view of its slice.
+
+    The view is only valid inside the ``with`` block; copy anything kept longer.
+    """
+    if handle.get("format") != FORMAT:
+        raise ValueError(f"Unsupported bar handle format: {handle.get('format')}")
+    shm = _attach(handle["name"])
+    rows = None
+    try:
+        rows = np.ndarray((handle["rows"],), dtype=BAR_DTYPE, buffer=shm.buf)[handle["start"]:handle["stop"]]
+        rows.flags.writeable = False
+        yield rows
+    finally:
+        rows = None
+        try:
+            shm.close()
+        except BufferError:
+            # A view escaped the block; the mapping is released when it is collected
+            pass
+
+
+def read_frame(handle) -> pd.DataFrame:
+    """Reads a handle (dict or its JSON) into a DataFrame."""
+    if isinstance(handle, str):
+        handle = json.loads(handle)
+    with open_bars(handle) as rows:
+        return to_frame(rows, handle["tz"])
+
+
+publisher = SegmentPublisher()
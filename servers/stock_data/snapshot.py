@@ -0,0 +1,361 @@
+"""
+Pre-computed market snapshot: one fixed-width record per tracked symbol.
+
+A background ``SnapshotRefresher`` recomputes every tracked symbol from cached
+daily bars at intraday intervals while the US market is open and once more
+after the close. Records live in a NumPy structured array with a symbol -> row
+dict, so dashboard reads are O(1) lookups and screens are vectorized masks
+over whole columns. The table is written to ``SNAPSHOT_PATH`` after every
+refresh and loaded on startup, so a restart serves data immediately.
+
+Configuration (environment):
+    SNAPSHOT_PATH: Persisted table (default data/snapshot.npz).
+    SNAPSHOT_INTERVAL_SECONDS: Refresh period during market hours (default 300).
+    SNAPSHOT_SYMBOLS: Extra comma-separated symbols to track.
+"""
+import contextvars
+import datetime
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+from core import metrics, tracing
+from servers.stock_data import market_data, technicals
+
+SNAPSHOT_PATH = os.environ.get("SNAPSHOT_PATH", os.path.join("data", "snapshot.npz"))
+REFRESH_INTERVAL = float(os.environ.get("SNAPSHOT_INTERVAL_SECONDS", "300"))
+REFRESH_WORKERS = 8
+EXTRA_SYMBOLS = [s.strip().upper() for s in os.environ.get("SNAPSHOT_SYMBOLS", "").split(",") if s.strip()]
+
+MARKET_TZ = ZoneInfo("America/New_York")
+MARKET_OPEN = datetime.time(9, 30)
+# Daily bars settle a few minutes after the 16:00 close
+MARKET_SETTLED = datetime.time(16, 10)
+
+SNAPSHOT_DTYPE = np.dtype([
+    ("symbol", "U16"),
+    ("as_of", "datetime64[D]"),
+    ("updated", "float64"),  # epoch seconds
+    ("price", "float64"),
+    ("prev_close", "float64"),
+    ("change", "float64"),
+    ("percent", "float64"),
+    ("rsi", "float32"),
+    ("macd", "float32"),
+    ("macd_signal", "float32"),
+    ("macd_bullish", "bool"),
+    ("sma_20", "float64"),
+    ("sma_50", "float64"),
+    ("above_sma_20", "bool"),
+    ("above_sma_50", "bool"),
+    ("high_52w", "float64"),
+    ("low_52w", "float64"),
+    ("from_high_52w", "float32"),  # percent below the 52-week high
+    ("volume", "float64"),
+    ("volume_ratio_20", "float32"),  # volume / 20-day average volume
+])
+
+# Screen filters: query parameter -> (column, comparison)
+SCREEN_FILTERS = {
+    "rsi_below": ("rsi", np.less),
+    "rsi_above": ("rsi", np.greater),
+    "percent_below": ("percent", np.less),
+    "percent_above": ("percent", np.greater),
+    "volume_ratio_above": ("volume_ratio_20", np.greater),
+    "from_high_above": ("from_high_52w", np.greater),
+    "from_high_below": ("from_high_52w", np.less),
+    "above_sma_50": ("above_sma_50", np.equal),
+    "above_sma_20": ("above_sma_20", np.equal),
+    "macd_bullish": ("macd_bullish", np.equal),
+}
+
+SNAPSHOT_ROWS = metrics.gauge("market_snapshot_symbols", "Symbols in the market snapshot table")
+SNAPSHOT_AGE = metrics.gauge("market_snapshot_age_seconds", "Seconds since the last snapshot refresh")
+
+
+def build_record(symbol: str):
+    """Computes the snapshot record for ``symbol`` from a year of daily bars, or None."""
+    df = market_data.get_history(symbol, period="1y")
+    if len(df) < 2:
+        return None
+    technicals.add_indicators(df)
+    latest, close = df.iloc[-1], df["Close"]
+    price, prev = float(close.iloc[-1]), float(close.iloc[-2])
+    high, low = float(df["High"].max()), float(df["Low"].min())
+    avg_volume = float(df["Volume"].iloc[-21:-1].mean())
+
+    record = np.zeros((), dtype=SNAPSHOT_DTYPE)
+    record["symbol"] = symbol
+    record["as_of"] = np.datetime64(latest.name.date(), "D")
+    record["updated"] = time.time()
+    record["price"] = price
+    record["prev_close"] = prev
+    record["change"] = price - prev
+    record["percent"] = (price - prev) / prev * 100 if prev else np.nan
+    record["rsi"] = latest["rsi"]
+    record["macd"] = latest["macd"]
+    record["macd_signal"] = latest["macd_signal"]
+    record["macd_bullish"] = latest["macd_diff"] > 0
+    record["sma_20"] = latest["sma_20"]
+    record["sma_50"] = latest["sma_50"]
+    record["above_sma_20"] = price > latest["sma_20"]
+    record["above_sma_50"] = price > latest["sma_50"]
+    record["high_52w"] = high
+    record["low_52w"] = low
+    record["from_high_52w"] = (high - price) / high * 100 if high else np.nan
+    record["volume"] = latest["Volume"]
+    record["volume_ratio_20"] = latest["Volume"] / avg_volume if avg_volume else np.nan
+    return record
+
+
+class SnapshotTable:
+    """Structured-array table of snapshot records keyed by symbol.
+
+    Writers build a new array and swap it in, so readers never lock and always
+    see a consistent (rows, index) pair.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._state = (np.zeros(0, dtype=SNAPSHOT_DTYPE), {})
+        self._listeners = []
+        SNAPSHOT_ROWS.set_function(lambda: len(self._state[0]))
+        SNAPSHOT_AGE.set_function(self.age)
+        if path and os.path.exists(path):
+            self.load()
+
+    def __len__(self):
+        return len(self._state[0])
+
+    def __contains__(self, symbol: str):
+        return symbol.upper() in self._state[1]
+
+    def view(self):
+        """The current ``(rows, index)`` pair; treat both as read-only."""
+        return self._state
+
+    def add_listener(self, callback):
+        """Calls ``callback()`` after every upsert, on the writer's thread."""
+        self._listeners.append(callback)
+
+    def age(self) -> float:
+        rows = self._state[0]
+        return time.time() - float(rows["updated"].max()) if len(rows) else float("nan")
+
+    def get(self, symbol: str):
+        """The record for ``symbol`` as a dict, or None."""
+        rows, index = self._state
+        row = index.get(symbol.upper())
+        return None if row is None else _to_dict(rows[row])
+
+    def get_many(self, symbols) -> list:
+        rows, index = self._state
+        return [_to_dict(rows[index[s]]) for s in (s.upper() for s in symbols) if s in index]
+
+    def screen(self, sort: str = None, descending: bool = True, limit: int = 50, **filters) -> list:
+        """Records matching every filter in ``SCREEN_FILTERS`` (None values are ignored)."""
+        rows = self._state[0]
+        mask = np.ones(len(rows), dtype=bool)
+        for name, value in filters.items():
+            if value is None:
+                continue
+            column, compare = SCREEN_FILTERS[name]
+            mask &= compare(rows[column], value)
+        matched = rows[mask]
+        if sort:
+            if sort not in SNAPSHOT_DTYPE.names:
+                raise ValueError(f"Unknown sort column: {sort}")
+            order = np.argsort(matched[sort], kind="stable")
+            matched = matched[order[::-1] if descending else order]
+        return [_to_dict(r) for r in matched[:limit]]
+
+    def upsert(self, records):
+        """Inserts or replaces records (0-d arrays of SNAPSHOT_DTYPE)."""
+        if not records:
+            return
+        with self._lock:
+            rows, index = self._state
+            rows = rows.copy()
+            index = dict(index)
+            new = []
+            for record in records:
+                symbol = record["symbol"].item()
+                if symbol in index:
+                    rows[index[symbol]] = record
+                else:
+                    index[symbol] = len(rows) + len(new)
+                    new.append(record.reshape(1))
+            if new:
+                rows = np.concatenate([rows, *new])
+            self._state = (rows, index)
+        for callback in self._listeners:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Snapshot listener failed: {e}", file=sys.stderr)
+
+    def save(self):
+        if not self.path:
+            return
+        rows = self._state[0]
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp.npz"
+        np.savez(tmp, rows=rows)
+        os.replace(tmp, self.path)
+
+    def load(self):
+        try:
+            with np.load(self.path) as data:
+                rows = data["rows"]
+        except Exception as e:
+            print(f"Error loading market snapshot {self.path}: {e}", file=sys.stderr)
+            return
+        if rows.dtype != SNAPSHOT_DTYPE:
+            # Written by an older layout; rebuild on the next refresh
+            return
+        self._state = (rows, {str(s): i for i, s in enumerate(rows["symbol"])})
+
+
+def _to_dict(record) -> dict:
+    out = {}
+    for name in SNAPSHOT_DTYPE.names:
+        value = record[name].item()
+        if isinstance(value, float) and not np.isfinite(value):
+            value = None
+        elif name == "as_of":
+            value = str(value)
+        out[name] = value
+    return out
+
+
+def _market_phase(now: datetime.datetime):
+    """``(is_open, last_settled_close)`` for the US market at ``now`` (weekends only, no holidays)."""
+    local = now.astimezone(MARKET_TZ)
+    day = local.date()
+    is_weekday = local.weekday() < 5
+    is_open = is_weekday and MARKET_OPEN <= local.time() < MARKET_SETTLED
+    # Walk back to the most recent weekday close that has already settled
+    while day.weekday() >= 5 or (day == local.date() and local.time() < MARKET_SETTLED):
+        day -= datetime.timedelta(days=1)
+    return is_open, datetime.datetime.combine(day, MARKET_SETTLED, tzinfo=MARKET_TZ)
+
+
+class SnapshotRefresher:
+    """Background thread keeping ``table`` current for the tracked symbols."""
+
+    def __init__(self, table: SnapshotTable, symbols=(), interval: float = REFRESH_INTERVAL):
+        self.table = table
+        self.interval = interval
+        self._symbols = set()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        # Reused across refreshes rather than spinning up threads every few minutes
+        self._pool = ThreadPoolExecutor(max_workers=REFRESH_WORKERS, thread_name_prefix="snapshot")
+        self._last_full = 0.0
+        self.track(symbols)
+
+    def track(self, symbols):
+        """Adds symbols; ones not yet in the table are built on the next wake-up."""
+        symbols = {s.upper() for s in symbols}
+        with self._lock:
+            new = symbols - self._symbols
+            self._symbols |= new
+            self._pending |= {s for s in new if s not in self.table}
+        if self._pending:
+            self._wake.set()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="snapshot-refresher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 30):
+        """Stops the refresher after any refresh in progress and releases its workers."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def refresh(self, symbols=None) -> int:
+        """Rebuilds ``symbols`` (default: all tracked) and persists the table; returns rows updated."""
+        with self._lock:
+            symbols = sorted(self._symbols if symbols is None else symbols)
+
+        def build(symbol):
+            try:
+                return build_record(symbol)
+            except Exception as e:
+                print(f"Error building snapshot for {symbol}: {e}", file=sys.stderr)
+                return None
+
+        with tracing.span("snapshot.refresh", symbols=len(symbols)):
+            futures = [self._pool.submit(contextvars.copy_context().run, build, s) for s in symbols]
+            records = [r for r in (f.result() for f in futures) if r is not None]
+            self.table.upsert(records)
+            self.table.save()
+        return len(records)
+
+    def _due(self) -> bool:
+        now = datetime.datetime.now(datetime.timezone.utc)
+        is_open, settled = _market_phase(now)
+        if is_open:
+            return time.time() - self._last_full >= self.interval
+        # Closed: one refresh after the latest close has settled, then idle
+        return self._last_full < settled.timestamp()
+
+    def _run(self):
+        # A table loaded from disk counts as fresh as its newest row
+        if len(self.table):
+            self._last_full = time.time() - self.table.age()
+        while not self._stop.is_set():
+            with self._lock:
+                pending, self._pending = self._pending, set()
+            try:
+                if self._due():
+                    self.refresh()
+                    self._last_full = time.time()
+                elif pending:
+                    self.refresh(pending)
+            except Exception as e:
+                print(f"Snapshot refresh failed: {e}", file=sys.stderr)
+            self._wake.wait(min(self.interval, 60))
+            self._wake.clear()
+
+
+table = SnapshotTable(SNAPSHOT_PATH)
+refresher = None
+
+
+def start(symbols=()) -> SnapshotRefresher:
+    """Starts (once) the background refresher for ``symbols`` plus ``SNAPSHOT_SYMBOLS``."""
+    global refresher
+    if refresher is None:
+        refresher = SnapshotRefresher(table, [*symbols, *EXTRA_SYMBOLS]).start()
+    else:
+        refresher.track(symbols)
+    return refresher
+
+
+def stop(timeout: float = 30):
+    """Stops the background refresher, if started."""
+    global refresher
+    if refresher is not None:
+        refresher.stop(timeout)
+        refresher = None
+
+
+def track(symbols):
+    """Adds symbols to the running refresher, if any."""
+    if refresher is not None:
+        refresher.track(symbols)
@@ -0,0 +1,380 @@
+"""
+Symbol master: which tickers exist, what they are called and where they trade.
+
+The master is a CSV (symbol, name, exchange, type, country) loaded once into
+an in-memory ``SymbolIndex``:
+
+- a sorted ticker list for prefix lookup by bisection,
+- a sorted list of name words for name-prefix lookup,
+- a trigram -> row-ids inverted index for fuzzy name search,
+- an alias table (normalized company names) for finding tickers in free text.
+
+A bundled seed (``symbols_seed.csv``: market indexes, large caps and common
+ETFs) is always loaded. A full US listing can be added with
+
+    python -m servers.stock_data.symbols --fetch
+
+which writes ``SYMBOLS_PATH`` from the Nasdaq Trader symbol directory. Once
+that file exists the index is authoritative. That directory omits mutual
+funds and OTC names, so ``check`` does not reject exchange tickers it lacks
+outright. Instead it asks the caller's ``probe`` (an upstream lookup)
+and caches the answer, so unknown tickers are refused without a full fetch
+from then on. With only the seed, or without a probe, well-formed symbols
+are let through.
+
+Configuration (environment):
+    SYMBOLS_PATH: Full symbol master (default data/symbols.csv).
+    SYMBOL_PROBE_TTL_SECONDS: How long a probe that found a symbol is reused (default 86400).
+"""
+import argparse
+import bisect
+import csv
+import io
+import os
+import re
+import sys
+import threading
+import urllib.request
+from typing import NamedTuple
+
+import numpy as np
+
+from core.cache import TTLCache
+
+SYMBOLS_PATH = os.environ.get("SYMBOLS_PATH", os.path.join("data", "symbols.csv"))
+SEED_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "symbols_seed.csv")
+FIELDS = ("symbol", "name", "exchange", "type", "country")
+
+NASDAQ_LISTED_URL = "https://www.nasdaqtrader.com/dynamic/SymDir/nasdaqlisted.txt"
+OTHER_LISTED_URL = "https://www.nasdaqtrader.com/dynamic/SymDir/otherlisted.txt"
+OTHER_EXCHANGES = {"A": "NYSE AMERICAN", "N": "NYSE", "P": "NYSE ARCA", "Z": "CBOE BZX", "V": "IEX"}
+
+# Anything Yahoo could plausibly accept: indexes (^), futures (=F), FX (=X), crypto (-USD), foreign suffixes
+_VALID = re.compile(r"^\^?[A-Z0-9][A-Z0-9.\-=^&]{0,15}$")
+# Plain exchange tickers, the only kind an authoritative master can vouch for
+_EXCHANGE_TICKER = re.compile(r"^[A-Z]{1,5}(-[A-Z]{1,2})?$")
+
+# Explicit $TICKER (any length), or an all-caps word of 2-5 letters that is not a
+# common abbreviation; single-letter tickers (F, T) need the $
+_TICKER_IN_TEXT = re.compile(
+    r"\$([A-Za-z]{1,5}(?:[.-][A-Za-z]{1,2})?)\b|(?<![\w/$])([A-Z]{2,5}(?:[.-][A-Z]{1,2})?)(?![\w/])"
+)
+NOT_TICKERS = {
+    "I", "A", "AM", "PM", "US", "USA", "UK", "EU", "ETF", "ETFS", "CEO", "CFO", "IPO", "EPS", "PE", "AI", "OK",
+    "RSI", "MACD", "SMA", "EMA", "ATH", "YTD", "VS", "ETC", "FAQ", "GDP", "CPI", "FED", "SEC", "USD", "EUR",
+    "NEWS", "TLDR", "IMO", "PLS", "THE", "AND", "OR", "IS", "IT", "OF", "ON", "TO", "IN", "ME", "MY",
+}
+
+# Dropped from names before they become aliases ("Apple Inc." -> "apple")
+_NAME_SUFFIXES = re.compile(
+    r"\b(the|inc|incorporated|corp|corporation|co|company|ltd|limited|plc|p l c|llc|lp|sa|s a|nv|n v|ag|se|"
+    r"holdings?|group|class [a-z]|common stock|ordinary shares|american depositary shares|ads)\b"
+)
+# Company names that are also everyday words; never matched in free text
+COMMON_WORDS = {
+    "target", "block", "gap", "snap", "match", "ball", "best", "fast", "live", "well", "general", "american",
+    "first", "united", "global", "national", "international", "new", "energy", "health", "technology",
+    "financial", "select", "income", "growth", "value", "dividend", "total", "core",
+}
+MIN_ALIAS_CHARS = 4
+# Minimum share of a query's trigrams a name must contain to be a fuzzy match
+FUZZY_THRESHOLD = 0.4
+
+PROBE_TTL = float(os.environ.get("SYMBOL_PROBE_TTL_SECONDS", "86400"))
+# Symbols a probe did not find are re-checked sooner (new listings, upstream glitches)
+UNLISTED_TTL = 3600.0
+_probes = TTLCache("symbol_probe", max_entries=4096)
+
+
+class Symbol(NamedTuple):
+    symbol: str
+    name: str
+    exchange: str
+    type: str  # equity, etf or index
+    country: str
+
+
+class UnknownSymbol(ValueError):
+    """The symbol is malformed, or neither in an authoritative master nor found upstream."""
+
+
+def _normalize_text(text: str) -> str:
+    return re.sub(r"[^a-z0-9]+", " ", text.lower()).strip()
+
+
+def _trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _alias(name: str) -> str:
+    return re.sub(r"\s+", " ", _NAME_SUFFIXES.sub(" ", _normalize_text(name))).strip()
+
+
+class SymbolIndex:
+    def __init__(self, records, authoritative: bool = False):
+        # Later records replace earlier ones with the same symbol but keep their position
+        unique = {r.symbol: r for r in records}
+        self._order = {s: i for i, s in enumerate(unique)}
+        records = sorted(unique.values(), key=lambda r: r.symbol)
+        self.records = records
+        self.authoritative = authoritative
+        self.symbols = [r.symbol for r in records]
+        self._row = {s: i for i, s in enumerate(self.symbols)}
+
+        self._names = [_normalize_text(r.name) for r in records]
+        words = []
+        postings = {}
+        for i, name in enumerate(self._names):
+            for word in set(name.split()):
+                words.append((word, i))
+            for gram in _trigrams(name):
+                postings.setdefault(gram, []).append(i)
+        words.sort()
+        self._words = [w for w, _ in words]
+        self._word_rows = [i for _, i in words]
+        self._trigram_rows = {g: np.array(rows, dtype=np.int32) for g, rows in postings.items()}
+        self._aliases = self._build_aliases()
+
+    def _build_aliases(self) -> dict:
+        candidates = {}  # alias -> {full alias: first row}
+        for i, r in enumerate(self.records):
+            if r.type == "index":
+                continue
+            full = _alias(r.name)
+            if not full:
+                continue
+            forms = {full}
+            first = full.split()[0]
+            if len(first) >= MIN_ALIAS_CHARS:
+                forms.add(first)
+            for form in forms:
+                if len(form) >= MIN_ALIAS_CHARS and form not in COMMON_WORDS:
+                    candidates.setdefault(form, {}).setdefault(full, i)
+        # An alias shared by different companies is ambiguous; share classes of one company are not
+        return {form: min(rows.values()) for form, rows in candidates.items() if len(rows) == 1}
+
+    def __len__(self):
+        return len(self.records)
+
+    def __contains__(self, symbol: str):
+        return symbol in self._row
+
+    def get(self, symbol: str):
+        row = self._row.get(symbol)
+        return None if row is None else self.records[row]
+
+    def resolve(self, symbol: str) -> str:
+        """The master's spelling of ``symbol`` (``BRK.B`` -> ``BRK-B``), or the symbol uppercased."""
+        symbol = symbol.strip().lstrip("$").upper()
+        if symbol not in self._row and "." in symbol and symbol.replace(".", "-") in self._row:
+            return symbol.replace(".", "-")
+        return symbol
+
+    def indexes(self) -> dict:
+        """Market index symbols by country, in master order."""
+        by_country = {}
+        for r in sorted(self.records, key=lambda r: self._order[r.symbol]):
+            if r.type == "index" and r.country:
+                by_country.setdefault(r.country, []).append(r.symbol)
+        return by_country
+
+    def search(self, query: str, limit: int = 10, kind: str = None) -> list:
+        """Best matches for ``query`` by ticker prefix, name prefix and fuzzy name similarity."""
+        text = _normalize_text(query)
+        if not text:
+            return []
+        ticker = self.resolve(query)
+        scores = {}
+
+        def score(row, value):
+            if kind and self.records[row].type != kind:
+                return
+            if value > scores.get(row, 0.0):
+                scores[row] = value
+
+        # Ticker: exact, then shortest prefix matches first
+        start = bisect.bisect_left(self.symbols, ticker)
+        for row in range(start, min(start + 4 * limit, len(self.symbols))):
+            if not self.symbols[row].startswith(ticker):
+                break
+            score(row, 100.0 if self.symbols[row] == ticker else 60.0 - len(self.symbols[row]))
+        # Name: the query's last word as a prefix of any word of the name, the rest as whole words
+        *complete, partial = text.split()
+        start = bisect.bisect_left(self._words, partial)
+        for pos in range(start, min(start + 50 * limit, len(self._words))):
+            if not self._words[pos].startswith(partial):
+                break
+            row = self._word_rows[pos]
+            name = self._names[row]
+            if all(w in name.split() for w in complete):
+                score(row, (45.0 if name.startswith(text) else 35.0) - len(name) / 100)
+        # Fuzzy: trigram overlap, for typos and out-of-order words
+        if len(scores) < limit:
+            grams = _trigrams(text)
+            postings = [self._trigram_rows[g] for g in grams if g in self._trigram_rows]
+            if postings:
+                hits = np.bincount(np.concatenate(postings), minlength=len(self.records))
+                for row in np.argsort(hits)[::-1][: 4 * limit]:
+                    # Share of the query's trigrams found in the name
+                    similarity = int(hits[row]) / len(grams)
+                    if similarity < FUZZY_THRESHOLD:
+                        break
+                    score(int(row), 30.0 * similarity - len(self._names[row]) / 100)
+
+        ranked = sorted(scores, key=lambda row: (-scores[row], self.symbols[row]))[:limit]
+        return [self.records[row]._asdict() for row in ranked]
+
+    def extract(self, text: str) -> tuple:
+        """Tickers mentioned in ``text`` (as $TICKER, TICKER or a company name), in order of appearance."""
+        found = []  # (position, symbol)
+        for match in _TICKER_IN_TEXT.finditer(text):
+            dollar, bare = match.groups()
+            symbol = self.resolve(dollar or bare)
+            if bare and symbol in NOT_TICKERS:
+                continue
+            if symbol in self._row or (not self.authoritative and (dollar or _EXCHANGE_TICKER.match(symbol))):
+                found.append((match.start(), symbol))
+        words = [(m.start(), m.group()) for m in re.finditer(r"[a-z0-9]+", text.lower())]
+        i = 0
+        while i < len(words):
+            # Longest company name starting at this word (up to 4 words)
+            for n in range(min(4, len(words) - i), 0, -1):
+                phrase = " ".join(w for _, w in words[i:i + n])
+                row = self._aliases.get(phrase)
+                if row is not None:
+                    found.append((words[i][0], self.symbols[row]))
+                    i += n - 1
+                    break
+            i += 1
+        ordered = []
+        for _, symbol in sorted(found):
+            if symbol not in ordered:
+                ordered.append(symbol)
+        return tuple(ordered)
+
+
+def _read_csv(path: str) -> list:
+    with open(path, newline="") as f:
+        return [Symbol(**{k: (row.get(k) or "").strip() for k in FIELDS}) for row in csv.DictReader(f)]
+
+
+def load(path: str = None) -> SymbolIndex:
+    """The seed plus, if present, the full master at ``path`` (default ``SYMBOLS_PATH``)."""
+    path = path or SYMBOLS_PATH
+    seed = _read_csv(SEED_PATH)
+    records, authoritative = list(seed), False
+    if os.path.exists(path):
+        try:
+            # Seed rows win: they carry index countries and curated names
+            records = _read_csv(path) + seed
+            authoritative = True
+        except Exception as e:
+            print(f"Error loading symbol master {path}: {e}", file=sys.stderr)
+    return SymbolIndex(records, authoritative)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def index() -> SymbolIndex:
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = load()
+    return _index
+
+
+def check(symbol: str, probe=None) -> str:
+    """Normalizes ``symbol`` for upstream calls and cache keys; raises UnknownSymbol if it cannot exist.
+
+    Exchange tickers missing from an authoritative master are looked up with
+    ``probe(symbol) -> bool``, whose answer is cached; without a probe they are
+    let through.
+    """
+    idx = index()
+    resolved = idx.resolve(symbol)
+    if not _VALID.match(resolved):
+        raise UnknownSymbol(f"Invalid symbol: {symbol}")
+    if probe is not None and idx.authoritative and _EXCHANGE_TICKER.match(resolved) and resolved not in idx:
+        try:
+            listed = _probes.get_or_load(
+                resolved, lambda: bool(probe(resolved)), lambda listed: PROBE_TTL if listed else UNLISTED_TTL
+            )
+        except Exception:
+            # Upstream unavailable: let the real call decide
+            listed = True
+        if not listed:
+            raise UnknownSymbol(f"Unknown symbol: {symbol}")
+    return resolved
+
+
+def extract(text: str) -> tuple:
+    return index().extract(text)
+
+
+def search(query: str, limit: int = 10, kind: str = None) -> list:
+    return index().search(query, limit, kind)
+
+
+def indexes() -> dict:
+    return index().indexes()
+
+
+def _download(url: str) -> list:
+    with urllib.request.urlopen(url, timeout=30) as response:
+        text = response.read().decode("utf-8", errors="replace")
+    rows = list(csv.DictReader(io.StringIO(text), delimiter="|"))
+    # The last line is "File Creation Time: ..."
+    return [r for r in rows if not (r.get(next(iter(r))) or "").startswith("File Creation Time")]
+
+
+def fetch(path: str = None) -> int:
+    """Writes the US listings from the Nasdaq Trader symbol directory to ``path``; returns the row count."""
+    path = path or SYMBOLS_PATH
+    records = []
+    for row in _download(NASDAQ_LISTED_URL):
+        if row.get("Test Issue") == "Y":
+            continue
+        records.append((row["Symbol"], row["Security Name"], "NASDAQ", row.get("ETF")))
+    for row in _download(OTHER_LISTED_URL):
+        if row.get("Test Issue") == "Y":
+            continue
+        exchange = OTHER_EXCHANGES.get(row.get("Exchange"), row.get("Exchange") or "")
+        records.append((row["ACT Symbol"], row["Security Name"], exchange, row.get("ETF")))
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    written = 0
+    with open(tmp, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(FIELDS)
+        for symbol, name, exchange, etf in records:
+            # Yahoo spells share classes with a dash (BRK-B); skip preferreds and other odd lots
+            symbol = symbol.strip().replace(".", "-")
+            if not _EXCHANGE_TICKER.match(symbol):
+                continue
+            name = name.split(" - ")[0].strip()
+            writer.writerow((symbol, name, exchange, "etf" if etf == "Y" else "equity", "US"))
+            written += 1
+    os.replace(tmp, path)
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Symbol master tools.")
+    parser.add_argument("--fetch", action="store_true", help="Download US listings into SYMBOLS_PATH")
+    parser.add_argument("--search", metavar="QUERY", help="Search the master")
+    parser.add_argument("--path", default=SYMBOLS_PATH)
+    args = parser.parse_args(argv)
+    if args.fetch:
+        print(f"Wrote {fetch(args.path)} symbols to {args.path}")
+    if args.search:
+        for record in load(args.path).search(args.search):
+            print(f"{record['symbol']:<8} {record['type']:<7} {record['exchange']:<14} {record['name']}")
+
+
+if __name__ == "__main__":
+    main()
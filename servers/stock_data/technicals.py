@@ -0,0 +1,78 @@
+"""
+Technical indicators and price-range predictions shared by the MCP tools and
+the backtester.
+
+Everything here operates on whole columns, so the same formulas produce the
+latest-bar values for ``get_technical_summary`` and a value for every bar when
+replayed over years of history.
+"""
+import numpy as np
+import pandas as pd
+import ta
+
+# Trading bars per prediction horizon
+HORIZONS = {"week": 5, "month": 20, "year": 252}
+
+# History fetched per bar interval so SMA50 and MACD are defined on the last bar
+HISTORY_PERIODS = {
+    "1m": "5d", "2m": "5d", "5m": "1mo", "15m": "1mo", "30m": "1mo", "90m": "1mo",
+    "1h": "3mo", "1d": "6mo", "1wk": "2y", "1mo": "5y", "3mo": "max",
+}
+
+
+def add_indicators(df: pd.DataFrame) -> pd.DataFrame:
+    """Adds RSI, MACD, Bollinger Band and SMA columns to ``df`` in place."""
+    close = df["Close"]
+    # don't use ta.utils.dropna as it removes all rows
+    df["rsi"] = ta.momentum.RSIIndicator(close=close, window=14).rsi()
+
+    macd_indicator = ta.trend.MACD(close=close)
+    df["macd"] = macd_indicator.macd()
+    df["macd_signal"] = macd_indicator.macd_signal()
+    df["macd_diff"] = macd_indicator.macd_diff()
+
+    bb_indicator = ta.volatility.BollingerBands(close=close, window=20, window_dev=2)
+    df["bb_high"] = bb_indicator.bollinger_hband()
+    df["bb_low"] = bb_indicator.bollinger_lband()
+
+    df["sma_20"] = ta.trend.SMAIndicator(close=close, window=20).sma_indicator()
+    df["sma_50"] = ta.trend.SMAIndicator(close=close, window=50).sma_indicator()
+    return df
+
+
+def predict_ranges(df: pd.DataFrame, vol_window: int = None) -> pd.DataFrame:
+    """Computes the 1-week/1-month/1-year target ranges for every bar.
+
+    Requires the columns from ``add_indicators``. Return volatility is the
+    standard deviation of daily returns over the trailing ``vol_window`` bars;
+    by default the whole frame, matching a single call on a 6-month history.
+    """
+    close = df["Close"]
+    returns = close.pct_change()
+    if vol_window is None:
+        vol_window = len(df)
+    daily_vol = returns.rolling(vol_window, min_periods=2).std()
+
+    # Weekly: Bollinger width with a short MACD trend factor
+    weekly_volatility = (df["bb_high"] - df["bb_low"]) / close
+    weekly_trend = 1 + (df["macd_diff"] / close * 0.1)
+    # Monthly: 20-day scaled return volatility with a stronger MACD factor
+    monthly_volatility = daily_vol * np.sqrt(20)
+    monthly_trend = 1 + (df["macd_diff"] / close * 0.3)
+    # Yearly: 252-day scaled volatility with the SMA20/SMA50 trend
+    yearly_volatility = daily_vol * np.sqrt(252)
+    sma_trend = 1 + ((df["sma_20"] - df["sma_50"]) / close * 0.5)
+
+    return pd.DataFrame({
+        "week_low": close * (1 - weekly_volatility * 0.3) * weekly_trend,
+        "week_high": close * (1 + weekly_volatility * 0.3) * weekly_trend,
+        "month_low": close * (1 - monthly_volatility) * monthly_trend,
+        "month_high": close * (1 + monthly_volatility) * monthly_trend,
+        "year_low": close * (1 - yearly_volatility * 0.8) * sma_trend,
+        "year_high": close * (1 + yearly_volatility * 0.8) * sma_trend,
+    }, index=df.index)
+
+
+def support_resistance(df: pd.DataFrame, window: int = 20):
+    recent_prices = df["Close"].tail(window)
+    return recent_prices.min(), recent_prices.max()